@@ -5,6 +5,8 @@ const StreamingChat = () => {
     const [currentMessage, setCurrentMessage] = useState('');
     const [isStreaming, setIsStreaming] = useState(false);
     const [input, setInput] = useState('');
+    // One random id per conversation; the server keeps history per id, so it must not be shared
+    const [sessionId] = useState(() => crypto.randomUUID());
     const messagesEndRef = useRef(null);
 
     const sendStreamingMessage = async (message) => {
@@ -25,7 +27,7 @@ const StreamingChat = () => {
                 },
                 body: JSON.stringify({
                     message: message,
-                    session_id: 'session-123'
+                    session_id: sessionId
                 })
             });
 
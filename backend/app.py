@@ -0,0 +1,192 @@
+"""The Plan Shopper API: auth, chat, health and metrics endpoints in one FastAPI app.
+
+``create_app`` builds the app together with the state that is read-only
+once built and can be shared by forked workers: the chat service with its
+intent model, prompt templates and memory-mapped local index. The lifespan
+then opens what every worker needs for itself (telemetry exporter, MySQL
+pool, KDF executor, HTTP client, plan data snapshot, sweepers), warms the
+index and upstream connections, and only then reports ready on
+/health/ready. Startup phase durations are logged and exported as metrics.
+
+    gunicorn -c gunicorn.conf.py 'app:create_app()'   # app preloaded in the master, then forked
+    uvicorn --factory app:create_app --workers 4
+    python app.py
+"""
+import time
+
+_IMPORT_STARTED = time.perf_counter()
+
+import asyncio  # noqa: E402
+import logging  # noqa: E402
+import os  # noqa: E402
+from contextlib import AsyncExitStack, asynccontextmanager, contextmanager  # noqa: E402
+from typing import Any, Dict, Iterator, List, Optional  # noqa: E402
+
+from dotenv import load_dotenv  # noqa: E402
+from fastapi import FastAPI  # noqa: E402
+from fastapi.middleware.cors import CORSMiddleware  # noqa: E402
+
+load_dotenv()
+
+import fastapi_backend  # noqa: E402
+from planshopper_bot.routes import chat_router  # noqa: E402
+from planshopper_bot.services.azure_rag_service import get_rag_service, init_rag_service  # noqa: E402
+from planshopper_bot.services.http_client import close_http_client, start_http_client  # noqa: E402
+from planshopper_bot.services.telemetry import TelemetryMiddleware, get_telemetry  # noqa: E402
+
+IMPORT_SECONDS = time.perf_counter() - _IMPORT_STARTED
+
+logger = logging.getLogger(__name__)
+
+
+def process_age() -> Optional[float]:
+    """Seconds since this process started (for a forked worker, since the fork); None without /proc."""
+    try:
+        with open("/proc/self/stat") as f:
+            # The command name may contain spaces, so fields are counted after its closing parenthesis
+            started_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+    except (OSError, ValueError, IndexError):
+        return None
+    return max(0.0, uptime - started_ticks / os.sysconf("SC_CLK_TCK"))
+
+
+class StartupProfile:
+    """How long each startup phase took, and how long the process took to become ready."""
+
+    def __init__(self):
+        self.phases: Dict[str, float] = {}
+        self.ready_seconds: Optional[float] = None
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = time.perf_counter() - started
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "phases_ms": {name: round(seconds * 1000, 1) for name, seconds in self.phases.items()},
+            "ready_seconds": round(self.ready_seconds, 3) if self.ready_seconds is not None else None,
+        }
+
+
+async def _start_database(profile: StartupProfile) -> None:
+    with profile.phase("db_pool"):
+        await fastapi_backend.db_pool.start()
+    # The first plan data snapshot needs the pool; a failed load only logs a warning and chat
+    # falls back to retrieval until a refresh succeeds
+    if fastapi_backend.plan_data_store is not None:
+        with profile.phase("plan_data"):
+            await fastapi_backend.plan_data_store.refresh()
+
+
+async def _start_upstream(profile: StartupProfile) -> None:
+    with profile.phase("http_client"):
+        await start_http_client()
+    with profile.phase("warm"):
+        await get_rag_service().warm()
+
+
+async def _stop_tasks(tasks: List["asyncio.Task[None]"]) -> None:
+    for task in tasks:
+        task.cancel()
+    # Wait for them to unwind, so none is still touching the pool or client closed after this
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    profile: StartupProfile = app.state.startup
+    telemetry = get_telemetry()
+    started = time.perf_counter()
+    async with AsyncExitStack() as stack:
+        telemetry.start()
+        stack.callback(telemetry.close)
+        # Closing an unstarted pool, hasher or client is a no-op, so all are registered before starting
+        stack.push_async_callback(fastapi_backend.db_pool.close)
+        stack.callback(fastapi_backend.password_hasher.close)
+        stack.push_async_callback(close_http_client)
+
+        with profile.phase("password_hasher"):
+            fastapi_backend.password_hasher.start()
+        # MySQL and Azure are independent round trips, so they warm up concurrently
+        await asyncio.gather(_start_database(profile), _start_upstream(profile))
+
+        tasks = [asyncio.create_task(fastapi_backend.sweep_auth_state()),
+                 asyncio.create_task(chat_router.sweep_sessions())]
+        if fastapi_backend.plan_data_store is not None:
+            tasks.append(asyncio.create_task(fastapi_backend.refresh_plan_data()))
+        stack.push_async_callback(_stop_tasks, tasks)
+
+        profile.phases["lifespan"] = time.perf_counter() - started
+        age = process_age()
+        profile.ready_seconds = age if age is not None else sum(profile.phases.values())
+        logger.info("Ready in %.2fs (%s)", profile.ready_seconds,
+                    ", ".join(f"{name} {seconds * 1000:.0f}ms" for name, seconds in profile.phases.items()))
+        app.state.ready = True
+        try:
+            yield
+        finally:
+            # Fail readiness first so the load balancer stops routing here while requests drain
+            app.state.ready = False
+
+
+def create_app() -> FastAPI:
+    profile = StartupProfile()
+    profile.phases["import"] = IMPORT_SECONDS
+    app = FastAPI(
+        title="Plan Shopper GenAI API",
+        description="RAG-powered chatbot for health insurance plan comparison",
+        version="1.0.0",
+        lifespan=lifespan,
+    )
+    app.state.startup = profile
+    app.state.ready = False
+
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=os.getenv("CORS_ORIGINS", "*").split(","),
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+    # Outermost, so request durations include CORS handling and error responses
+    app.add_middleware(TelemetryMiddleware)
+
+    app.include_router(fastapi_backend.router)
+    app.include_router(chat_router.router)
+
+    @app.get("/")
+    async def root():
+        return {"message": "Plan Shopper GenAI API is running"}
+
+    # Built here rather than per worker: missing Azure config fails before any worker starts,
+    # and a preloaded master shares this read-only state with its workers
+    with profile.phase("chat_service"):
+        rag_service = init_rag_service()
+    chat_router.register_admission_gauges(rag_service)
+    with profile.phase("dummy_hash"):
+        fastapi_backend.password_hasher.prepare()
+
+    registry = get_telemetry().registry
+    registry.gauge("planshopper_startup_phase_seconds", "Duration of each startup phase",
+                   lambda: {(name,): seconds for name, seconds in profile.phases.items()}, ("phase",))
+    registry.gauge("planshopper_startup_ready_seconds", "Seconds from process start until ready for traffic",
+                   lambda: profile.ready_seconds)
+    return app
+
+
+def main() -> None:
+    import uvicorn
+    logging.basicConfig(level=logging.INFO)
+    port = int(os.getenv("PORT", 8000))
+    print(f"Plan Shopper API starting on http://localhost:{port}")
+    uvicorn.run("app:create_app", factory=True, host="0.0.0.0", port=port)
+
+
+if __name__ == "__main__":
+    main()
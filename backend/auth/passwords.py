@@ -0,0 +1,180 @@
+import asyncio
+import base64
+import hashlib
+import hmac
+import os
+import re
+import secrets
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+_LEGACY_SHA256 = re.compile(r"^[0-9a-f]{64}$")
+
+
+class PasswordHasherBusy(Exception):
+    """Raised when the hashing pool queue is full; callers should answer 429."""
+
+
+@dataclass(frozen=True)
+class KDFConfig:
+    algorithm: str = "scrypt"
+    scrypt_n: int = 2 ** 14
+    scrypt_r: int = 8
+    scrypt_p: int = 1
+    pbkdf2_iterations: int = 600000
+    salt_bytes: int = 16
+    workers: int = os.cpu_count() or 2
+    max_queue: int = 64
+
+    @classmethod
+    def from_env(cls) -> "KDFConfig":
+        return cls(
+            algorithm=os.getenv("PASSWORD_KDF", cls.algorithm),
+            scrypt_n=int(os.getenv("PASSWORD_SCRYPT_N", cls.scrypt_n)),
+            scrypt_r=int(os.getenv("PASSWORD_SCRYPT_R", cls.scrypt_r)),
+            scrypt_p=int(os.getenv("PASSWORD_SCRYPT_P", cls.scrypt_p)),
+            pbkdf2_iterations=int(os.getenv("PASSWORD_PBKDF2_ITERATIONS", cls.pbkdf2_iterations)),
+            workers=int(os.getenv("PASSWORD_POOL_WORKERS", cls.workers)),
+            max_queue=int(os.getenv("PASSWORD_POOL_MAX_QUEUE", cls.max_queue)),
+        )
+
+
+def _b64(data: bytes) -> str:
+    return base64.b64encode(data).decode().rstrip("=")
+
+
+def _unb64(data: str) -> bytes:
+    return base64.b64decode(data + "=" * (-len(data) % 4))
+
+
+def _scrypt(password: str, salt: bytes, n: int, r: int, p: int) -> bytes:
+    # maxmem must cover the 128 * n * r bytes scrypt allocates
+    return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p, maxmem=256 * n * r + 1024 * 1024, dklen=32)
+
+
+def _pbkdf2(password: str, salt: bytes, iterations: int) -> bytes:
+    return hashlib.pbkdf2_hmac("sha256", password.encode(), salt, iterations)
+
+
+def hash_password(password: str, config: Optional[KDFConfig] = None) -> str:
+    """Hash with the configured KDF into a self-describing ``algorithm$params$salt$hash`` string."""
+    config = config or KDFConfig.from_env()
+    salt = secrets.token_bytes(config.salt_bytes)
+    if config.algorithm == "pbkdf2_sha256":
+        digest = _pbkdf2(password, salt, config.pbkdf2_iterations)
+        return f"pbkdf2_sha256${config.pbkdf2_iterations}${_b64(salt)}${_b64(digest)}"
+    if config.algorithm == "scrypt":
+        digest = _scrypt(password, salt, config.scrypt_n, config.scrypt_r, config.scrypt_p)
+        return f"scrypt${config.scrypt_n}${config.scrypt_r}${config.scrypt_p}${_b64(salt)}${_b64(digest)}"
+    raise ValueError(f"Unsupported PASSWORD_KDF: {config.algorithm}")
+
+
+def verify_password(password: str, hashed: str) -> bool:
+    """Check a password against a KDF hash or a legacy unsalted SHA-256 hex digest."""
+    if _LEGACY_SHA256.match(hashed):
+        candidate = hashlib.sha256(password.encode()).hexdigest()
+        return hmac.compare_digest(candidate, hashed)
+
+    parts = hashed.split("$")
+    try:
+        if parts[0] == "scrypt" and len(parts) == 6:
+            n, r, p = int(parts[1]), int(parts[2]), int(parts[3])
+            expected = _unb64(parts[5])
+            return hmac.compare_digest(_scrypt(password, _unb64(parts[4]), n, r, p), expected)
+        if parts[0] == "pbkdf2_sha256" and len(parts) == 4:
+            expected = _unb64(parts[3])
+            return hmac.compare_digest(_pbkdf2(password, _unb64(parts[2]), int(parts[1])), expected)
+    except (ValueError, TypeError):
+        return False
+    return False
+
+
+def needs_rehash(hashed: str, config: Optional[KDFConfig] = None) -> bool:
+    """True for legacy SHA-256 hashes and for KDF hashes made with other cost settings."""
+    config = config or KDFConfig.from_env()
+    parts = hashed.split("$")
+    if config.algorithm == "scrypt":
+        return parts[:4] != ["scrypt", str(config.scrypt_n), str(config.scrypt_r), str(config.scrypt_p)]
+    if config.algorithm == "pbkdf2_sha256":
+        return parts[:2] != ["pbkdf2_sha256", str(config.pbkdf2_iterations)]
+    return True
+
+
+class PasswordHasher:
+    """Runs KDF work on a dedicated, bounded thread pool.
+
+    hashlib's scrypt and pbkdf2_hmac release the GIL, so a thread pool sized
+    to the core count hashes in parallel without the pickling cost of a
+    process pool, and keeps the KDF off both the event loop and AnyIO's
+    shared worker threads. At most ``workers + max_queue`` jobs may be
+    pending; beyond that ``PasswordHasherBusy`` is raised immediately so
+    a login burst is shed with 429s instead of queueing without bound.
+    """
+
+    def __init__(self, config: Optional[KDFConfig] = None):
+        self.config = config or KDFConfig.from_env()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        # Verified against when the member does not exist, so unknown ids cost the same as wrong passwords
+        self.dummy_hash = ""
+        self._pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self.rehashed = 0
+
+    def prepare(self) -> None:
+        """Compute the dummy hash; safe before forking, so preloaded workers share it."""
+        if not self.dummy_hash:
+            self.dummy_hash = hash_password(secrets.token_urlsafe(16), self.config)
+
+    def start(self) -> None:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.config.workers, thread_name_prefix="password-kdf")
+        self.prepare()
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    async def _submit(self, fn, *args: Any) -> Any:
+        if self._executor is None:
+            raise RuntimeError("Password hasher is not started")
+        if self._pending >= self.config.workers + self.config.max_queue:
+            self.rejected += 1
+            raise PasswordHasherBusy("Password hashing queue is full")
+        self._pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, fn, *args)
+        finally:
+            self._pending -= 1
+            self.completed += 1
+
+    def _verify_sync(self, password: str, hashed: str) -> bool:
+        valid = verify_password(password, hashed)
+        if _LEGACY_SHA256.match(hashed) and self.dummy_hash:
+            # A legacy SHA-256 hash checks in microseconds; until it is rehashed, pay for a KDF
+            # as well, so the response time does not tell existing member ids from unknown ones
+            verify_password(password, self.dummy_hash)
+        return valid
+
+    async def verify(self, password: str, hashed: str) -> bool:
+        return await self._submit(self._verify_sync, password, hashed)
+
+    async def hash(self, password: str) -> str:
+        return await self._submit(hash_password, password, self.config)
+
+    def needs_rehash(self, hashed: str) -> bool:
+        return needs_rehash(hashed, self.config)
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "algorithm": self.config.algorithm,
+            "workers": self.config.workers,
+            "max_queue": self.config.max_queue,
+            "pending": self._pending,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "rehashed": self.rehashed,
+        }
@@ -0,0 +1,60 @@
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+
+class ProfileCache:
+    """Read-through cache of ``people`` profile rows keyed by member id.
+
+    Only the projected profile columns are stored, never ``password_hash``.
+    Entries live for ``ttl_seconds`` and the least recently used one is
+    dropped once ``max_size`` is reached. The app never writes a member's
+    role or name (those are edited in MySQL directly), so such a change
+    shows up once the entry expires; login always stores the row it just
+    read. Keep ``ttl_seconds`` short next to the access token lifetime,
+    which carries the role as well.
+    """
+
+    def __init__(self, ttl_seconds: Optional[float] = None, max_size: Optional[int] = None):
+        self.ttl_seconds = float(os.getenv("PROFILE_CACHE_TTL_SECONDS", 300)) if ttl_seconds is None else ttl_seconds
+        self.max_size = int(os.getenv("PROFILE_CACHE_MAX_SIZE", 50000)) if max_size is None else max_size
+        self._entries: "OrderedDict[str, Tuple[Dict[str, Any], float]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, member_id: str) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(member_id)
+        if entry is None or entry[1] <= time.monotonic():
+            if entry is not None:
+                del self._entries[member_id]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(member_id)
+        self.hits += 1
+        return entry[0]
+
+    def put(self, member_id: str, profile: Dict[str, Any]) -> None:
+        if self.max_size <= 0:
+            return
+        self._entries[member_id] = (profile, time.monotonic() + self.ttl_seconds)
+        self._entries.move_to_end(member_id)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def metrics(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_size": self.max_size,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
@@ -0,0 +1,120 @@
+import hashlib
+import os
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Optional
+
+
+class RateLimitBackend(ABC):
+    """Storage for rate-limit state.
+
+    ``acquire`` charges ``cost`` against ``key`` and returns 0 when the
+    request is allowed, otherwise the number of seconds until it would be.
+    The in-memory backend is per process; for multi-worker deployments a
+    shared backend (e.g. a Redis script implementing the same GCRA update)
+    can be passed to ``RateLimiter`` instead.
+    """
+
+    @abstractmethod
+    async def acquire(self, key: str, rate: float, burst: int, cost: float = 1.0) -> float:
+        ...
+
+    def sweep(self) -> int:
+        return 0
+
+    def metrics(self) -> Dict[str, Any]:
+        return {}
+
+
+class InMemoryRateLimitBackend(RateLimitBackend):
+    """Token buckets stored as a single float per key (GCRA).
+
+    A token bucket of ``burst`` tokens refilled at ``rate`` per second is
+    equivalent to tracking one "theoretical arrival time" per key: the time
+    at which the bucket would be full again. Keys are stored as 64-bit
+    digests, so per-key state is one int and one float whatever the key
+    length. A key whose bucket has refilled carries no information and is
+    dropped by ``sweep``; if ``max_keys`` is still exceeded, the oldest keys
+    are dropped, which only ever errs towards allowing a request.
+    """
+
+    def __init__(self, max_keys: int = 1_000_000):
+        self.max_keys = max_keys
+        self._tat: Dict[int, float] = {}
+        self.allowed = 0
+        self.rejected = 0
+        self.swept = 0
+
+    @staticmethod
+    def _digest(key: str) -> int:
+        return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "little")
+
+    async def acquire(self, key: str, rate: float, burst: int, cost: float = 1.0) -> float:
+        now = time.monotonic()
+        digest = self._digest(key)
+        interval = 1.0 / rate
+        tolerance = interval * burst
+
+        tat = max(self._tat.get(digest, now), now)
+        new_tat = tat + interval * cost
+        if new_tat - now > tolerance:
+            self.rejected += 1
+            return new_tat - tolerance - now
+
+        self._tat[digest] = new_tat
+        self.allowed += 1
+        if len(self._tat) > self.max_keys:
+            self._shrink()
+        return 0.0
+
+    def sweep(self) -> int:
+        now = time.monotonic()
+        full = [digest for digest, tat in self._tat.items() if tat <= now]
+        for digest in full:
+            del self._tat[digest]
+        self.swept += len(full)
+        return len(full)
+
+    def _shrink(self) -> None:
+        if self.sweep() and len(self._tat) <= self.max_keys:
+            return
+        # Dicts keep insertion order, so the first keys are the least recently started buckets
+        excess = len(self._tat) - int(self.max_keys * 0.9)
+        for digest in list(self._tat.keys())[:excess]:
+            del self._tat[digest]
+        self.swept += excess
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "backend": "memory",
+            "keys": len(self._tat),
+            "max_keys": self.max_keys,
+            "allowed": self.allowed,
+            "rejected": self.rejected,
+            "swept": self.swept,
+        }
+
+
+class RateLimiter:
+    """Login throttle applying one bucket per member id and one per client IP."""
+
+    def __init__(self, backend: Optional[RateLimitBackend] = None):
+        self.backend = backend or InMemoryRateLimitBackend(int(os.getenv("LOGIN_RATE_LIMIT_MAX_KEYS", 1_000_000)))
+        self.member_rate = float(os.getenv("LOGIN_RATE_LIMIT_MEMBER_PER_MIN", 5)) / 60.0
+        self.member_burst = int(os.getenv("LOGIN_RATE_LIMIT_MEMBER_BURST", 5))
+        self.ip_rate = float(os.getenv("LOGIN_RATE_LIMIT_IP_PER_MIN", 60)) / 60.0
+        self.ip_burst = int(os.getenv("LOGIN_RATE_LIMIT_IP_BURST", 20))
+
+    async def check_login(self, member_id: str, client_ip: Optional[str]) -> float:
+        """Return 0 if this login attempt may proceed, else seconds until it may be retried."""
+        if client_ip:
+            retry_after = await self.backend.acquire(f"ip:{client_ip}", self.ip_rate, self.ip_burst)
+            if retry_after:
+                return retry_after
+        return await self.backend.acquire(f"member:{member_id}", self.member_rate, self.member_burst)
+
+    def sweep(self) -> int:
+        return self.backend.sweep()
+
+    def metrics(self) -> Dict[str, Any]:
+        return self.backend.metrics()
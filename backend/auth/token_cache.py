@@ -0,0 +1,100 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+
+def token_digest(token: str) -> bytes:
+    # Key on a digest so raw bearer tokens are never held in process memory
+    return hashlib.blake2b(token.encode(), digest_size=16).digest()
+
+
+class TokenCache:
+    """Bounded cache of already-verified JWTs.
+
+    Entries are keyed by token digest, expire at the token's own ``exp`` and
+    are evicted least-recently-used once ``max_size`` is reached. A cache hit
+    skips the HMAC check and the JWT parse entirely, which is what polling
+    dashboards hitting ``get_current_user`` hundreds of times a minute pay
+    for today.
+
+    Revocation is tracked separately from the cache so it also applies to
+    tokens that are decoded for the first time: ``revoke`` blocks one token
+    until it would have expired anyway.
+    """
+
+    def __init__(self, max_size: Optional[int] = None):
+        self.max_size = int(os.getenv("TOKEN_CACHE_MAX_SIZE", 10000)) if max_size is None else max_size
+        self._entries: "OrderedDict[bytes, Tuple[Dict[str, Any], float]]" = OrderedDict()
+        self._revoked_tokens: Dict[bytes, float] = {}
+        # get_current_user is a sync dependency, so FastAPI runs it on worker threads
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, token: str) -> Optional[Dict[str, Any]]:
+        if self.max_size <= 0:
+            return None
+        digest = token_digest(token)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is None:
+                self.misses += 1
+                return None
+            user, expires_at = entry
+            if expires_at <= now or digest in self._revoked_tokens:
+                del self._entries[digest]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(digest)
+            self.hits += 1
+            return user
+
+    def put(self, token: str, user: Dict[str, Any], expires_at: float) -> None:
+        if self.max_size <= 0:
+            return
+        digest = token_digest(token)
+        with self._lock:
+            self._entries[digest] = (user, float(expires_at))
+            self._entries.move_to_end(digest)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def is_revoked(self, token: str) -> bool:
+        with self._lock:
+            return token_digest(token) in self._revoked_tokens
+
+    def revoke(self, token: str, expires_at: float) -> None:
+        digest = token_digest(token)
+        with self._lock:
+            self._revoked_tokens[digest] = float(expires_at)
+            self._entries.pop(digest, None)
+
+    def sweep(self) -> None:
+        """Drop expired entries and revocations that can no longer match a live token."""
+        now = time.time()
+        with self._lock:
+            expired = [digest for digest, (_, expires_at) in self._entries.items() if expires_at <= now]
+            for digest in expired:
+                del self._entries[digest]
+            self._revoked_tokens = {d: exp for d, exp in self._revoked_tokens.items() if exp > now}
+
+    def metrics(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "revoked_tokens": len(self._revoked_tokens),
+        }
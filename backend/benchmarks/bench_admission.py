@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""Overload the fake Azure deployment with and without admission control.
+
+The fake deployment throttles (429) beyond ``--capacity`` concurrent
+requests and slows down as load grows, like a deployment at its quota.
+A burst of ``--clients`` concurrent callers (``--agent-share`` of them
+signed-in agents, the rest anonymous) sends ``--requests`` chat calls
+through the upstream layer, first unguarded, then behind the admission
+controller. Reports success, fast rejections, throttling seen upstream,
+per-role latency and where the adaptive limit settled.
+
+    python benchmarks/bench_admission.py --requests 600 --clients 120 --capacity 24
+"""
+import argparse
+import asyncio
+import logging
+import random
+import sys
+import time
+from collections import defaultdict
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from fake_azure import Behaviour, FakeAzure  # noqa: E402
+from planshopper_bot.services.admission import AdmissionConfig, AdmissionController, AdmissionRejected  # noqa: E402
+from planshopper_bot.services.http_client import close_http_client, start_http_client  # noqa: E402
+from planshopper_bot.services.upstream import Deployment, ResilientUpstream, UpstreamConfig, UpstreamError  # noqa: E402
+
+PAYLOAD = b'{"messages": [{"role": "user", "content": "which plans cover eliquis in cook county"}]}'
+PROMPT_TOKENS = 900
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))] if ordered else float("nan")
+
+
+async def burst(args, admission):
+    server = await FakeAzure(Behaviour(latency_ms=args.latency_ms, load_latency_ms=args.load_latency_ms,
+                                       max_concurrency=args.capacity), seed=args.seed).start()
+    upstream = ResilientUpstream([Deployment.azure(server.endpoint, "gpt-4o", "key", "2024-10-21")],
+                                 UpstreamConfig(base_delay=0.1, max_delay=2.0, breaker_failures=10_000),
+                                 rng=random.Random(args.seed))
+    rng = random.Random(args.seed)
+    roles = ["agent" if rng.random() < args.agent_share else None for _ in range(args.requests)]
+    latencies, outcomes = defaultdict(list), defaultdict(lambda: defaultdict(int))
+    pending = iter(enumerate(roles))
+
+    async def client():
+        for _, role in pending:
+            label = role or "anonymous"
+            started = time.perf_counter()
+            try:
+                if admission is None:
+                    (await upstream.post(PAYLOAD)).json()
+                else:
+                    async with admission.admit(role, PROMPT_TOKENS) as permit:
+                        response = await upstream.post(PAYLOAD)
+                        permit.headers_received()
+                        permit.usage = response.json().get("usage")
+                outcomes[label]["ok"] += 1
+                latencies[label].append((time.perf_counter() - started) * 1000)
+            except AdmissionRejected as e:
+                # A well-behaved client honours Retry-After before its next question
+                outcomes[label]["rejected"] += 1
+                await asyncio.sleep(e.retry_after)
+            except UpstreamError:
+                outcomes[label]["failed"] += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(args.clients)))
+    elapsed = time.perf_counter() - started
+    await server.close()
+    served = sum(counts["ok"] for counts in outcomes.values())
+    return latencies, outcomes, server.throttled["gpt-4o"], upstream.metrics()["retries"], served / elapsed
+
+
+async def main_async(args):
+    await start_http_client()
+    try:
+        print(f"{args.requests} requests from {args.clients} concurrent clients, deployment capacity {args.capacity}")
+        print(f"  {'mode':10s} {'role':10s} {'ok':>5s} {'rejected':>8s} {'failed':>6s} {'p50 ms':>7s} {'p95 ms':>7s}")
+        for mode in ("unguarded", "admission"):
+            admission = None
+            if mode == "admission":
+                admission = AdmissionController(AdmissionConfig(initial_limit=args.initial_limit, queue_timeout=30.0,
+                                                                queue_sizes=(("agent", 64), ("anonymous", 64))))
+            latencies, outcomes, throttled, retries, throughput = await burst(args, admission)
+            for role in ("agent", "anonymous"):
+                counts = outcomes[role]
+                print(f"  {mode:10s} {role:10s} {counts['ok']:5d} {counts['rejected']:8d} {counts['failed']:6d} "
+                      f"{percentile(latencies[role], 0.5):7.0f} {percentile(latencies[role], 0.95):7.0f}")
+            summary = f"  {'':10s} upstream 429s {throttled}, retries {retries}, {throughput:.0f} answers/s"
+            if admission is not None:
+                metrics = admission.metrics()
+                summary += f", limit settled at {metrics['limit']} after {metrics['decreases']} decreases"
+            print(summary)
+    finally:
+        await close_http_client()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=600)
+    parser.add_argument("--clients", type=int, default=120)
+    parser.add_argument("--capacity", type=int, default=24)
+    parser.add_argument("--latency-ms", type=float, default=60.0)
+    parser.add_argument("--load-latency-ms", type=float, default=3.0)
+    parser.add_argument("--initial-limit", type=int, default=AdmissionConfig.initial_limit)
+    parser.add_argument("--agent-share", type=float, default=0.2)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+    logging.getLogger("planshopper_bot").setLevel(logging.ERROR)
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
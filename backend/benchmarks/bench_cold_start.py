@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""Measure how long a worker takes from process start until it is ready for traffic.
+
+Each run is a fresh Python process that imports ``app``, builds
+``create_app()`` and runs its lifespan against benchmarks/fake_mysql.py and
+the fake Azure server (benchmarks/fake_azure.py), like ``uvicorn --factory``
+starting one worker. ``--preload`` additionally builds the app once and
+forks ``--workers`` workers from it that only run the lifespan, like
+``gunicorn --preload``. Prints the median and p95 of the wall time seen by
+the launcher and of each startup phase the app reports; the first run pays
+for a cold page cache.
+
+    python benchmarks/bench_cold_start.py --runs 10
+    python benchmarks/bench_cold_start.py --runs 5 --preload --workers 4 --db-connect-ms 20
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+BACKEND = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from fake_azure import Behaviour, FakeAzure  # noqa: E402
+from loadtest import WORKER_ENV  # noqa: E402
+
+
+async def run_lifespan(app) -> Dict[str, Any]:
+    started = time.perf_counter()
+    async with app.router.lifespan_context(app):
+        ready = time.perf_counter()
+    report = app.state.startup.metrics()
+    report["shutdown_ms"] = round((time.perf_counter() - ready) * 1000, 1)
+    report["lifespan_wall_ms"] = round((ready - started) * 1000, 1)
+    return report
+
+
+def child_main(config: Dict[str, Any]) -> None:
+    """One cold start; with ``preload``, one app forked into ``workers`` workers. Prints JSON lines."""
+    for name, value in WORKER_ENV.items():
+        os.environ.setdefault(name, value)
+    os.environ["AZURE_OPENAI_ENDPOINT"] = config["azure_endpoint"]
+
+    started = time.perf_counter()
+    from app import create_app, process_age
+    import fastapi_backend
+    from fake_mysql import FakeMySQL
+
+    mysql = FakeMySQL(connect_ms=config["db_connect_ms"], query_ms=0.5)
+    fastapi_backend.db_pool._connect = mysql.connect
+    app = create_app()
+    built_ms = round((time.perf_counter() - started) * 1000, 1)
+
+    if not config["preload"]:
+        report = asyncio.run(run_lifespan(app))
+        report.update(mode="cold", create_app_ms=built_ms, process_ready_s=process_age())
+        print(json.dumps(report), flush=True)
+        return
+
+    pids = []
+    for _ in range(config["workers"]):
+        forked_at = time.perf_counter()
+        pid = os.fork()
+        if pid == 0:
+            report = asyncio.run(run_lifespan(app))
+            report.update(mode="preloaded", fork_to_ready_ms=round((time.perf_counter() - forked_at) * 1000, 1))
+            # One write per report, so the workers' lines do not interleave
+            os.write(sys.stdout.fileno(), (json.dumps(report) + "\n").encode())
+            os._exit(0)
+        pids.append(pid)
+    for pid in pids:
+        os.waitpid(pid, 0)
+
+
+async def launch(config: Dict[str, Any]) -> List[Dict[str, Any]]:
+    started = time.perf_counter()
+    process = await asyncio.create_subprocess_exec(
+        sys.executable, __file__, "--child-config", json.dumps(config),
+        stdout=asyncio.subprocess.PIPE, cwd=str(BACKEND))
+    stdout, _ = await process.communicate()
+    if process.returncode != 0:
+        raise RuntimeError(f"Cold start run exited with {process.returncode}")
+    reports = [json.loads(line) for line in stdout.decode().splitlines() if line.startswith("{")]
+    # The launcher's view: interpreter start, imports, create_app and lifespan, plus reading the result
+    for report in reports:
+        report["launcher_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    return reports
+
+
+def summarize(label: str, values: List[float]) -> None:
+    if not values:
+        return
+    ordered = sorted(values)
+    p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+    print(f"{label:28s} {statistics.median(ordered):9.1f} {p95:9.1f} {ordered[0]:9.1f} {ordered[-1]:9.1f}")
+
+
+async def main_async(args) -> None:
+    server = await FakeAzure(Behaviour(latency_ms=args.azure_latency_ms)).start()
+    config = {"azure_endpoint": server.endpoint, "db_connect_ms": args.db_connect_ms,
+              "preload": args.preload, "workers": args.workers}
+    reports: List[Dict[str, Any]] = []
+    try:
+        for _ in range(args.runs):
+            reports.extend(await launch(config))
+    finally:
+        await server.close()
+
+    print(f"{args.runs} run(s), {'preloaded, ' + str(args.workers) + ' workers' if args.preload else 'cold'}")
+    print(f"{'ms':28s} {'median':>9s} {'p95':>9s} {'min':>9s} {'max':>9s}")
+    if args.preload:
+        summarize("fork -> ready", [r["fork_to_ready_ms"] for r in reports])
+    else:
+        summarize("launch -> exit (launcher)", [r["launcher_ms"] for r in reports])
+        summarize("process start -> ready", [r["process_ready_s"] * 1000 for r in reports
+                                             if r.get("process_ready_s") is not None])
+        summarize("imports + create_app", [r["create_app_ms"] for r in reports])
+    phases = list(dict.fromkeys(name for r in reports for name in r["phases_ms"]))
+    for name in phases:
+        summarize(f"  {name}", [r["phases_ms"][name] for r in reports if name in r["phases_ms"]])
+    summarize("shutdown", [r["shutdown_ms"] for r in reports])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--preload", action="store_true", help="fork workers from one preloaded app")
+    parser.add_argument("--workers", type=int, default=4, help="workers forked per run with --preload")
+    parser.add_argument("--db-connect-ms", type=float, default=5.0)
+    parser.add_argument("--azure-latency-ms", type=float, default=20.0)
+    parser.add_argument("--child-config", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child_config is not None:
+        child_main(json.loads(args.child_config))
+        return
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
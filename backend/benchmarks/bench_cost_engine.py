@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""Time yearly cost estimates for every plan in a county, with and without numpy.
+
+Uses the synthetic plan data of bench_plan_lookup.py, estimates a county's
+plans for a profile with two monthly drugs, and checks that the numpy and
+pure-Python paths rank the plans identically.
+
+    python benchmarks/bench_cost_engine.py --plans 3000 --county-plans 300
+"""
+import argparse
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from bench_plan_lookup import synthetic_rows  # noqa: E402
+from planshopper_bot.services import cost_engine  # noqa: E402
+from planshopper_bot.services.cost_engine import UtilizationProfile, estimate_costs  # noqa: E402
+from planshopper_bot.services.plan_data import PlanSnapshot  # noqa: E402
+
+
+def timed(snapshot, rows, profile, iterations):
+    timings = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        estimates = estimate_costs(snapshot, rows, profile)
+        timings.append((time.perf_counter() - started) * 1000)
+    return estimates, statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--plans", type=int, default=3000)
+    parser.add_argument("--county-plans", type=int, default=300)
+    parser.add_argument("--iterations", type=int, default=50)
+    args = parser.parse_args()
+
+    rows_data, _ = synthetic_rows(args.plans, 500, 100)
+    snapshot = PlanSnapshot(rows_data)
+    rows = list(range(min(args.county_plans, snapshot.plan_count)))
+    profile = UtilizationProfile(specialist_visits=6, er_visits=1, drugs=("eliquis", "ozempic"))
+
+    numpy = cost_engine.np
+    results = {}
+    if numpy is not None:
+        results["numpy"] = timed(snapshot, rows, profile, args.iterations)
+    cost_engine.np = None
+    try:
+        results["python"] = timed(snapshot, rows, profile, args.iterations)
+    finally:
+        cost_engine.np = numpy
+
+    for name, (estimates, median_ms) in results.items():
+        print(f"{name:6}: {len(rows)} plans estimated and ranked in {median_ms:.3f} ms (median)")
+    if len(results) == 2:
+        fast, slow = results["numpy"][0], results["python"][0]
+        same_order = [e.row for e in fast] == [e.row for e in slow]
+        max_diff = max(abs(a.total - b.total) for a, b in zip(
+            sorted(fast, key=lambda e: e.row), sorted(slow, key=lambda e: e.row)))
+        print(f"numpy and python rankings identical: {same_order}, max total difference ${max_diff:.6f}")
+    else:
+        print("numpy is not installed; only the pure-Python path was timed")
+    cheapest = next(iter(results.values()))[0][0]
+    print(f"cheapest: {snapshot.plan_columns['name'][cheapest.row]} at ${cheapest.total:,.0f}/year")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""Build a synthetic plan-document index and time opening and querying it.
+
+Opening only maps files and reads meta.json, so open time should stay
+around a millisecond whatever --chunks is; query latency is reported with
+and without county/plan type filters.
+
+    python benchmarks/bench_local_index.py --chunks 50000
+"""
+import argparse
+import random
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from planshopper_bot.services.local_index import LocalIndex, build_index  # noqa: E402
+
+COUNTIES = ["Cook", "DuPage", "Lake", "Will", "Kane", "McHenry", "Harris", "Dallas", "Travis", "Maricopa"]
+PLAN_TYPES = ["HMO", "PPO", "PFFS", "SNP"]
+TOPICS = [
+    "monthly premium", "annual deductible", "primary care copay", "specialist copay", "out-of-pocket maximum",
+    "emergency room copay", "urgent care", "inpatient hospital stay", "skilled nursing facility", "ambulance",
+    "dental cleanings", "vision exam", "hearing aids", "over-the-counter allowance", "telehealth visits",
+    "tier 1 generic drugs", "tier 3 preferred brand", "insulin", "mail order pharmacy", "prior authorization",
+]
+DRUGS = ["metformin", "atorvastatin", "lisinopril", "eliquis", "ozempic", "insulin glargine", "albuterol", "jardiance"]
+QUERIES = [
+    "what is the deductible", "specialist copay for hmo plans", "is ozempic covered", "dental and vision benefits",
+    "out of pocket maximum for ppo", "how much is an er visit", "insulin cost per month", "telehealth copay",
+]
+
+
+def synthetic_chunks(count, seed=7):
+    rng = random.Random(seed)
+    for i in range(count):
+        county, plan_type = rng.choice(COUNTIES), rng.choice(PLAN_TYPES)
+        sentences = [
+            f"The {rng.choice(TOPICS)} is ${rng.randint(0, 500)} for members of plan {i % 997} {plan_type}."
+            for _ in range(rng.randint(3, 8))
+        ]
+        sentences.append(f"{rng.choice(DRUGS).title()} is on tier {rng.randint(1, 5)} of the formulary.")
+        yield {
+            "content": " ".join(sentences),
+            "title": f"Plan {i % 997} {plan_type} benefits ({county})",
+            "metadata": {"county": county, "plan_type": plan_type},
+        }
+
+
+def timed(fn, rounds):
+    samples = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    samples.sort()
+    return statistics.median(samples) * 1e3, samples[int(len(samples) * 0.99)] * 1e3
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=20000)
+    parser.add_argument("--rounds", type=int, default=50)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = str(Path(tmp) / "index")
+        started = time.perf_counter()
+        meta = build_index(synthetic_chunks(args.chunks), path, version="bench")
+        print(f"built {meta['chunks']:,} chunks / {meta['terms']:,} terms in {time.perf_counter() - started:.2f} s")
+        size = sum(f.stat().st_size for f in Path(path).iterdir())
+        print(f"index size {size / 1e6:.1f} MB")
+
+        p50, p99 = timed(lambda: LocalIndex(path).close(), args.rounds)
+        print(f"open:               p50 {p50:7.3f} ms  p99 {p99:7.3f} ms")
+
+        index = LocalIndex(path)
+        for label, filters in (("query", None),
+                               ("query + county", {"county": "Cook"}),
+                               ("query + county/type", {"county": ["Cook", "Lake"], "plan_type": "HMO"})):
+            queries = iter(QUERIES * args.rounds)
+            p50, p99 = timed(lambda: index.search(next(queries), 6, filters), args.rounds * len(QUERIES) // 2)
+            print(f"{label + ':':20s}p50 {p50:7.3f} ms  p99 {p99:7.3f} ms")
+        hits = index.search("is ozempic covered for hmo", 3, {"county": "Cook"})
+        print("top hits:", [(index.chunk(chunk_id)["title"], round(score, 2)) for chunk_id, score in hits])
+        index.close()
+
+
+if __name__ == "__main__":
+    main()
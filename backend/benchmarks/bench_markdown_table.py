@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""Check and time the incremental markdown table recognizer on a recorded plan comparison.
+
+The answer in the recorded Azure stream is fed delta by delta (as the
+streaming endpoint does) and in one piece (as /api/chat does); both must
+recognize the same table. The answer is then repeated 1x..16x to show the
+cost grows linearly with answer length rather than with the number of
+deltas times the buffer size.
+
+    python benchmarks/bench_markdown_table.py
+"""
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from planshopper_bot.utils.markdown_table import MarkdownTableParser, parse_tables  # noqa: E402
+from planshopper_bot.utils.sse_decoder import SSEDecoder  # noqa: E402
+
+FIXTURES = Path(__file__).resolve().parent / "fixtures"
+
+
+def load_deltas(path):
+    deltas = []
+    for event in SSEDecoder().feed(Path(path).read_bytes()):
+        if event.data == b"[DONE]":
+            break
+        choices = json.loads(event.data).get("choices") or [{}]
+        content = (choices[0].get("delta") or {}).get("content")
+        if content:
+            deltas.append(content)
+    return deltas
+
+
+def stream_parse(deltas):
+    parser = MarkdownTableParser()
+    rows = 0
+    for delta in deltas:
+        rows += len(parser.feed(delta))
+    rows += len(parser.close())
+    return parser, rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rounds", type=int, default=200)
+    parser.add_argument("--fixture", default=str(FIXTURES / "azure_stream_plan_comparison.sse"))
+    args = parser.parse_args()
+
+    deltas = load_deltas(args.fixture)
+    answer = "".join(deltas)
+
+    streamed, row_events = stream_parse(deltas)
+    whole = parse_tables(answer)
+    assert streamed.tables == whole.tables, "streamed and whole-answer parses disagree"
+    assert len(whole.tables) == 1 and row_events == len(whole.tables[0]["rows"])
+    table = whole.tables[0]
+    print(f"recognized {len(whole.tables)} table: {len(table['columns'])} columns x {len(table['rows'])} rows")
+    print(f"  columns: {table['columns']}")
+    print(f"  table_data is {len(whole.markdown[0]):,} of {len(answer):,} answer characters")
+
+    print(f"{'answer size':>12s} {'deltas':>8s} {'us/stream':>10s} {'ns/char':>8s}")
+    for factor in (1, 4, 16):
+        repeated = deltas * factor
+        size = len(answer) * factor
+        started = time.perf_counter()
+        for _ in range(args.rounds):
+            stream_parse(repeated)
+        elapsed = (time.perf_counter() - started) / args.rounds
+        print(f"{size:12,d} {len(repeated):8,d} {elapsed * 1e6:10.1f} {elapsed / size * 1e9:8.1f}")
+
+
+if __name__ == "__main__":
+    main()
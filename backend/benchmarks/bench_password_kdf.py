@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""Report password verifications (logins) per second per core for each KDF cost setting.
+
+Each setting is timed on a single thread, which is what one worker of
+PasswordHasher's pool sustains; multiply by PASSWORD_POOL_WORKERS for the
+pool's ceiling.
+
+    python benchmarks/bench_password_kdf.py --seconds 2
+"""
+import argparse
+import hashlib
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from auth.passwords import KDFConfig, hash_password, verify_password  # noqa: E402
+
+SETTINGS = [
+    ("legacy sha256 (unsalted)", None),
+    ("scrypt n=2^13 r=8 p=1", KDFConfig(algorithm="scrypt", scrypt_n=2 ** 13)),
+    ("scrypt n=2^14 r=8 p=1", KDFConfig(algorithm="scrypt", scrypt_n=2 ** 14)),
+    ("scrypt n=2^15 r=8 p=1", KDFConfig(algorithm="scrypt", scrypt_n=2 ** 15)),
+    ("pbkdf2_sha256 210k", KDFConfig(algorithm="pbkdf2_sha256", pbkdf2_iterations=210000)),
+    ("pbkdf2_sha256 600k", KDFConfig(algorithm="pbkdf2_sha256", pbkdf2_iterations=600000)),
+]
+
+
+def measure(hashed, seconds):
+    count = 0
+    started = time.perf_counter()
+    while time.perf_counter() - started < seconds:
+        verify_password("member@123", hashed)
+        count += 1
+    elapsed = time.perf_counter() - started
+    return count / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=2.0, help="time spent on each setting")
+    args = parser.parse_args()
+
+    print(f"{'setting':28s} {'logins/s/core':>14s} {'ms/login':>10s}")
+    for label, config in SETTINGS:
+        if config is None:
+            hashed = hashlib.sha256(b"member@123").hexdigest()
+        else:
+            hashed = hash_password("member@123", config)
+        rate = measure(hashed, args.seconds)
+        print(f"{label:28s} {rate:14,.1f} {1000 / rate:10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""Build a synthetic plan data snapshot and time message lookups against it.
+
+Reports snapshot build time and per-message lookup latency, plus how many
+sample questions were answered directly, grounded with facts, or left to
+the model. Every lookup should stay in the tens of microseconds.
+
+    python benchmarks/bench_plan_lookup.py --plans 3000 --drugs 2000 --providers 20000
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from planshopper_bot.services.plan_data import PlanDataConfig, PlanDataStore, PlanRows  # noqa: E402
+
+COUNTIES = ["Cook", "DuPage", "Lake", "Will", "Kane", "McHenry", "Harris", "Dallas", "Travis", "Maricopa"]
+PLAN_TYPES = ["HMO", "PPO", "PFFS", "SNP"]
+CARRIERS = ["Humana", "Aetna", "UnitedHealthcare", "Cigna", "Wellcare", "BlueCross"]
+TIERS = ["Gold", "Silver", "Value", "Premier", "Choice", "Plus", "Essential"]
+SPECIALTIES = ["Cardiology", "Family Medicine", "Internal Medicine", "Oncology", "Dermatology", "Orthopedics"]
+FIRST_NAMES = ["Jane", "John", "Maria", "Wei", "Priya", "Ahmed", "Laura", "David", "Keisha", "Omar"]
+LAST_NAMES = ["Smith", "Garcia", "Chen", "Patel", "Khan", "Johnson", "Nguyen", "Okafor", "Rossi", "Kim"]
+DRUGS = ["Eliquis", "Ozempic", "Metformin HCl", "Atorvastatin", "Lisinopril", "Jardiance", "Xarelto", "Trulicity"]
+
+
+def synthetic_rows(plans, drugs, providers, seed=7):
+    rng = random.Random(seed)
+    rows = PlanRows()
+    plan_ids = []
+    for i in range(plans):
+        plan_id = f"H{1000 + i // 10}-{i % 10:03d}"
+        plan_type = rng.choice(PLAN_TYPES)
+        plan_ids.append(plan_id)
+        rows.plans.append({
+            "plan_id": plan_id, "plan_year": 2025, "carrier": rng.choice(CARRIERS), "plan_type": plan_type,
+            "name": f"{rng.choice(CARRIERS)} {rng.choice(TIERS)} {i} {plan_type}", "state": "IL",
+            "county": rng.choice(COUNTIES), "monthly_premium": rng.choice([0, 0, 19, 35, 48.5, 79]),
+            "deductible": rng.choice([0, 250, 500]), "drug_deductible": rng.choice([0, 250, 545]),
+            "moop": rng.choice([3900, 4900, 6700, 8850]), "pcp_copay": rng.choice([0, 5, 10]),
+            "specialist_copay": rng.choice([25, 40, 50]), "er_copay": 110, "urgent_care_copay": 40,
+            "inpatient_copay": 325, "coinsurance": 0.2, "star_rating": rng.choice([3, 3.5, 4, 4.5, 5]),
+        })
+    names = DRUGS + [f"Drug{i}" for i in range(max(0, drugs - len(DRUGS)))]
+    for plan_id in plan_ids:
+        for drug in rng.sample(names, k=min(len(names), 400)):
+            rows.formulary.append({
+                "plan_id": plan_id, "drug_name": drug, "tier": rng.randint(1, 5),
+                "copay": rng.choice([0, 5, 10, 47, 100]), "coinsurance": None,
+                "prior_auth": rng.random() < 0.2, "step_therapy": rng.random() < 0.05, "quantity_limit": rng.random() < 0.1,
+            })
+    for i in range(providers):
+        npi = f"{1000000000 + i}"
+        rows.providers.append({
+            "npi": npi, "name": f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}{i}, MD",
+            "specialty": rng.choice(SPECIALTIES), "city": "Chicago", "county": rng.choice(COUNTIES),
+        })
+        for plan_id in rng.sample(plan_ids, k=min(len(plan_ids), 20)):
+            rows.provider_networks.append({"plan_id": plan_id, "npi": npi})
+    return rows, plan_ids
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--plans", type=int, default=3000)
+    parser.add_argument("--drugs", type=int, default=2000)
+    parser.add_argument("--providers", type=int, default=20000)
+    parser.add_argument("--iterations", type=int, default=2000)
+    args = parser.parse_args()
+
+    rows, plan_ids = synthetic_rows(args.plans, args.drugs, args.providers)
+    store = PlanDataStore(lambda: _resolved(rows), PlanDataConfig(source="bench"))
+    started = time.perf_counter()
+    asyncio.run(store.refresh())
+    print(f"snapshot: {len(rows.plans)} plans, {len(rows.formulary)} formulary entries, "
+          f"{len(rows.providers)} providers, {len(rows.provider_networks)} network rows "
+          f"built in {(time.perf_counter() - started) * 1000:.0f} ms")
+
+    snapshot = store.snapshot
+    plan_name = snapshot.plan_columns["name"][snapshot.plans_by_id[plan_ids[0]][0]]
+    provider = snapshot.provider_name[3].split(",")[0]
+    messages = [
+        f"what is the copay for eliquis on {plan_ids[0]}",
+        f"is ozempic covered by {plan_name}",
+        f"is Dr. {provider} in network with {plan_ids[5]}",
+        f"what is the premium and deductible of {plan_name}",
+        "is metformin covered",
+        "which plans in travis county cover jardiance",
+        "what is the difference between an hmo and a ppo",
+        "how do I appeal a denied claim",
+    ]
+
+    outcomes = {"direct": 0, "facts": 0, "model": 0}
+    for message in messages:
+        result = store.lookup(message)
+        kind = "model" if result is None else "direct" if result.answer is not None else "facts"
+        outcomes[kind] += 1
+        print(f"  {kind:6} {message}")
+
+    timings = []
+    for i in range(args.iterations):
+        message = messages[i % len(messages)]
+        started = time.perf_counter()
+        store.lookup(message)
+        timings.append((time.perf_counter() - started) * 1e6)
+    timings.sort()
+    print(f"lookup: median {statistics.median(timings):.1f} us, "
+          f"p99 {timings[int(len(timings) * 0.99) - 1]:.1f} us over {len(timings)} lookups")
+    print(f"sample outcomes: {outcomes}")
+
+
+async def _resolved(rows):
+    return rows
+
+
+if __name__ == "__main__":
+    main()
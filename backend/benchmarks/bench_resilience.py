@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""Exercise retries, hedging, circuit breaking and failover against the fake Azure server.
+
+Starts benchmarks/fake_azure.py in-process with a flaky primary deployment
+(throttling with Retry-After and a slow tail) and a healthy secondary, then
+sends the same load through the upstream layer with progressively more of
+it enabled. Reports success rate, latency percentiles, retries, failovers
+and hedges, and how many requests each fake deployment received. A second
+scenario takes the primary down entirely to show its circuit opening.
+
+    python benchmarks/bench_resilience.py --requests 400 --concurrency 16
+    python benchmarks/bench_resilience.py --stream --error-rate 0.3
+"""
+import argparse
+import asyncio
+import logging
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from fake_azure import Behaviour, FakeAzure  # noqa: E402
+from planshopper_bot.services.http_client import close_http_client, start_http_client  # noqa: E402
+from planshopper_bot.services.upstream import (  # noqa: E402
+    Deployment, ResilientUpstream, UpstreamConfig, UpstreamError
+)
+
+PAYLOAD = b'{"messages": [{"role": "user", "content": "compare the humana and aetna plans"}]}'
+STREAM_PAYLOAD = PAYLOAD[:-1] + b', "stream": true}'
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))] if ordered else float("nan")
+
+
+async def run(upstream, requests, concurrency, stream):
+    latencies, failures = [], 0
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        nonlocal failures
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                if stream:
+                    async with upstream.stream(STREAM_PAYLOAD) as response:
+                        async for _ in response.aiter_bytes():
+                            pass
+                else:
+                    (await upstream.post(PAYLOAD)).json()
+                latencies.append((time.perf_counter() - started) * 1000)
+            except UpstreamError:
+                failures += 1
+
+    await asyncio.gather(*(one() for _ in range(requests)))
+    return latencies, failures
+
+
+async def scenario(name, primary, secondary, configs, args):
+    print(f"\n{name}")
+    print(f"  {'configuration':26s} {'ok':>6s} {'p50 ms':>7s} {'p95 ms':>7s} {'p99 ms':>7s} "
+          f"{'retries':>7s} {'failover':>8s} {'hedges':>6s} {'won':>4s}  upstream requests")
+    for label, config, with_secondary in configs:
+        server = await FakeAzure(deployments={"primary": primary, "secondary": secondary}, seed=args.seed).start()
+        deployments = [Deployment.azure(server.endpoint, "primary", "key", "2024-10-21")]
+        if with_secondary:
+            deployments.append(Deployment.azure(server.endpoint, "secondary", "key", "2024-10-21"))
+        upstream = ResilientUpstream(deployments, config, rng=random.Random(args.seed))
+        # Warm-up fills the latency window hedging needs
+        await run(upstream, config.hedge_min_samples, args.concurrency, args.stream)
+        server.requests.clear()
+        warm = upstream.metrics()
+        latencies, failures = await run(upstream, args.requests, args.concurrency, args.stream)
+        metrics = {key: value - warm[key] for key, value in upstream.metrics().items() if isinstance(value, int)}
+        await server.close()
+        print(f"  {label:26s} {1 - failures / args.requests:6.1%} {percentile(latencies, 0.5):7.0f} "
+              f"{percentile(latencies, 0.95):7.0f} {percentile(latencies, 0.99):7.0f} {metrics['retries']:7d} "
+              f"{metrics['failovers']:8d} {metrics['hedges']:6d} {metrics['hedge_wins']:4d}  {dict(server.requests)}")
+
+
+async def main_async(args):
+    await start_http_client()
+    try:
+        base = UpstreamConfig(base_delay=0.05, max_delay=1.0, hedge_min_delay=0.05, breaker_cooldown=5.0)
+        configs = [
+            ("single attempt", UpstreamConfig(max_attempts=1), False),
+            ("retries", base, False),
+            ("retries + failover", base, True),
+            ("retries + failover + hedge", UpstreamConfig(**{**base.__dict__, "hedge": True}), True),
+        ]
+        primary = Behaviour(latency_ms=args.latency_ms, slow_rate=args.slow_rate, slow_ms=args.slow_ms,
+                            error_rate=args.error_rate, error_status=429, retry_after=0.1)
+        secondary = Behaviour(latency_ms=args.latency_ms * 1.5)
+        await scenario(f"flaky primary: {args.error_rate:.0%} throttled, {args.slow_rate:.0%} slow by {args.slow_ms:.0f} ms",
+                       primary, secondary, configs, args)
+        await scenario("primary down: every request answered 503 (its circuit opens during warm-up)", Behaviour(latency_ms=args.latency_ms, error_rate=1.0),
+                       secondary, configs[1:3], args)
+    finally:
+        await close_http_client()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--latency-ms", type=float, default=40.0)
+    parser.add_argument("--slow-rate", type=float, default=0.05)
+    parser.add_argument("--slow-ms", type=float, default=1000.0)
+    parser.add_argument("--error-rate", type=float, default=0.15)
+    parser.add_argument("--stream", action="store_true", help="stream the answers instead of plain JSON")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+    # Every failed attempt logs a warning; the table is the output here
+    logging.getLogger("planshopper_bot").setLevel(logging.ERROR)
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
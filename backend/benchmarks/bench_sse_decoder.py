@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""Compare the upstream stream parsing loops on a recorded Azure stream.
+
+"aiter_lines + json.loads" replays what chat_completion_stream used to do:
+httpx's text and line decoders, ``line.startswith('data: ')`` and a full
+``json.loads`` per chunk. "SSEDecoder + delta slice" is the current path.
+Both consume the fixture split into network-sized reads.
+
+    python benchmarks/bench_sse_decoder.py --rounds 200
+"""
+import argparse
+import json
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from httpx._decoders import LineDecoder, TextDecoder  # noqa: E402
+
+from planshopper_bot.utils.sse_decoder import FULL_PARSE, SSEDecoder, extract_delta_content  # noqa: E402
+
+FIXTURES = Path(__file__).resolve().parent / "fixtures"
+
+
+def split_reads(data, seed):
+    rng = random.Random(seed)
+    reads, position = [], 0
+    while position < len(data):
+        size = rng.randint(512, 4096)
+        reads.append(data[position:position + size])
+        position += size
+    return reads
+
+
+def line_loop(reads):
+    text_decoder, line_decoder = TextDecoder(), LineDecoder()
+    parts = []
+    for raw in reads:
+        for line in line_decoder.decode(text_decoder.decode(raw)):
+            if line.startswith('data: '):
+                chunk_data = line[6:].strip()
+                if chunk_data == '[DONE]':
+                    return "".join(parts)
+                try:
+                    chunk_json = json.loads(chunk_data)
+                    if 'choices' in chunk_json and len(chunk_json['choices']) > 0:
+                        choice = chunk_json['choices'][0]
+                        if 'delta' in choice and 'content' in choice['delta']:
+                            content = choice['delta']['content']
+                            if content:
+                                parts.append(content)
+                except json.JSONDecodeError:
+                    continue
+    return "".join(parts)
+
+
+def decoder_loop(reads):
+    decoder = SSEDecoder()
+    parts = []
+    for raw in reads:
+        for event in decoder.feed(raw):
+            if event.data == b'[DONE]':
+                return "".join(parts)
+            content = extract_delta_content(event.data)
+            if content is FULL_PARSE:
+                delta = (json.loads(event.data).get('choices') or [{}])[0].get('delta') or {}
+                content = delta.get('content')
+            if content:
+                parts.append(content)
+    return "".join(parts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rounds", type=int, default=200)
+    parser.add_argument("--fixture", default=str(FIXTURES / "azure_stream_plan_comparison.sse"))
+    args = parser.parse_args()
+
+    data = Path(args.fixture).read_bytes()
+    reads = split_reads(data, seed=3)
+    frames = data.count(b"\n\n")
+
+    expected = line_loop(reads)
+    assert decoder_loop(reads) == expected, "decoders disagree on the fixture"
+
+    print(f"fixture: {Path(args.fixture).name} ({len(data):,} bytes, {frames} frames, {len(reads)} reads)")
+    results = {}
+    for label, loop in (("aiter_lines + json.loads", line_loop), ("SSEDecoder + delta slice", decoder_loop)):
+        started = time.perf_counter()
+        for _ in range(args.rounds):
+            loop(reads)
+        elapsed = time.perf_counter() - started
+        per_frame_us = elapsed / (args.rounds * frames) * 1e6
+        results[label] = per_frame_us
+        print(f"  {label:26s} {elapsed / args.rounds * 1000:8.3f} ms/stream  {per_frame_us:6.2f} us/frame")
+    print(f"  speedup: {results['aiter_lines + json.loads'] / results['SSEDecoder + delta slice']:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
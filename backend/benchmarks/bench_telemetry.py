@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""Measure the per-span and per-request cost of the built-in telemetry.
+
+Times a span's enter/exit with telemetry disabled, with metrics only and
+with OTLP/JSON trace export to a temporary file, plus a bare histogram
+observation, a Prometheus render and the ASGI middleware around a trivial
+app. Nested spans run inside a root span, like the stages of a request.
+
+    python benchmarks/bench_telemetry.py --spans 200000
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from planshopper_bot.services.telemetry import Telemetry, TelemetryConfig, TelemetryMiddleware  # noqa: E402
+
+STAGES = ("db.pool_wait", "db.query", "auth.jwt_decode", "azure.parse")
+
+
+def time_spans(telemetry: Telemetry, spans: int) -> float:
+    """Nanoseconds per nested span."""
+    tracer = telemetry.tracer
+    per_root = len(STAGES)
+    started = time.perf_counter_ns()
+    for _ in range(spans // per_root):
+        with tracer.server_span("HTTP POST"):
+            for stage in STAGES:
+                with tracer.span(stage):
+                    pass
+    return (time.perf_counter_ns() - started) / (spans // per_root * per_root)
+
+
+def time_observe(telemetry: Telemetry, observations: int) -> float:
+    histogram = telemetry.upstream_latency
+    labels = ("gpt-4o", "ok")
+    started = time.perf_counter_ns()
+    for i in range(observations):
+        histogram.observe((i % 1000) / 1000, labels)
+    return (time.perf_counter_ns() - started) / observations
+
+
+async def time_middleware(telemetry: Telemetry, requests: int) -> float:
+    """Nanoseconds per request added by the middleware around a minimal ASGI app."""
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"ok"})
+
+    async def receive():
+        return {"type": "http.request", "body": b""}
+
+    async def send(message):
+        pass
+
+    scope = {"type": "http", "method": "GET", "path": "/health", "headers": []}
+    wrapped = TelemetryMiddleware(app, telemetry)
+    timings = []
+    for handler in (app, wrapped):
+        started = time.perf_counter_ns()
+        for _ in range(requests):
+            await handler(dict(scope), receive, send)
+        timings.append((time.perf_counter_ns() - started) / requests)
+    return timings[1] - timings[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--spans", type=int, default=200_000)
+    parser.add_argument("--requests", type=int, default=50_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        trace_file = os.path.join(tmp, "traces.jsonl")
+        modes = [
+            ("disabled", TelemetryConfig(enabled=False)),
+            ("metrics only", TelemetryConfig()),
+            ("metrics + traces to file", TelemetryConfig(trace_file=trace_file)),
+            ("metrics + 10% sampled traces", TelemetryConfig(trace_file=trace_file, trace_sample_rate=0.1)),
+        ]
+        print(f"{'mode':30s} {'ns/span':>8s} {'ns/request (middleware)':>24s}")
+        for label, config in modes:
+            telemetry = Telemetry(config)
+            telemetry.start()
+            per_span = time_spans(telemetry, args.spans)
+            per_request = asyncio.run(time_middleware(telemetry, args.requests))
+            telemetry.close()
+            print(f"{label:30s} {per_span:8.0f} {per_request:24.0f}")
+        exported = sum(1 for _ in open(trace_file)) if os.path.exists(trace_file) else 0
+        print(f"\ntrace file: {exported} OTLP/JSON batches written")
+
+    telemetry = Telemetry(TelemetryConfig())
+    print(f"histogram observe: {time_observe(telemetry, args.spans):.0f} ns")
+    time_spans(telemetry, args.spans)
+    started = time.perf_counter()
+    body = telemetry.render()
+    print(f"render /metrics: {(time.perf_counter() - started) * 1000:.2f} ms for {len(body.splitlines())} lines")
+
+
+if __name__ == "__main__":
+    main()
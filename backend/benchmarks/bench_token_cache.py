@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""Benchmark get_current_user with and without the verified-token cache.
+
+Simulates dashboards polling with a fixed population of live tokens, e.g.
+500 users each polling every 2 seconds (~250 req/s, 15k per minute), and
+reports the per-call cost of token verification in both modes.
+
+    python benchmarks/bench_token_cache.py --tokens 500 --requests 200000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+os.environ.setdefault("SECRET_KEY", "benchmark-secret-key")
+os.environ.setdefault("JWT_ALGORITHM", "HS256")
+os.environ.setdefault("ACCESS_TOKEN_EXPIRES_MIN", "30")
+
+import fastapi_backend  # noqa: E402
+from auth.token_cache import TokenCache  # noqa: E402
+
+
+def run(tokens, requests, cache_size):
+    fastapi_backend.token_cache = TokenCache(max_size=cache_size)
+    headers = [f"Bearer {token}" for token in tokens]
+    order = [random.choice(headers) for _ in range(requests)]
+
+    started = time.perf_counter()
+    for header in order:
+        fastapi_backend.get_current_user(header)
+    elapsed = time.perf_counter() - started
+    return elapsed, fastapi_backend.token_cache.metrics()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tokens", type=int, default=500, help="distinct live tokens (concurrent dashboard users)")
+    parser.add_argument("--requests", type=int, default=100000, help="verifications per mode")
+    parser.add_argument("--cache-size", type=int, default=10000)
+    args = parser.parse_args()
+
+    random.seed(7)
+    roles = ["member", "agent", "payer"]
+    tokens = [
+        fastapi_backend.create_access_token(str(10000 + i), roles[i % len(roles)])
+        for i in range(args.tokens)
+    ]
+
+    print(f"{args.tokens} live tokens, {args.requests} verifications per mode")
+    results = {}
+    for label, cache_size in (("decode every call", 0), ("verified-token cache", args.cache_size)):
+        elapsed, metrics = run(tokens, args.requests, cache_size)
+        per_call_us = elapsed / args.requests * 1e6
+        results[label] = per_call_us
+        print(f"  {label:22s} {per_call_us:8.2f} us/call  {args.requests / elapsed:12,.0f} calls/s  hit_ratio={metrics['hit_ratio']}")
+
+    speedup = results["decode every call"] / results["verified-token cache"]
+    print(f"  speedup: {speedup:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""Evaluate the local intent classifier against the old substring guardrails.
+
+Reports per-intent precision/recall, the confusion matrix and
+per-message latency on a held-out labelled set (none of these messages
+are in the training examples of the model file).
+
+    python benchmarks/eval_intent.py
+    python benchmarks/eval_intent.py --eval my_labelled.jsonl --show-errors
+"""
+import argparse
+import json
+import statistics
+import sys
+import time
+from collections import Counter
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from planshopper_bot.services.intent_classifier import (  # noqa: E402
+    GREETING, IN_DOMAIN, OUT_OF_DOMAIN, THANKS, IntentClassifier
+)
+
+FIXTURES = Path(__file__).resolve().parent / "fixtures"
+LABELS = (GREETING, THANKS, IN_DOMAIN, OUT_OF_DOMAIN)
+
+
+def legacy_intent(message):
+    """The substring keyword checks the service used before the classifier."""
+    message_lower = message.lower().strip()
+    if any(g in message_lower for g in ['hi', 'hello', 'hey', 'good morning', 'good afternoon', 'good evening']):
+        return GREETING
+    if any(t in message_lower for t in ['thank', 'thanks', 'thank you', 'appreciate']):
+        return THANKS
+    keywords = [
+        'plan', 'medicare', 'insurance', 'health', 'coverage', 'benefit', 'drug', 'prescription',
+        'provider', 'doctor', 'hospital', 'copay', 'deductible', 'premium', 'cost', 'network',
+        'hmo', 'ppo', 'medicaid', 'cigna', 'formulary', 'pharmacy', 'medical', 'care'
+    ]
+    return IN_DOMAIN if any(k in message_lower for k in keywords) else OUT_OF_DOMAIN
+
+
+def evaluate(name, classify, rows, rounds, show_errors):
+    predictions = [classify(row["text"]) for row in rows]
+    confusion = Counter((row["label"], predicted) for row, predicted in zip(rows, predictions))
+
+    latencies = []
+    for _ in range(rounds):
+        for row in rows:
+            started = time.perf_counter()
+            classify(row["text"])
+            latencies.append(time.perf_counter() - started)
+    latencies.sort()
+
+    accuracy = sum(confusion[(label, label)] for label in LABELS) / len(rows)
+    print(f"\n{name}: accuracy {accuracy:.1%}, "
+          f"p50 {statistics.median(latencies) * 1e6:.1f} us, "
+          f"p99 {latencies[int(len(latencies) * 0.99)] * 1e6:.1f} us per message")
+    print(f"  {'intent':14s} {'precision':>9s} {'recall':>7s} {'support':>8s}")
+    for label in LABELS:
+        predicted = sum(confusion[(actual, label)] for actual in LABELS)
+        support = sum(confusion[(label, other)] for other in LABELS)
+        precision = confusion[(label, label)] / predicted if predicted else 0.0
+        recall = confusion[(label, label)] / support if support else 0.0
+        print(f"  {label:14s} {precision:9.1%} {recall:7.1%} {support:8d}")
+    print("  confusion (rows = expected):")
+    print("  " + " " * 14 + "".join(f"{label[:9]:>10s}" for label in LABELS))
+    for actual in LABELS:
+        print(f"  {actual:14s}" + "".join(f"{confusion[(actual, label)]:10d}" for label in LABELS))
+    if show_errors:
+        for row, predicted in zip(rows, predictions):
+            if predicted != row["label"]:
+                print(f"  ✗ {row['text']!r}: expected {row['label']}, got {predicted}")
+    return accuracy
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--eval", default=str(FIXTURES / "intent_eval.jsonl"))
+    parser.add_argument("--rounds", type=int, default=200)
+    parser.add_argument("--show-errors", action="store_true")
+    args = parser.parse_args()
+
+    with open(args.eval, encoding="utf-8") as f:
+        rows = [json.loads(line) for line in f if line.strip()]
+
+    started = time.perf_counter()
+    classifier = IntentClassifier()
+    print(f"loaded intent model v{classifier.version} ({classifier.metrics()['features']} features) "
+          f"in {(time.perf_counter() - started) * 1e3:.1f} ms; {len(rows)} labelled messages")
+
+    evaluate("substring keywords (previous)", legacy_intent, rows, args.rounds, args.show_errors)
+    evaluate("intent classifier", lambda text: classifier.classify(text).intent, rows, args.rounds, args.show_errors)
+
+
+if __name__ == "__main__":
+    main()
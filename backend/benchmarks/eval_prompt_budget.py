@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""Compare prompt sizes before and after the token budget and compact system prompts.
+
+Counts each system prompt variant, checks that every variant still carries
+the instructions the answers depend on, and replays the in-domain questions
+of the intent eval set with synthetic conversation history and retrieved
+chunks. The baseline sends the full system prompt, the session's history
+budget and every retrieved chunk; the budgeted prompt is planned exactly as
+the service does. Reports average/p95 prompt tokens and how often the three
+best chunks still make it into the prompt.
+
+    python benchmarks/eval_prompt_budget.py
+    python benchmarks/eval_prompt_budget.py --budget 4000 --context 2000 --chunks 8
+"""
+import argparse
+import json
+import random
+import re
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from planshopper_bot.services.prompt_budget import (  # noqa: E402
+    COMPACT, FULL, PromptBudget, PromptBudgetConfig, Tokenizer
+)
+from planshopper_bot.services.session_store import SessionStoreConfig, pack_history  # noqa: E402
+from planshopper_bot.utils.prompts import PLAN_SHOPPER_SYSTEM_PROMPT  # noqa: E402
+
+FIXTURES = Path(__file__).resolve().parent / "fixtures"
+
+# Instructions every system prompt variant has to keep
+DIRECTIVES = {
+    "no citation markers": r"\[doc1\]",
+    "no source mentions": r"never mention",
+    "honest about gaps": r"only say you don'?t have information",
+    "concise bullets": r"3-5 bullet",
+    "follow-up questions": r"you might also want to know",
+    "comparison table": r"markdown table",
+    "drug coverage": r"drug coverage",
+    "in-network providers": r"in-network",
+    "cost estimates": r"estimated costs",
+}
+
+SENTENCES = [
+    "Plan {n} has a ${premium} monthly premium and a ${deductible} medical deductible.",
+    "Primary care visits cost ${copay} and specialist visits cost ${specialist} after the deductible.",
+    "Tier {tier} drugs are covered with a ${drug} copay per 30-day supply at preferred pharmacies.",
+    "Prior authorization is required for some specialty drugs and advanced imaging.",
+    "The out-of-pocket maximum for in-network care is ${moop} per year.",
+    "Emergency room visits are covered worldwide with a $110 copay that is waived if admitted.",
+    "Dental, vision and hearing benefits include an annual allowance of ${allowance}.",
+    "Members can use any provider in the network without a referral for most services.",
+]
+ANSWER = ("Here are the key points:\n- The premium is ${premium} a month.\n- Specialist visits cost ${specialist}.\n"
+          "- The out-of-pocket maximum is ${moop}.\n\nYou might also want to know:\n"
+          "1. Which drugs are covered?\n2. Is my doctor in network?")
+
+
+def fill(template, rng):
+    return template.format(n=rng.randint(1, 99), premium=rng.choice([0, 19, 35, 79]),
+                           deductible=rng.choice([0, 250, 500]), copay=rng.choice([0, 5, 10]),
+                           specialist=rng.choice([25, 40, 50]), tier=rng.randint(1, 5), drug=rng.choice([0, 10, 47]),
+                           moop=rng.choice([3900, 4900, 6700]), allowance=rng.choice([500, 1000, 1500]))
+
+
+def synthetic_chunks(rng, count):
+    """Retrieved chunks best first, of realistic and uneven size, with the occasional duplicate."""
+    chunks = []
+    for rank in range(count):
+        if chunks and rng.random() < 0.15:
+            chunks.append(chunks[rng.randrange(len(chunks))])
+            continue
+        body = " ".join(fill(rng.choice(SENTENCES), rng) for _ in range(rng.randint(8, 40)))
+        chunks.append((f"Plan benefits summary {rank + 1}", body))
+    return chunks
+
+
+def synthetic_turns(rng, questions):
+    return [(question, fill(ANSWER, rng)) for question in rng.sample(questions, k=rng.randint(0, 6))]
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--eval", type=Path, default=FIXTURES / "intent_eval.jsonl")
+    parser.add_argument("--budget", type=int, default=PromptBudgetConfig.total_tokens)
+    parser.add_argument("--context", type=int, default=PromptBudgetConfig.context_tokens)
+    parser.add_argument("--chunks", type=int, default=6, help="chunks retrieved per question (RAG_TOP_K)")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    tokenizer = Tokenizer()
+    print(f"tokenizer: {tokenizer.backend}")
+    variants = {FULL: PLAN_SHOPPER_SYSTEM_PROMPT}
+    variants.update(PromptBudget(PromptBudgetConfig(variant=COMPACT), tokenizer).system_prompts())
+    full_tokens = tokenizer.count(PLAN_SHOPPER_SYSTEM_PROMPT)
+    print(f"\n  {'variant':16s} {'tokens':>6s} {'saved':>6s}  missing directives")
+    for name, prompt in variants.items():
+        tokens = tokenizer.count(prompt)
+        missing = [label for label, pattern in DIRECTIVES.items() if not re.search(pattern, prompt, re.IGNORECASE)]
+        print(f"  {name:16s} {tokens:6d} {1 - tokens / full_tokens:6.1%}  {', '.join(missing) or '-'}")
+
+    questions = [row["text"] for row in map(json.loads, args.eval.read_text().splitlines()) if row["label"] == "in_domain"]
+    history_cap = SessionStoreConfig().history_token_budget
+    budget = PromptBudget(PromptBudgetConfig(total_tokens=args.budget, context_tokens=args.context,
+                                             variant=COMPACT, log_breakdown=False), tokenizer)
+    rng = random.Random(args.seed)
+    baseline, budgeted, top3_kept, over_budget = [], [], 0, 0
+    for question in questions:
+        turns = synthetic_turns(rng, questions)
+        chunks = synthetic_chunks(rng, args.chunks)
+
+        history = pack_history(turns, history_cap)
+        sources = "\n\n".join(f"[doc{i}] {header}\n{content}" for i, (header, content) in enumerate(chunks, 1))
+        baseline.append(tokenizer.count_messages(
+            [{"content": PLAN_SHOPPER_SYSTEM_PROMPT}, *history, {"content": sources}, {"content": question}]))
+
+        prompt = budget.plan(rng.choice(["member", "agent", "payer"]), question, turns, [], history_cap)
+        kept = budget.fit_sources(prompt, list(chunks))
+        budget.record(prompt)
+        budgeted.append(prompt.total)
+        over_budget += prompt.total > args.budget
+        top3 = {i for i in range(min(3, len(chunks))) if chunks[i] not in chunks[:i]}
+        top3_kept += top3 <= set(kept)
+
+    average = sum(baseline) / len(baseline)
+    print(f"\n{len(questions)} in-domain questions, {args.chunks} chunks each, budget {args.budget} "
+          f"(context {args.context})")
+    for name, totals in (("baseline", baseline), ("budgeted", budgeted)):
+        mean = sum(totals) / len(totals)
+        print(f"  {name:9s} avg {mean:7.0f}  p95 {percentile(totals, 0.95):6d}  max {max(totals):6d} prompt tokens"
+              + (f"  ({1 - mean / average:.1%} fewer)" if totals is budgeted else ""))
+    print(f"  top-3 chunks kept: {top3_kept / len(questions):.1%}, over budget: {over_budget}, "
+          f"chunks dropped: {budget.chunks_dropped}, truncated: {budget.chunks_truncated}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+"""A local stand-in for the Azure OpenAI chat completions API that injects latency and errors.
+
+Serves ``POST /openai/deployments/<deployment>/chat/completions`` over plain
+HTTP/1.1 with keep-alive, as JSON or as an SSE stream when the payload asks
+for ``"stream": true``. Each deployment can get its own behaviour, so
+retries, hedging, circuit breaking and failover can be exercised without
+Azure. Answers are synthetic, or replayed from a recorded Azure SSE stream
+(``--replay``), and stream at a fixed chunk interval or token rate:
+
+    python benchmarks/fake_azure.py --port 8090 --latency-ms 300 --error-rate 0.1 --error-status 429
+    python benchmarks/fake_azure.py --deployment gpt-4o:80:0.3:503 --deployment gpt-4o-b:120:0:503
+    python benchmarks/fake_azure.py --replay benchmarks/fixtures/azure_stream_plan_comparison.sse --tokens-per-second 60
+
+and point the backend at it with ``AZURE_OPENAI_ENDPOINT=http://127.0.0.1:8090``.
+Benchmarks start it in-process with ``await FakeAzure(...).start()``.
+"""
+import argparse
+import asyncio
+import json
+import random
+import re
+from collections import Counter
+from dataclasses import dataclass, replace
+from http import HTTPStatus
+from typing import Dict, List, Optional, Tuple
+
+_PATH = re.compile(r"^/openai/deployments/([^/]+)/chat/completions")
+
+ANSWER = (
+    "Here is how the two plans compare.\n\n"
+    "| Plan | Monthly premium | Deductible | Out-of-pocket max |\n"
+    "|---|---|---|---|\n"
+    "| Humana Gold Plus HMO | $0 | $0 | $3,900 |\n"
+    "| Aetna Value PPO | $35 | $250 | $6,700 |\n\n"
+    "The HMO costs less if your doctors are in its network.\n\n"
+    "You might also want to know:\n"
+    "1. Which drugs does each plan cover?\n"
+    "2. Is my doctor in network?"
+)
+
+
+@dataclass(frozen=True)
+class Behaviour:
+    # Time to response headers, plus an occasional slow outlier
+    latency_ms: float = 50.0
+    slow_rate: float = 0.0
+    slow_ms: float = 0.0
+    # Added for every other request in progress on the deployment, like a loaded backend
+    load_latency_ms: float = 0.0
+    # Fraction of requests answered with ``error_status`` (and Retry-After when set)
+    error_rate: float = 0.0
+    error_status: int = 503
+    retry_after: Optional[float] = None
+    # Requests beyond this many at once are throttled with 429, like an exhausted quota (0: unlimited)
+    max_concurrency: int = 0
+    # Streamed answers arrive in pieces of this many characters, this far apart
+    chunk_chars: int = 8
+    chunk_interval_ms: float = 2.0
+    # When set, pieces are paced to this generation rate instead (about four characters per token)
+    tokens_per_second: float = 0.0
+    prompt_tokens: int = 900
+    answer: str = ANSWER
+    # A recorded Azure SSE stream (``data:`` lines) to replay instead of the synthetic answer
+    replay: Optional[str] = None
+
+    @classmethod
+    def parse(cls, spec: str, base: "Behaviour") -> Tuple[str, "Behaviour"]:
+        """``name:latency_ms[:error_rate[:error_status[:retry_after]]]``"""
+        name, *values = spec.split(":")
+        fields = ("latency_ms", "error_rate", "error_status", "retry_after")
+        types = (float, float, int, float)
+        return name, replace(base, **{field: kind(value) for field, kind, value in zip(fields, types, values) if value})
+
+
+class Recording:
+    """A recorded chat completions stream: its raw events and the answer they add up to."""
+
+    def __init__(self, path: str):
+        self.events: List[Tuple[bytes, str]] = []
+        self.context: Optional[dict] = None
+        self.usage: Optional[dict] = None
+        with open(path, "rb") as f:
+            frames = f.read().split(b"\n\n")
+        for frame in frames:
+            data = b"\n".join(line[5:].strip() for line in frame.splitlines() if line.startswith(b"data:"))
+            if not data or data == b"[DONE]":
+                continue
+            event = json.loads(data)
+            choices = event.get("choices") or []
+            delta = (choices[0].get("delta") or {}) if choices else {}
+            if delta.get("context") and self.context is None:
+                self.context = delta["context"]
+            self.usage = event.get("usage") or self.usage
+            self.events.append((data, delta.get("content") or ""))
+        self.answer = "".join(content for _, content in self.events)
+
+
+_recordings: Dict[str, Recording] = {}
+
+
+def load_recording(path: str) -> Recording:
+    recording = _recordings.get(path)
+    if recording is None:
+        recording = _recordings[path] = Recording(path)
+    return recording
+
+
+class FakeAzure:
+    """Fake chat completions server; ``requests``, ``errors`` and ``throttled`` count per deployment."""
+
+    def __init__(self, default: Optional[Behaviour] = None, deployments: Optional[Dict[str, Behaviour]] = None,
+                 seed: Optional[int] = None):
+        self.default = default or Behaviour()
+        self.deployments = dict(deployments or {})
+        self.requests: Counter = Counter()
+        self.errors: Counter = Counter()
+        self.throttled: Counter = Counter()
+        self._active: Counter = Counter()
+        self._random = random.Random(seed)
+        self._server: Optional[asyncio.base_events.Server] = None
+
+    @property
+    def endpoint(self) -> str:
+        host, port = self._server.sockets[0].getsockname()[:2]
+        return f"http://{host}:{port}"
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> "FakeAzure":
+        self._server = await asyncio.start_server(self._serve, host, port)
+        return self
+
+    async def close(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, _ = request_line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+                await self._respond(writer, method, path, body)
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def _respond(self, writer: asyncio.StreamWriter, method: str, path: str, body: bytes) -> None:
+        match = _PATH.match(path)
+        if method != "POST" or match is None:
+            await self._send_json(writer, 404, {"error": {"code": "404", "message": "Resource not found"}})
+            return
+        deployment = match.group(1)
+        behaviour = self.deployments.get(deployment, self.default)
+        self.requests[deployment] += 1
+        if behaviour.max_concurrency and self._active[deployment] >= behaviour.max_concurrency:
+            self.throttled[deployment] += 1
+            await self._send_json(writer, 429, {"error": {"code": "429", "message": "Rate limit exceeded"}},
+                                  {"retry-after-ms": "1000", "retry-after": "1"})
+            return
+        self._active[deployment] += 1
+        try:
+            await self._answer(writer, deployment, behaviour, body)
+        finally:
+            self._active[deployment] -= 1
+
+    async def _answer(self, writer: asyncio.StreamWriter, deployment: str, behaviour: Behaviour, body: bytes) -> None:
+        delay = behaviour.latency_ms + behaviour.load_latency_ms * (self._active[deployment] - 1)
+        if self._random.random() < behaviour.slow_rate:
+            delay += behaviour.slow_ms
+        await asyncio.sleep(delay / 1000)
+
+        if self._random.random() < behaviour.error_rate:
+            self.errors[deployment] += 1
+            headers = {}
+            if behaviour.retry_after is not None:
+                headers["retry-after-ms"] = str(int(behaviour.retry_after * 1000))
+                headers["retry-after"] = str(max(1, round(behaviour.retry_after)))
+            await self._send_json(writer, behaviour.error_status, {
+                "error": {"code": str(behaviour.error_status), "message": "Injected failure"}
+            }, headers)
+            return
+
+        payload = json.loads(body or b"{}")
+        recording = load_recording(behaviour.replay) if behaviour.replay else None
+        answer = recording.answer if recording is not None else behaviour.answer
+        usage = {"prompt_tokens": behaviour.prompt_tokens, "completion_tokens": len(answer) // 4,
+                 "total_tokens": behaviour.prompt_tokens + len(answer) // 4}
+        if recording is not None and recording.usage:
+            usage = recording.usage
+        if not payload.get("stream"):
+            message = {"role": "assistant", "content": answer}
+            if recording is not None and recording.context:
+                message["context"] = recording.context
+            if behaviour.tokens_per_second:
+                # The whole answer is generated before a non-streamed response is sent
+                await asyncio.sleep(usage["completion_tokens"] / behaviour.tokens_per_second)
+            await self._send_json(writer, 200, {
+                "choices": [{"index": 0, "message": message, "finish_reason": "stop"}],
+                "usage": usage,
+            })
+            return
+
+        writer.write(b"HTTP/1.1 200 OK\r\ncontent-type: text/event-stream\r\ntransfer-encoding: chunked\r\n\r\n")
+        if recording is not None:
+            # Recorded usage chunks are dropped and resent below only when this request asks for them
+            events = [(data, content) for data, content in recording.events if content or b'"usage"' not in data]
+        else:
+            events = [(json.dumps({"choices": [{"index": 0, "delta": {"role": "assistant"}}]}).encode(), "")]
+            for i in range(0, len(answer), behaviour.chunk_chars):
+                piece = answer[i:i + behaviour.chunk_chars]
+                events.append((json.dumps({"choices": [{"index": 0, "delta": {"content": piece}}]}).encode(), piece))
+            events.append((json.dumps({"choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}).encode(), ""))
+        if (payload.get("stream_options") or {}).get("include_usage"):
+            # Like Azure: usage only when requested, on a last chunk with no choices
+            events.append((json.dumps({"choices": [], "usage": usage}).encode(), ""))
+        for data, content in events:
+            _write_chunk(writer, b"data: " + data + b"\n\n")
+            await writer.drain()
+            if behaviour.tokens_per_second:
+                if content:
+                    await asyncio.sleep(max(1.0, len(content) / 4) / behaviour.tokens_per_second)
+            elif behaviour.chunk_interval_ms:
+                await asyncio.sleep(behaviour.chunk_interval_ms / 1000)
+        _write_chunk(writer, b"data: [DONE]\n\n")
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+    async def _send_json(self, writer: asyncio.StreamWriter, status: int, payload: dict,
+                         headers: Optional[Dict[str, str]] = None) -> None:
+        body = json.dumps(payload).encode()
+        lines = [f"HTTP/1.1 {status} {HTTPStatus(status).phrase}", "content-type: application/json",
+                 f"content-length: {len(body)}"]
+        lines += [f"{name}: {value}" for name, value in (headers or {}).items()]
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode() + body)
+        await writer.drain()
+
+
+def _write_chunk(writer: asyncio.StreamWriter, data: bytes) -> None:
+    writer.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--latency-ms", type=float, default=Behaviour.latency_ms)
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="fraction of requests that are slow")
+    parser.add_argument("--slow-ms", type=float, default=0.0, help="extra latency of a slow request")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", type=int, default=Behaviour.error_status)
+    parser.add_argument("--retry-after", type=float, default=None, help="seconds sent with injected errors")
+    parser.add_argument("--max-concurrency", type=int, default=0, help="throttle requests beyond this many at once")
+    parser.add_argument("--tokens-per-second", type=float, default=0.0, help="pace streamed answers to this rate")
+    parser.add_argument("--replay", default=None, help="recorded Azure SSE stream to answer with")
+    parser.add_argument("--deployment", action="append", default=[],
+                        help="per-deployment behaviour: name:latency_ms[:error_rate[:error_status[:retry_after]]]")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    default = Behaviour(latency_ms=args.latency_ms, slow_rate=args.slow_rate, slow_ms=args.slow_ms,
+                        error_rate=args.error_rate, error_status=args.error_status, retry_after=args.retry_after,
+                        max_concurrency=args.max_concurrency, tokens_per_second=args.tokens_per_second,
+                        replay=args.replay)
+    deployments = dict(Behaviour.parse(spec, default) for spec in args.deployment)
+
+    async def serve():
+        server = await FakeAzure(default, deployments, args.seed).start(args.host, args.port)
+        print(f"fake Azure OpenAI listening on {server.endpoint}")
+        await asyncio.Event().wait()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+"""An in-process stand-in for the MySQL server, for benchmarks that run without Docker.
+
+``FakeMySQL.connect`` has the signature of ``mysql.connector.connect`` and
+is handed to ``db.MySQLPool`` (its ``connect`` argument). Connections
+answer the statements the backend issues against ``people`` and the plan
+data tables (schema/plan_data.sql), after a configurable connect and query
+latency; the sleeps happen on the pool's executor threads, like real
+network round trips. Anything else raises ``ProgrammingError``.
+
+    mysql = FakeMySQL(connect_ms=3, query_ms=0.5)
+    member_ids = mysql.seed_people(1000, "bench@123")
+    pool = MySQLPool(db_config, connect=mysql.connect)
+"""
+import re
+import threading
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from mysql.connector.errors import ProgrammingError
+
+ROLES = ("agent", "payer", "member")
+
+_SELECT_PERSON = re.compile(r"^\s*SELECT\s+(?P<columns>.+?)\s+FROM\s+people\s+WHERE\s+member_id\s*=\s*%s\s*$",
+                            re.IGNORECASE | re.DOTALL)
+_UPDATE_HASH = re.compile(r"^\s*UPDATE\s+people\s+SET\s+password_hash\s*=\s*%s\s+WHERE\s+member_id\s*=\s*%s\s*$",
+                          re.IGNORECASE)
+_PLAN_TABLES = re.compile(r"\bFROM\s+(plans|formulary|providers|provider_networks)\b", re.IGNORECASE)
+
+
+class FakeMySQL:
+    """Holds the ``people`` rows and counts connects and statements across all connections."""
+
+    def __init__(self, connect_ms: float = 2.0, query_ms: float = 0.5):
+        self.connect_ms = connect_ms
+        self.query_ms = query_ms
+        self.people: Dict[str, Dict[str, Any]] = {}
+        # Plan data tables; empty unless a benchmark fills them
+        self.tables: Dict[str, List[Dict[str, Any]]] = {
+            "plans": [], "formulary": [], "providers": [], "provider_networks": []
+        }
+        self.connects = 0
+        self.statements = 0
+        self._lock = threading.Lock()
+
+    def seed_people(self, count: int, password: str, first_id: int = 10001,
+                    password_hash: Optional[str] = None) -> List[str]:
+        """Add ``count`` people sharing one password; returns their member ids.
+
+        The hash is computed once with the configured KDF (or passed in), so
+        seeding thousands of people stays fast while logins still pay for a
+        full verification.
+        """
+        if password_hash is None:
+            from auth.passwords import hash_password
+            password_hash = hash_password(password)
+        member_ids = []
+        for i in range(count):
+            member_id = str(first_id + i)
+            self.people[member_id] = {
+                "member_id": member_id,
+                "role": ROLES[i % len(ROLES)],
+                "name": f"Bench User {member_id}",
+                "password_hash": password_hash,
+            }
+            member_ids.append(member_id)
+        return member_ids
+
+    def connect(self, **config: Any) -> "FakeConnection":
+        if self.connect_ms:
+            time.sleep(self.connect_ms / 1000)
+        with self._lock:
+            self.connects += 1
+        return FakeConnection(self)
+
+    def execute(self, query: str, params: Sequence[Any]) -> Tuple[List[Dict[str, Any]], int]:
+        """Run one statement; returns its rows and affected row count."""
+        if self.query_ms:
+            time.sleep(self.query_ms / 1000)
+        with self._lock:
+            self.statements += 1
+
+        match = _SELECT_PERSON.match(query)
+        if match:
+            person = self.people.get(str(params[0]))
+            if person is None:
+                return [], 0
+            columns = [column.strip() for column in match.group("columns").split(",")]
+            if columns == ["*"]:
+                return [dict(person)], 0
+            return [{column: person.get(column) for column in columns}], 0
+
+        if _UPDATE_HASH.match(query):
+            person = self.people.get(str(params[1]))
+            if person is None:
+                return [], 0
+            person["password_hash"] = params[0]
+            return [], 1
+
+        match = _PLAN_TABLES.search(query)
+        if match:
+            return [dict(row) for row in self.tables[match.group(1).lower()]], 0
+
+        raise ProgrammingError(msg=f"FakeMySQL does not support: {query}")
+
+    def metrics(self) -> Dict[str, Any]:
+        return {"people": len(self.people), "connects": self.connects, "statements": self.statements}
+
+
+class FakeConnection:
+    def __init__(self, server: FakeMySQL):
+        self.server = server
+        self.open = True
+
+    def cursor(self, dictionary: bool = False) -> "FakeCursor":
+        return FakeCursor(self.server, dictionary)
+
+    def ping(self, reconnect: bool = False) -> None:
+        if not self.open:
+            raise ProgrammingError(msg="Connection is closed")
+
+    def is_connected(self) -> bool:
+        return self.open
+
+    def commit(self) -> None:
+        pass
+
+    def rollback(self) -> None:
+        pass
+
+    def close(self) -> None:
+        self.open = False
+
+
+class FakeCursor:
+    def __init__(self, server: FakeMySQL, dictionary: bool):
+        self.server = server
+        self.dictionary = dictionary
+        self.rowcount = -1
+        self._rows: List[Dict[str, Any]] = []
+
+    def execute(self, query: str, params: Sequence[Any] = ()) -> None:
+        self._rows, self.rowcount = self.server.execute(query, params)
+
+    def fetchone(self) -> Any:
+        if not self._rows:
+            return None
+        row = self._rows.pop(0)
+        return row if self.dictionary else tuple(row.values())
+
+    def fetchall(self) -> List[Any]:
+        rows, self._rows = self._rows, []
+        return rows if self.dictionary else [tuple(row.values()) for row in rows]
+
+    def close(self) -> None:
+        self._rows = []
@@ -0,0 +1,533 @@
+#!/usr/bin/env python3
+"""Load-test the backend with login storms, profile polling and concurrent chat streams.
+
+By default everything runs on this box without Azure or MySQL: the fake
+Azure server (benchmarks/fake_azure.py) replays the recorded plan
+comparison stream at ``--tokens-per-second``, and each of ``--workers``
+worker processes builds the app with create_app(), its database pool on
+benchmarks/fake_mysql.py, runs its lifespan and drives the ASGI app
+directly with its share of the load (no sockets, so the numbers are the
+app's own cost plus the load generator's). ``--target`` points the same
+scenarios at a running server instead; its ``people`` table must hold the
+bench users (``--first-member-id``, ``--users``, ``--password``), and
+``--server-pid`` reads its workers' memory.
+
+Reports throughput, p50/p95/p99 latency, time to first token for streams,
+status counts and resident memory per worker. ``--save`` writes the results
+as a JSON baseline; ``--compare`` checks a run against one and exits 1 when
+a metric regressed by more than ``--tolerance``.
+
+    python benchmarks/loadtest.py --save benchmarks/baselines/loadtest.json
+    python benchmarks/loadtest.py --scenario concurrent_streams --workers 2 --clients 64
+    python benchmarks/loadtest.py --compare benchmarks/baselines/loadtest.json
+    python benchmarks/loadtest.py --target http://127.0.0.1:8000 --server-pid 4242 --scenario profile_polling
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+BACKEND = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from fake_azure import Behaviour, FakeAzure  # noqa: E402
+
+SCENARIOS = ("login_storm", "profile_polling", "concurrent_streams")
+DEFAULT_REQUESTS = {"login_storm": 300, "profile_polling": 5000, "concurrent_streams": 200}
+RECORDING = BACKEND / "benchmarks" / "fixtures" / "azure_stream_plan_comparison.sse"
+CONTENT_EVENT = b'"type":"content"'
+ERROR_EVENT = b'"type":"error"'
+QUESTIONS = (
+    "Compare the Medicare Advantage PPO plans in Maricopa County",
+    "Which plans cover Eliquis and what is the copay?",
+    "What is the out-of-pocket maximum for the Cigna Preferred Medicare PPO?",
+    "Is a cardiologist in network for the Aetna Value PPO?",
+    "Which HMO plans have a $0 premium and dental coverage?",
+)
+# Environment a worker's app starts with, unless already set
+WORKER_ENV = {
+    "SECRET_KEY": "loadtest-secret",
+    "JWT_ALGORITHM": "HS256",
+    "ACCESS_TOKEN_EXPIRES_MIN": "60",
+    "DB_HOST": "fake-mysql",
+    "DB_NAME": "planshopper",
+    "DB_USER": "bench",
+    "DB_PASSWORD": "bench",
+    "AZURE_OPENAI_API_KEY": "bench",
+    "AZURE_OPENAI_DEPLOYMENT": "gpt-4o",
+    "AZURE_SEARCH_ENDPOINT": "https://search.invalid",
+    "AZURE_SEARCH_INDEX": "plans",
+    "AZURE_SEARCH_API_KEY": "bench",
+    # fake_mysql answers the plan data tables, so startup and chat include the plan data path
+    "PLAN_DATA_SOURCE": "mysql",
+}
+
+
+@dataclass
+class Sample:
+    status: int = 0
+    total_ms: float = 0.0
+    ttft_ms: Optional[float] = None
+    body: List[bytes] = field(default_factory=list)
+
+    def json(self) -> Any:
+        return json.loads(b"".join(self.body) or b"null")
+
+
+class ASGIClient:
+    """Sends requests straight into an ASGI app, timing the response as it is sent."""
+
+    def __init__(self, app: Any):
+        self.app = app
+
+    async def request(self, method: str, path: str, body: Any = None, headers: Optional[Dict[str, str]] = None,
+                      client_ip: str = "127.0.0.1") -> Sample:
+        payload = json.dumps(body).encode() if body is not None else b""
+        raw_headers = [(b"host", b"loadtest"), (b"content-length", str(len(payload)).encode())]
+        if body is not None:
+            raw_headers.append((b"content-type", b"application/json"))
+        raw_headers += [(name.lower().encode(), value.encode()) for name, value in (headers or {}).items()]
+        scope = {
+            "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": method, "scheme": "http",
+            "path": path, "raw_path": path.encode(), "query_string": b"", "root_path": "", "headers": raw_headers,
+            "client": (client_ip, 40000), "server": ("loadtest", 80),
+        }
+        finished = asyncio.Event()
+        request_sent = False
+        sample = Sample()
+        started = time.perf_counter()
+
+        async def receive() -> Dict[str, Any]:
+            nonlocal request_sent
+            if not request_sent:
+                request_sent = True
+                return {"type": "http.request", "body": payload, "more_body": False}
+            # Streaming responses listen for a disconnect until they finish
+            await finished.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message: Dict[str, Any]) -> None:
+            if message["type"] == "http.response.start":
+                sample.status = message["status"]
+            elif message["type"] == "http.response.body":
+                chunk = message.get("body", b"")
+                if sample.ttft_ms is None and CONTENT_EVENT in chunk:
+                    sample.ttft_ms = (time.perf_counter() - started) * 1000
+                sample.body.append(chunk)
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            finished.set()
+        sample.total_ms = (time.perf_counter() - started) * 1000
+        return sample
+
+
+class HTTPClient:
+    """The same interface over real HTTP, for ``--target``; every request comes from this host's address."""
+
+    def __init__(self, base_url: str, connections: int):
+        import httpx
+        self._client = httpx.AsyncClient(base_url=base_url, timeout=120.0,
+                                         limits=httpx.Limits(max_connections=connections,
+                                                             max_keepalive_connections=connections))
+
+    async def request(self, method: str, path: str, body: Any = None, headers: Optional[Dict[str, str]] = None,
+                      client_ip: str = "127.0.0.1") -> Sample:
+        sample = Sample()
+        started = time.perf_counter()
+        async with self._client.stream(method, path, json=body, headers=headers) as response:
+            sample.status = response.status_code
+            async for chunk in response.aiter_raw():
+                if sample.ttft_ms is None and CONTENT_EVENT in chunk:
+                    sample.ttft_ms = (time.perf_counter() - started) * 1000
+                sample.body.append(chunk)
+        sample.total_ms = (time.perf_counter() - started) * 1000
+        return sample
+
+    async def close(self) -> None:
+        await self._client.aclose()
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies: List[float] = []
+        self.ttft: List[float] = []
+        self.statuses: Counter = Counter()
+        self.errors = 0
+
+    def add(self, sample: Sample, ok: bool) -> None:
+        self.latencies.append(round(sample.total_ms, 3))
+        if sample.ttft_ms is not None:
+            self.ttft.append(round(sample.ttft_ms, 3))
+        self.statuses[str(sample.status)] += 1
+        self.errors += not ok
+
+
+def client_ip(index: int) -> str:
+    # One address per virtual client, as in a storm from many machines
+    return f"10.{index // 62500 % 256}.{index // 250 % 250}.{index % 250 + 1}"
+
+
+async def run_clients(clients: int, work) -> None:
+    await asyncio.gather(*(work(i) for i in range(clients)))
+
+
+async def login_storm(client, member_ids: List[str], config: Dict[str, Any], recorder: Recorder) -> None:
+    """Every request logs a different bench user in; ``bad_password_rate`` of them with a wrong password."""
+    rng = random.Random(config["seed"] + config["worker"])
+    offset = config["worker"] * config["requests"]
+    plan = iter([(member_ids[(offset + i) % len(member_ids)], rng.random() < config["bad_password_rate"])
+                 for i in range(config["requests"])])
+
+    async def virtual_client(index: int) -> None:
+        ip = client_ip(config["worker"] * config["clients"] + index)
+        for member_id, wrong in plan:
+            sample = await client.request("POST", "/auth/login", {
+                "memberId": member_id, "password": "wrong-password" if wrong else config["password"]
+            }, client_ip=ip)
+            recorder.add(sample, sample.status == (401 if wrong else 200))
+
+    await run_clients(config["clients"], virtual_client)
+
+
+async def login_tokens(client, member_ids: List[str], config: Dict[str, Any]) -> List[str]:
+    tokens = []
+    for index in range(config["clients"]):
+        member_id = member_ids[(config["worker"] * config["clients"] + index) % len(member_ids)]
+        sample = await client.request("POST", "/auth/login", {"memberId": member_id, "password": config["password"]},
+                                      client_ip=client_ip(index))
+        if sample.status != 200:
+            raise RuntimeError(f"Logging {member_id} in for profile polling failed with {sample.status}")
+        tokens.append(sample.json()["token"])
+    return tokens
+
+
+async def profile_polling(client, member_ids: List[str], config: Dict[str, Any], recorder: Recorder,
+                          tokens: List[str]) -> None:
+    """Signed-in clients poll their profile, ``poll_interval_ms`` apart."""
+    remaining = iter(range(config["requests"]))
+
+    async def virtual_client(index: int) -> None:
+        headers = {"Authorization": f"Bearer {tokens[index]}"}
+        for _ in remaining:
+            sample = await client.request("GET", "/auth/profile", headers=headers)
+            recorder.add(sample, sample.status == 200)
+            if config["poll_interval_ms"]:
+                await asyncio.sleep(config["poll_interval_ms"] / 1000)
+
+    await run_clients(config["clients"], virtual_client)
+
+
+async def concurrent_streams(client, member_ids: List[str], config: Dict[str, Any], recorder: Recorder) -> None:
+    """Concurrent chat streams; each question is unique (a cache miss) unless ``repeat_questions``."""
+    remaining = iter(range(config["requests"]))
+
+    async def virtual_client(index: int) -> None:
+        for n in remaining:
+            question = QUESTIONS[n % len(QUESTIONS)]
+            if not config["repeat_questions"]:
+                question = f"{question} (request {config['worker']}-{n})"
+            sample = await client.request("POST", "/api/chat/stream", {
+                "message": question, "session_id": f"loadtest-session-{config['worker']}-{index}-{n}"
+            })
+            recorder.add(sample, sample.status == 200 and sample.ttft_ms is not None
+                         and not any(ERROR_EVENT in chunk for chunk in sample.body))
+
+    await run_clients(config["clients"], virtual_client)
+
+
+def memory_mb(pid: str = "self") -> Dict[str, Optional[float]]:
+    """Resident and peak resident memory from /proc, in MB."""
+    values = {}
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                name, _, value = line.partition(":")
+                if name in ("VmRSS", "VmHWM"):
+                    values[name] = round(int(value.split()[0]) / 1024, 1)
+    except OSError:
+        pass
+    if pid == "self" and "VmHWM" not in values:
+        # ru_maxrss is in KB on Linux
+        values["VmHWM"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    return {"rss": values.get("VmRSS"), "peak": values.get("VmHWM")}
+
+
+async def drive(client, scenario: str, member_ids: List[str], config: Dict[str, Any]) -> Dict[str, Any]:
+    recorder = Recorder()
+    tokens = await login_tokens(client, member_ids, config) if scenario == "profile_polling" else None
+    started_at = time.time()
+    started = time.perf_counter()
+    if scenario == "login_storm":
+        await login_storm(client, member_ids, config, recorder)
+    elif scenario == "profile_polling":
+        await profile_polling(client, member_ids, config, recorder, tokens)
+    else:
+        await concurrent_streams(client, member_ids, config, recorder)
+    return {
+        "started_at": started_at,
+        "elapsed": time.perf_counter() - started,
+        "latencies_ms": recorder.latencies,
+        "ttft_ms": recorder.ttft,
+        "statuses": dict(recorder.statuses),
+        "errors": recorder.errors,
+    }
+
+
+async def worker_main(config: Dict[str, Any]) -> Dict[str, Any]:
+    """One in-process worker: the real app on fake MySQL, pointed at the parent's fake Azure."""
+    for name, value in WORKER_ENV.items():
+        os.environ.setdefault(name, value)
+    os.environ["AZURE_OPENAI_ENDPOINT"] = config["azure_endpoint"]
+    logging.getLogger("planshopper_bot").setLevel(logging.ERROR)
+
+    from fake_mysql import FakeMySQL
+    import fastapi_backend
+    from app import create_app
+
+    mysql = FakeMySQL(connect_ms=config["db_connect_ms"], query_ms=config["db_query_ms"])
+    member_ids = mysql.seed_people(config["users"], config["password"], config["first_member_id"])
+    fastapi_backend.db_pool._connect = mysql.connect
+    app = create_app()
+    async with app.router.lifespan_context(app):
+        memory_start = memory_mb()
+        report = await drive(ASGIClient(app), config["scenario"], member_ids, config)
+    report["memory_mb"] = {"start": memory_start["rss"], "end": memory_mb()["rss"], "peak": memory_mb()["peak"]}
+    report["db"] = mysql.metrics()
+    return report
+
+
+async def spawn_worker(config: Dict[str, Any]) -> Dict[str, Any]:
+    process = await asyncio.create_subprocess_exec(
+        sys.executable, __file__, "--worker-config", json.dumps(config),
+        stdout=asyncio.subprocess.PIPE, cwd=str(BACKEND))
+    stdout, _ = await process.communicate()
+    if process.returncode != 0:
+        raise RuntimeError(f"Worker {config['worker']} exited with {process.returncode}")
+    return json.loads(stdout.decode().strip().splitlines()[-1])
+
+
+def percentiles(values: List[float]) -> Optional[Dict[str, float]]:
+    if not values:
+        return None
+    ordered = sorted(values)
+
+    def at(fraction: float) -> float:
+        return round(ordered[min(len(ordered) - 1, int(len(ordered) * fraction))], 2)
+
+    return {"p50": at(0.5), "p95": at(0.95), "p99": at(0.99), "mean": round(sum(ordered) / len(ordered), 2)}
+
+
+def summarize(reports: List[Dict[str, Any]], upstream_requests: Optional[int]) -> Dict[str, Any]:
+    latencies = [value for report in reports for value in report["latencies_ms"]]
+    ttft = [value for report in reports for value in report["ttft_ms"]]
+    statuses: Counter = Counter()
+    for report in reports:
+        statuses.update(report["statuses"])
+    requests = len(latencies)
+    errors = sum(report["errors"] for report in reports)
+    wall = max(report["started_at"] + report["elapsed"] for report in reports) - min(
+        report["started_at"] for report in reports)
+    memory = [report["memory_mb"] for report in reports if report.get("memory_mb")]
+    peaks = [worker["peak"] for worker in memory if worker.get("peak") is not None]
+    return {
+        "requests": requests,
+        "errors": errors,
+        "error_rate": round(errors / requests, 4) if requests else 0.0,
+        "throughput_rps": round(requests / wall, 2) if wall > 0 else 0.0,
+        "latency_ms": percentiles(latencies),
+        "ttft_ms": percentiles(ttft),
+        "statuses": dict(sorted(statuses.items())),
+        "memory_mb": {"per_worker": memory, "max_peak": max(peaks) if peaks else None},
+        "upstream_requests": upstream_requests,
+    }
+
+
+def print_summary(scenario: str, summary: Dict[str, Any]) -> None:
+    latency, ttft = summary["latency_ms"] or {}, summary["ttft_ms"]
+    line = (f"{scenario:20s} {summary['requests']:6d} {summary['error_rate']:7.1%} {summary['throughput_rps']:8.1f} "
+            f"{latency.get('p50', 0):8.1f} {latency.get('p95', 0):8.1f} {latency.get('p99', 0):8.1f}")
+    line += f" {ttft['p50']:8.1f} {ttft['p95']:8.1f}" if ttft else f" {'-':>8s} {'-':>8s}"
+    peak = summary["memory_mb"]["max_peak"]
+    line += f" {peak:8.1f}" if peak is not None else f" {'-':>8s}"
+    print(line + f"  {summary['statuses']}")
+
+
+# (path, lower is better); relative changes beyond the tolerance are regressions
+COMPARED_METRICS = (
+    (("throughput_rps",), False),
+    (("latency_ms", "p50"), True),
+    (("latency_ms", "p95"), True),
+    (("latency_ms", "p99"), True),
+    (("ttft_ms", "p50"), True),
+    (("ttft_ms", "p95"), True),
+    (("memory_mb", "max_peak"), True),
+)
+
+
+def _lookup(summary: Dict[str, Any], path) -> Optional[float]:
+    for key in path:
+        if not isinstance(summary, dict):
+            return None
+        summary = summary.get(key)
+    return summary
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    regressions = []
+    print(f"\ncompared with the baseline from {baseline['meta']['created']} (tolerance {tolerance:.0%})")
+    for scenario, summary in results["scenarios"].items():
+        previous = baseline["scenarios"].get(scenario)
+        if previous is None:
+            print(f"  {scenario}: not in the baseline")
+            continue
+        if summary["error_rate"] > previous["error_rate"] + 0.01:
+            regressions.append(f"{scenario} error_rate {previous['error_rate']:.2%} -> {summary['error_rate']:.2%}")
+        for path, lower_is_better in COMPARED_METRICS:
+            old, new = _lookup(previous, path), _lookup(summary, path)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            worse = change > tolerance if lower_is_better else change < -tolerance
+            name = ".".join(path)
+            print(f"  {scenario:20s} {name:18s} {old:10.2f} -> {new:10.2f} {change:+7.1%}{'  REGRESSION' if worse else ''}")
+            if worse:
+                regressions.append(f"{scenario} {name} {old:.2f} -> {new:.2f} ({change:+.1%})")
+    return regressions
+
+
+def _relative(path: Path) -> str:
+    try:
+        return str(path.resolve().relative_to(BACKEND))
+    except ValueError:
+        return str(path)
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=str(BACKEND), capture_output=True,
+                              text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+async def main_async(args) -> Dict[str, Any]:
+    server = None
+    if args.target is None:
+        behaviour = Behaviour(latency_ms=args.azure_latency_ms, tokens_per_second=args.tokens_per_second,
+                              replay=str(args.replay) if args.replay else None)
+        server = await FakeAzure(behaviour, seed=args.seed).start()
+
+    print(f"{'scenario':20s} {'reqs':>6s} {'errors':>7s} {'req/s':>8s} {'p50 ms':>8s} {'p95 ms':>8s} {'p99 ms':>8s} "
+          f"{'ttft p50':>8s} {'ttft p95':>8s} {'peak MB':>8s}  statuses")
+    results = {"scenarios": {}}
+    for scenario in args.scenario or SCENARIOS:
+        requests = args.requests or DEFAULT_REQUESTS[scenario]
+        config = {
+            "scenario": scenario, "seed": args.seed, "users": args.users, "password": args.password,
+            "first_member_id": args.first_member_id, "bad_password_rate": args.bad_password_rate,
+            "poll_interval_ms": args.poll_interval_ms, "repeat_questions": args.repeat_questions,
+            "db_connect_ms": args.db_connect_ms, "db_query_ms": args.db_query_ms,
+            "requests": requests // args.workers, "clients": max(1, args.clients // args.workers),
+        }
+        if server is not None:
+            server.requests.clear()
+            config["azure_endpoint"] = server.endpoint
+            reports = await asyncio.gather(*(spawn_worker({**config, "worker": worker})
+                                             for worker in range(args.workers)))
+            upstream_requests = sum(server.requests.values())
+        else:
+            client = HTTPClient(args.target, args.clients)
+            member_ids = [str(args.first_member_id + i) for i in range(args.users)]
+            try:
+                report = await drive(client, scenario, member_ids, {**config, "worker": 0,
+                                                                    "requests": requests, "clients": args.clients})
+            finally:
+                await client.close()
+            report["memory_mb"] = None
+            reports = [report]
+            upstream_requests = None
+        summary = summarize(reports, upstream_requests)
+        if args.server_pid:
+            summary["memory_mb"] = {"per_worker": [memory_mb(pid) for pid in args.server_pid], "max_peak": None}
+            peaks = [worker["peak"] for worker in summary["memory_mb"]["per_worker"] if worker["peak"] is not None]
+            summary["memory_mb"]["max_peak"] = max(peaks) if peaks else None
+        results["scenarios"][scenario] = summary
+        print_summary(scenario, summary)
+
+    if server is not None:
+        await server.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenario", action="append", choices=SCENARIOS, help="repeatable; default: all")
+    parser.add_argument("--workers", type=int, default=1, help="in-process worker processes sharing the load")
+    parser.add_argument("--clients", type=int, default=32, help="concurrent virtual clients, across all workers")
+    parser.add_argument("--requests", type=int, default=None,
+                        help=f"requests per scenario (default: {DEFAULT_REQUESTS})")
+    parser.add_argument("--users", type=int, default=2000, help="bench users in `people`")
+    parser.add_argument("--first-member-id", type=int, default=900001)
+    parser.add_argument("--password", default="loadtest@123")
+    parser.add_argument("--bad-password-rate", type=float, default=0.05)
+    parser.add_argument("--poll-interval-ms", type=float, default=0.0)
+    parser.add_argument("--repeat-questions", action="store_true", help="reuse a few questions (cache hits)")
+    parser.add_argument("--azure-latency-ms", type=float, default=150.0, help="fake Azure time to headers")
+    parser.add_argument("--tokens-per-second", type=float, default=400.0,
+                        help="fake Azure generation rate (the recorded answer is ~900 tokens)")
+    parser.add_argument("--replay", type=Path, default=RECORDING, help="recorded stream the fake Azure replays")
+    parser.add_argument("--db-connect-ms", type=float, default=2.0)
+    parser.add_argument("--db-query-ms", type=float, default=0.5)
+    parser.add_argument("--target", default=None, help="base URL of a running server to test instead")
+    parser.add_argument("--server-pid", action="append", default=[], help="server worker pid, for its memory")
+    parser.add_argument("--save", type=Path, default=None, help="write the results as a JSON baseline")
+    parser.add_argument("--compare", type=Path, default=None, help="baseline to check this run against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative regression")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--worker-config", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker_config is not None:
+        print(json.dumps(asyncio.run(worker_main(json.loads(args.worker_config)))))
+        return
+
+    results = asyncio.run(main_async(args))
+    results["meta"] = {
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "mode": "target" if args.target else "in-process",
+        "args": {key: (_relative(value) if isinstance(value, Path) else value) for key, value in vars(args).items()
+                 if key not in ("save", "compare", "worker_config")},
+    }
+    if args.save is not None:
+        args.save.parent.mkdir(parents=True, exist_ok=True)
+        args.save.write_text(json.dumps(results, indent=2) + "\n")
+        print(f"\nsaved {args.save}")
+    if args.compare is not None:
+        regressions = compare(results, json.loads(args.compare.read_text()), args.tolerance)
+        if regressions:
+            print("\nregressions:\n  " + "\n  ".join(regressions))
+            sys.exit(1)
+        print("\nno regressions")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+import asyncio
+import contextvars
+import functools
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, Deque, Dict, Optional, Tuple, TypeVar
+
+import mysql.connector
+from mysql.connector import Error
+
+from planshopper_bot.services.telemetry import get_telemetry
+
+T = TypeVar("T")
+
+
+class DatabaseConnectionError(Exception):
+    """Raised when a new MySQL connection cannot be opened."""
+
+
+class PoolTimeoutError(Exception):
+    """Raised when no pooled connection frees up within the acquire timeout."""
+
+
+@dataclass(frozen=True)
+class DBPoolConfig:
+    min_size: int = 2
+    max_size: int = 10
+    acquire_timeout: float = 5.0
+    recycle_seconds: float = 1800.0
+    # Ping a borrowed connection only if it sat idle longer than this; 0 pings on every borrow
+    health_check_idle_seconds: float = 0.0
+
+    @classmethod
+    def from_env(cls) -> "DBPoolConfig":
+        return cls(
+            min_size=int(os.getenv("DB_POOL_MIN_SIZE", cls.min_size)),
+            max_size=int(os.getenv("DB_POOL_MAX_SIZE", cls.max_size)),
+            acquire_timeout=float(os.getenv("DB_POOL_ACQUIRE_TIMEOUT", cls.acquire_timeout)),
+            recycle_seconds=float(os.getenv("DB_POOL_RECYCLE_SECONDS", cls.recycle_seconds)),
+            health_check_idle_seconds=float(os.getenv("DB_POOL_HEALTH_CHECK_IDLE_SECONDS", cls.health_check_idle_seconds)),
+        )
+
+
+class MySQLPool:
+    """Bounded MySQL connection pool for async handlers.
+
+    mysql-connector is blocking, so every database call runs on a private
+    executor with exactly ``max_size`` threads; an asyncio semaphore with the
+    same size gates admission, so a handler waits on the event loop (up to
+    ``acquire_timeout``) instead of occupying one of AnyIO's worker threads.
+    Connections older than ``recycle_seconds`` are replaced and idle ones are
+    pinged on borrow before being handed out.
+    """
+
+    def __init__(self, db_config: Dict[str, Any], config: Optional[DBPoolConfig] = None,
+                 connect: Callable[..., Any] = mysql.connector.connect):
+        self.db_config = db_config
+        self.config = config or DBPoolConfig.from_env()
+        self._connect = connect
+        self._idle: Deque[Tuple[Any, float, float]] = deque()
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._size = 0
+        self._in_use = 0
+        self._waiting = 0
+        self.acquires = 0
+        self.acquire_timeouts = 0
+        self.connections_created = 0
+        self.connections_recycled = 0
+        self.health_check_failures = 0
+        self._wait_seconds_total = 0.0
+
+    async def start(self) -> None:
+        if self._executor is not None:
+            return
+        self._executor = ThreadPoolExecutor(max_workers=self.config.max_size, thread_name_prefix="mysql-pool")
+        self._slots = asyncio.Semaphore(self.config.max_size)
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(self._executor, self._fill_min_size)
+        except DatabaseConnectionError as e:
+            # Keep serving; connections are opened lazily once MySQL is reachable
+            print(f"Database connection error: {e}")
+
+    async def close(self) -> None:
+        if self._executor is None:
+            return
+        # Drain: wait for borrowed connections to come back before closing them
+        deadline = time.monotonic() + self.config.acquire_timeout
+        while self._in_use and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        with self._lock:
+            idle = list(self._idle)
+            self._idle.clear()
+            executor, self._executor = self._executor, None
+        for connection, _, _ in idle:
+            self._discard(connection)
+        executor.shutdown(wait=False)
+        self._slots = None
+
+    async def run(self, fn: Callable[..., T], *args: Any) -> T:
+        """Borrow a connection, call ``fn(connection, *args)`` on the pool executor and return the result."""
+        if self._executor is None or self._slots is None:
+            raise RuntimeError("Database pool is not started")
+
+        telemetry = get_telemetry()
+        started = time.perf_counter()
+        self._waiting += 1
+        try:
+            with telemetry.span("db.pool_wait"):
+                await asyncio.wait_for(self._slots.acquire(), timeout=self.config.acquire_timeout)
+        except asyncio.TimeoutError:
+            self.acquire_timeouts += 1
+            raise PoolTimeoutError("Timed out waiting for a database connection")
+        finally:
+            self._waiting -= 1
+            waited = time.perf_counter() - started
+            self._wait_seconds_total += waited
+            telemetry.db_pool_wait.observe(waited)
+
+        self.acquires += 1
+        self._in_use += 1
+        try:
+            loop = asyncio.get_running_loop()
+            # The executor thread runs in a copy of the caller's context so its spans join the request's trace
+            context = contextvars.copy_context()
+            future = loop.run_in_executor(self._executor, context.run, self._run_sync, fn, args)
+        except BaseException:
+            self._release_slot(self._slots)
+            raise
+        # A cancelled caller stops waiting, but the slot is held until the thread is done with the connection.
+        # The semaphore is bound now: a query still running when the pool closes releases the one it came from
+        future.add_done_callback(functools.partial(self._release_slot, self._slots))
+        return await asyncio.shield(future)
+
+    def _release_slot(self, slots: asyncio.Semaphore, future: Optional[asyncio.Future] = None) -> None:
+        if future is not None and not future.cancelled():
+            # Retrieved here so a query whose caller went away does not log "exception was never retrieved"
+            future.exception()
+        self._in_use -= 1
+        slots.release()
+
+    def _run_sync(self, fn: Callable[..., T], args: Tuple[Any, ...]) -> T:
+        connection, created_at = self._checkout()
+        try:
+            with get_telemetry().span("db.query", {"db.operation": fn.__name__}):
+                result = fn(connection, *args)
+        except Error:
+            # The connection state is unknown after a driver error; never reuse it
+            self._discard(connection)
+            raise
+        except BaseException:
+            self._checkin(connection, created_at)
+            raise
+        self._checkin(connection, created_at)
+        return result
+
+    def _checkout(self) -> Tuple[Any, float]:
+        now = time.monotonic()
+        while True:
+            with self._lock:
+                if not self._idle:
+                    break
+                connection, created_at, idle_since = self._idle.pop()
+
+            if now - created_at > self.config.recycle_seconds:
+                self.connections_recycled += 1
+                self._discard(connection)
+                continue
+            if now - idle_since >= self.config.health_check_idle_seconds and not self._is_healthy(connection):
+                self.health_check_failures += 1
+                self._discard(connection)
+                continue
+            return connection, created_at
+
+        return self._open(), time.monotonic()
+
+    def _checkin(self, connection: Any, created_at: float) -> None:
+        with self._lock:
+            if self._executor is not None:
+                self._idle.append((connection, created_at, time.monotonic()))
+                return
+        # The pool closed while this query ran; nothing would ever close an idle connection now
+        self._discard(connection)
+
+    def _is_healthy(self, connection: Any) -> bool:
+        try:
+            with get_telemetry().span("db.ping"):
+                connection.ping(reconnect=False)
+            return True
+        except Exception:
+            return False
+
+    def _open(self) -> Any:
+        try:
+            with get_telemetry().span("db.connect"):
+                connection = self._connect(**self.db_config)
+        except Error as e:
+            raise DatabaseConnectionError(str(e))
+        with self._lock:
+            self._size += 1
+        self.connections_created += 1
+        return connection
+
+    def _discard(self, connection: Any) -> None:
+        with self._lock:
+            self._size -= 1
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def _fill_min_size(self) -> None:
+        now = time.monotonic()
+        while self._size < self.config.min_size:
+            connection = self._open()
+            with self._lock:
+                self._idle.append((connection, now, now))
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "started": self._executor is not None,
+            "min_size": self.config.min_size,
+            "max_size": self.config.max_size,
+            "size": self._size,
+            "idle": len(self._idle),
+            "in_use": self._in_use,
+            "waiting": self._waiting,
+            "acquires": self.acquires,
+            "acquire_timeouts": self.acquire_timeouts,
+            "connections_created": self.connections_created,
+            "connections_recycled": self.connections_recycled,
+            "health_check_failures": self.health_check_failures,
+            "avg_acquire_wait_ms": round(
+                self._wait_seconds_total / self.acquires * 1000, 3
+            ) if self.acquires else 0.0,
+        }
@@ -1,36 +1,28 @@
-from fastapi import FastAPI, HTTPException, Depends, Header
-from fastapi.middleware.cors import CORSMiddleware
+from fastapi import APIRouter, HTTPException, Depends, Header, Request, Response
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel
 import jwt
 from datetime import datetime, timedelta
-import hashlib
-import mysql.connector
 from mysql.connector import Error
 from typing import Optional
 import os
-import sys
-from pathlib import Path
+import asyncio
 from dotenv import load_dotenv
 
-# Add planshopper_bot to path
-sys.path.append(str(Path(__file__).parent / 'planshopper_bot'))
 from planshopper_bot.routes import chat_router
+from db import MySQLPool, DatabaseConnectionError, PoolTimeoutError
+from auth.token_cache import TokenCache
+from auth.profile_cache import ProfileCache
+from auth.passwords import PasswordHasher, PasswordHasherBusy
+from auth.rate_limit import RateLimiter
+from planshopper_bot.services.plan_data import create_plan_data_store, load_plan_rows, set_plan_data_store
+from planshopper_bot.services.telemetry import PROMETHEUS_CONTENT_TYPE, get_telemetry
 
 load_dotenv()
 
-app = FastAPI()
-
-# CORS configuration
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=os.getenv('CORS_ORIGINS', '*').split(','),
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
-# Include Plan Shopper chatbot routes
-app.include_router(chat_router.router)
+# Auth, health and metrics endpoints; app.create_app mounts them next to the chat routes
+# and opens the resources below in its lifespan
+router = APIRouter()
 
 # Configuration
 SECRET_KEY = os.getenv('SECRET_KEY')
@@ -45,6 +37,35 @@ DB_CONFIG = {
     'password': os.getenv('DB_PASSWORD')
 }
 
+db_pool = MySQLPool(DB_CONFIG)
+token_cache = TokenCache()
+profile_cache = ProfileCache()
+password_hasher = PasswordHasher()
+login_rate_limiter = RateLimiter()
+telemetry = get_telemetry()
+AUTH_STATE_SWEEP_SECONDS = 60
+
+# Plans, formularies and provider networks (schema/plan_data.sql), snapshotted in memory for the chat service;
+# None unless PLAN_DATA_SOURCE is set
+plan_data_store = create_plan_data_store(lambda plan_year: db_pool.run(load_plan_rows, plan_year))
+set_plan_data_store(plan_data_store)
+
+telemetry.registry.gauge("planshopper_db_pool_connections", "Pooled MySQL connections by state",
+                         lambda: {(state,): db_pool.metrics()[state] for state in ("idle", "in_use")}, ("state",))
+telemetry.registry.gauge("planshopper_db_pool_waiting", "Requests waiting for a pooled MySQL connection",
+                         lambda: db_pool.metrics()["waiting"])
+
+async def sweep_auth_state():
+    while True:
+        await asyncio.sleep(AUTH_STATE_SWEEP_SECONDS)
+        token_cache.sweep()
+        login_rate_limiter.sweep()
+
+async def refresh_plan_data():
+    while True:
+        await asyncio.sleep(plan_data_store.config.refresh_seconds)
+        await plan_data_store.refresh()
+
 # Pydantic models
 class LoginRequest(BaseModel):
     memberId: str
@@ -60,19 +81,43 @@ class ProfileResponse(BaseModel):
     role: str
     name: Optional[str]
 
-def get_db_connection():
+def fetch_login_user(connection, member_id: str):
+    cursor = connection.cursor(dictionary=True)
     try:
-        connection = mysql.connector.connect(**DB_CONFIG)
-        return connection
-    except Error as e:
-        print(f"Database connection error: {e}")
-        return None
+        cursor.execute("SELECT member_id, role, name, password_hash FROM people WHERE member_id = %s", (member_id,))
+        return cursor.fetchone()
+    finally:
+        cursor.close()
 
-def hash_password(password):
-    return hashlib.sha256(password.encode()).hexdigest()
+def fetch_profile(connection, member_id: str):
+    cursor = connection.cursor(dictionary=True)
+    try:
+        cursor.execute("SELECT member_id, role, name FROM people WHERE member_id = %s", (member_id,))
+        return cursor.fetchone()
+    finally:
+        cursor.close()
 
-def verify_password(password, hashed):
-    return hashlib.sha256(password.encode()).hexdigest() == hashed
+def update_password_hash(connection, member_id: str, password_hash: str):
+    cursor = connection.cursor()
+    try:
+        cursor.execute("UPDATE people SET password_hash = %s WHERE member_id = %s", (password_hash, member_id))
+        connection.commit()
+    finally:
+        cursor.close()
+
+async def run_query(fn, *args):
+    try:
+        return await db_pool.run(fn, *args)
+    except PoolTimeoutError:
+        telemetry.db_errors.inc(labels=("pool_timeout",))
+        raise HTTPException(status_code=503, detail="Database busy, please retry", headers={"Retry-After": "1"})
+    except DatabaseConnectionError as e:
+        telemetry.db_errors.inc(labels=("connect",))
+        print(f"Database connection error: {e}")
+        raise HTTPException(status_code=500, detail="Database connection failed")
+    except Error:
+        telemetry.db_errors.inc(labels=("query",))
+        raise HTTPException(status_code=500, detail="Database error")
 
 def create_access_token(member_id: str, role: str) -> str:
     payload = {
@@ -85,7 +130,8 @@ def create_access_token(member_id: str, role: str) -> str:
 
 def decode_token(token: str) -> dict:
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[JWT_ALGORITHM])
+        with telemetry.span("auth.jwt_decode"):
+            payload = jwt.decode(token, SECRET_KEY, algorithms=[JWT_ALGORITHM])
         return payload
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=401, detail="Token has expired")
@@ -97,11 +143,32 @@ def get_current_user(authorization: str = Header(None)):
         raise HTTPException(status_code=401, detail="No valid authorization header")
     
     token = authorization.split(' ')[1]
+    
+    # Tokens verified earlier are served from the cache until their exp
+    cached_user = token_cache.get(token)
+    if cached_user is not None:
+        return cached_user
+    
     payload = decode_token(token)
-    return {
+    if token_cache.is_revoked(token):
+        raise HTTPException(status_code=401, detail="Token has been revoked")
+    
+    user = {
         'member_id': payload['sub'],
         'role': payload['role']
     }
+    token_cache.put(token, user, payload['exp'])
+    return user
+
+def chat_caller(authorization: Optional[str]) -> Optional[dict]:
+    # Chat stays open to anonymous shoppers; a valid token moves the caller up the admission queues
+    # and keeps their conversation history under their member id
+    try:
+        return get_current_user(authorization)
+    except HTTPException:
+        return None
+
+chat_router.set_caller_resolver(chat_caller)
 
 def require_role(required_role: str):
     def role_checker(current_user: dict = Depends(get_current_user)):
@@ -110,83 +177,141 @@ def require_role(required_role: str):
         return current_user
     return role_checker
 
-@app.post('/auth/login', response_model=LoginResponse)
-def login(request: LoginRequest):
-    connection = get_db_connection()
-    if not connection:
-        raise HTTPException(status_code=500, detail="Database connection failed")
-    
+async def upgrade_password_hash(member_id: str, password: str):
+    # Legacy SHA-256 and outdated KDF costs are rehashed while the plaintext is at hand;
+    # a failure here must not fail the login itself
     try:
-        cursor = connection.cursor(dictionary=True)
-        cursor.execute("SELECT * FROM people WHERE member_id = %s", (request.memberId,))
-        user = cursor.fetchone()
-        
-        if not user or not verify_password(request.password, user['password_hash']):
-            raise HTTPException(status_code=401, detail="Invalid credentials")
-        
-        token = create_access_token(user['member_id'], user['role'])
-        
-        return LoginResponse(
-            token=token,
-            role=user['role'],
-            memberId=user['member_id']
-        )
+        new_hash = await password_hasher.hash(password)
+        await db_pool.run(update_password_hash, member_id, new_hash)
+        password_hasher.rehashed += 1
+    except (PasswordHasherBusy, PoolTimeoutError, DatabaseConnectionError, Error) as e:
+        print(f"Password rehash skipped for {member_id}: {e}")
+
+@router.post('/auth/login', response_model=LoginResponse)
+async def login(request: LoginRequest, http_request: Request):
+    # Throttle before touching MySQL or the KDF so credential stuffing stays cheap to reject
+    client_ip = http_request.client.host if http_request.client else None
+    retry_after = await login_rate_limiter.check_login(request.memberId, client_ip)
+    if retry_after:
+        raise HTTPException(status_code=429, detail="Too many login attempts, please retry later",
+                            headers={"Retry-After": str(max(1, round(retry_after)))})
     
-    except Error as e:
-        raise HTTPException(status_code=500, detail="Database error")
-    finally:
-        if connection.is_connected():
-            cursor.close()
-            connection.close()
-
-@app.get('/auth/profile', response_model=ProfileResponse)
-def profile(current_user: dict = Depends(get_current_user)):
-    connection = get_db_connection()
-    if not connection:
-        raise HTTPException(status_code=500, detail="Database connection failed")
+    user = await run_query(fetch_login_user, request.memberId)
     
     try:
-        cursor = connection.cursor(dictionary=True)
-        cursor.execute("SELECT * FROM people WHERE member_id = %s", (current_user['member_id'],))
-        user = cursor.fetchone()
+        password_hash = user['password_hash'] if user else password_hasher.dummy_hash
+        with telemetry.span("auth.password_verify"):
+            valid = await password_hasher.verify(request.password, password_hash) and bool(user)
+    except PasswordHasherBusy:
+        raise HTTPException(status_code=429, detail="Too many login attempts, please retry", headers={"Retry-After": "1"})
+    
+    if not valid:
+        raise HTTPException(status_code=401, detail="Invalid credentials")
+    
+    if password_hasher.needs_rehash(user['password_hash']):
+        await upgrade_password_hash(user['member_id'], request.password)
+    
+    # Warm the profile cache so the profile call that follows login skips MySQL
+    profile_cache.put(user['member_id'], {
+        'member_id': user['member_id'],
+        'role': user['role'],
+        'name': user.get('name')
+    })
+    
+    with telemetry.span("auth.jwt_encode"):
+        token = create_access_token(user['member_id'], user['role'])
+    
+    return LoginResponse(
+        token=token,
+        role=user['role'],
+        memberId=user['member_id']
+    )
+
+@router.post('/auth/logout')
+def logout(authorization: str = Header(None), current_user: dict = Depends(get_current_user)):
+    token = authorization.split(' ')[1]
+    payload = decode_token(token)
+    token_cache.revoke(token, payload['exp'])
+    return {'status': 'logged out'}
+
+@router.get('/auth/profile', response_model=ProfileResponse)
+async def profile(current_user: dict = Depends(get_current_user)):
+    user = profile_cache.get(current_user['member_id'])
+    if user is None:
+        user = await run_query(fetch_profile, current_user['member_id'])
         
         if not user:
             raise HTTPException(status_code=404, detail="User not found")
         
-        return ProfileResponse(
-            memberId=user['member_id'],
-            role=user['role'],
-            name=user.get('name')
-        )
+        profile_cache.put(user['member_id'], user)
     
-    except Error as e:
-        raise HTTPException(status_code=500, detail="Database error")
-    finally:
-        if connection.is_connected():
-            cursor.close()
-            connection.close()
+    return ProfileResponse(
+        memberId=user['member_id'],
+        role=user['role'],
+        name=user.get('name')
+    )
 
-@app.get('/auth/payer/dashboard')
+@router.get('/auth/payer/dashboard')
 def payer_dashboard(current_user: dict = Depends(require_role('payer'))):
     return {'data': 'payer dashboards, tools, metrics'}
 
-@app.get('/auth/agent/dashboard')
+@router.get('/auth/agent/dashboard')
 def agent_dashboard(current_user: dict = Depends(require_role('agent'))):
     return {'data': 'agent landing data'}
 
-@app.get('/auth/member/dashboard')
+@router.get('/auth/member/dashboard')
 def member_dashboard(current_user: dict = Depends(require_role('member'))):
     return {'data': 'member landing data'}
 
-@app.get('/health')
+@router.get('/metrics', include_in_schema=False)
+def metrics():
+    # Prometheus scrape target; the JSON /health and /api/chat/metrics views stay as they are
+    return Response(content=telemetry.render(), media_type=PROMETHEUS_CONTENT_TYPE)
+
+@router.get('/health')
 def health():
-    return {'status': 'healthy', 'database': 'mysql'}
+    return {
+        'status': 'healthy',
+        'database': 'mysql',
+        'db_pool': db_pool.metrics(),
+        'token_cache': token_cache.metrics(),
+        'profile_cache': profile_cache.metrics(),
+        'password_hasher': password_hasher.metrics(),
+        'login_rate_limit': login_rate_limiter.metrics(),
+        'plan_data': plan_data_store.metrics() if plan_data_store is not None else None
+    }
+
+def check_connection(connection):
+    connection.ping(reconnect=False)
+
+@router.get('/health/live')
+def liveness():
+    # The process is up and serving; restart only when this stops answering
+    return {'status': 'alive'}
+
+@router.get('/health/ready')
+async def readiness(request: Request):
+    # Take traffic only once the lifespan has warmed up, and not while draining or without MySQL
+    if not getattr(request.app.state, 'ready', False):
+        return JSONResponse(status_code=503, content={'status': 'starting'})
+    try:
+        await db_pool.run(check_connection)
+    except (PoolTimeoutError, DatabaseConnectionError, Error) as e:
+        return JSONResponse(status_code=503, content={'status': 'unavailable', 'database': str(e)})
+    return {'status': 'ready', 'startup': request.app.state.startup.metrics()}
+
+def __getattr__(name):
+    # fastapi_backend:app predates the app factory; build it on first access
+    if name == 'app':
+        from app import create_app
+        globals()['app'] = create_app()
+        return globals()['app']
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 if __name__ == '__main__':
-    import uvicorn
-    print("Backend server with MySQL starting on http://localhost:8000")
+    from app import main
     print("Test accounts:")
     print("   Agent: 10001 / agent@123")
     print("   Payer: 20002 / payer@123")
     print("   Member: 30003 / member@123")
-    uvicorn.run(app, host='0.0.0.0', port=8000)
+    main()
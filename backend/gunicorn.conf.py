@@ -0,0 +1,32 @@
+"""Gunicorn settings for ``gunicorn -c gunicorn.conf.py 'app:create_app()'``.
+
+The app is preloaded: the master imports it and builds ``create_app()``
+once, then forks the workers, so imports, the intent model, prompt
+templates and index mappings are shared copy-on-write instead of being
+rebuilt per worker. Each worker then runs the lifespan to open its own
+MySQL pool, HTTP client and background tasks; nothing that holds a thread,
+socket or event loop is created before the fork.
+"""
+import gc
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = True
+# Streamed answers can run for a minute; let them finish on reload or shutdown
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 120))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", 60))
+keepalive = 5
+accesslog = "-"
+# Merged into gunicorn's default logging config: send the app's INFO logs (startup timings) to stdout too
+logconfig_dict = {"root": {"level": "INFO", "handlers": ["console"]}}
+
+
+def when_ready(server):
+    # Runs in the master after the app is loaded and before any fork. Freezing moves every object
+    # built so far out of the collector's reach, so a worker's collections do not write to the
+    # shared pages and un-share them.
+    gc.collect()
+    gc.freeze()
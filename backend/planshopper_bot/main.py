@@ -1,40 +0,0 @@
-import os
-import sys
-from pathlib import Path
-from fastapi import FastAPI
-from fastapi.middleware.cors import CORSMiddleware
-from dotenv import load_dotenv
-
-sys.path.append(str(Path(__file__).parent))
-from routes import chat_router
-
-load_dotenv()
-
-app = FastAPI(
-    title="Plan Shopper GenAI API",
-    description="RAG-powered chatbot for health insurance plan comparison",
-    version="1.0.0"
-)
-
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["http://localhost:5173", "http://localhost:5174", "http://localhost:3000"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
-app.include_router(chat_router.router)
-
-@app.get("/")
-async def root():
-    return {"message": "Plan Shopper GenAI API is running"}
-
-@app.get("/health")
-async def health_check():
-    return {"status": "healthy"}
-
-if __name__ == "__main__":
-    import uvicorn
-    port = int(os.getenv("PORT", 8000))
-    uvicorn.run("main:app", host="0.0.0.0", port=port, reload=True)
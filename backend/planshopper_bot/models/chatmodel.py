@@ -1,15 +1,32 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import List, Optional, Dict, Any
 
 class ChatRequest(BaseModel):
     message: str
-    session_id: str
+    # Random per conversation (e.g. a UUID); short or shared ids like "default-session" are rejected so
+    # anonymous callers cannot land in each other's history
+    session_id: str = Field(min_length=16, max_length=128, pattern=r"^[A-Za-z0-9_-]+$")
+    # Metadata filters for local retrieval, e.g. {"county": "Cook", "plan_type": ["HMO", "PPO"]}
+    filters: Optional[Dict[str, Any]] = None
+    # Expected yearly use for cost comparisons, e.g. {"specialist_visits": 6}; not a retrieval filter
+    utilization: Optional[Dict[str, float]] = None
+    # Who is asking: "member", "agent" or "payer"; picks the system prompt's audience
+    role: Optional[str] = None
 
 class StreamChunk(BaseModel):
-    type: str  # 'content', 'done', 'error'
+    type: str  # 'content', 'citation', 'usage', 'table_row', 'table', 'reset', 'done', 'error'
     content: Optional[str] = None
     done: bool = False
     error: Optional[str] = None
+    citations: Optional[List["Citation"]] = None
+    retrieved_chunks: Optional[List["RetrievedChunk"]] = None
+    token_usage: Optional[Dict[str, int]] = None
+    table_data: Optional[str] = None
+    tables: Optional[List["TableData"]] = None
+    # 'table_row' events: one completed body row of table number table_index
+    table_index: Optional[int] = None
+    columns: Optional[List[str]] = None
+    row: Optional[List[str]] = None
 
 class Citation(BaseModel):
     content: str
@@ -22,6 +39,10 @@ class RetrievedChunk(BaseModel):
     score: Optional[float] = None
     metadata: Optional[Dict[str, Any]] = None
 
+class TableData(BaseModel):
+    columns: List[str]
+    rows: List[List[str]]
+
 class ChatResponse(BaseModel):
     answer: str
     citations: List[Citation]
@@ -29,7 +50,10 @@ class ChatResponse(BaseModel):
     token_usage: Optional[Dict[str, int]] = None
     has_table: bool = False
     table_data: Optional[str] = None
+    tables: List[TableData] = []
 
 class ErrorResponse(BaseModel):
     error: str
     detail: Optional[str] = None
+
+StreamChunk.model_rebuild()
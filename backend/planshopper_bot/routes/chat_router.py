@@ -1,52 +1,126 @@
-from fastapi import APIRouter, HTTPException
+import asyncio
+import math
+from typing import Callable, Dict, Optional
+from fastapi import APIRouter, Depends, Header, HTTPException, Request
 from fastapi.responses import StreamingResponse
 from planshopper_bot.models.chatmodel import ChatRequest, ChatResponse, ErrorResponse
-from planshopper_bot.services.azure_rag_service import AzureRAGService
-import json
+from planshopper_bot.services.azure_rag_service import AzureRAGService, get_rag_service
+from planshopper_bot.services.http_client import get_http_client
+from planshopper_bot.services.telemetry import get_telemetry
+from planshopper_bot.services.upstream import UpstreamError, UpstreamTimeout
+from planshopper_bot.utils.sse import SSEConfig, SSE_HEADERS, encode_event, parse_last_event_id, sse_stream
 
 router = APIRouter(prefix="/api", tags=["chat"])
+sse_config = SSEConfig.from_env()
+SESSION_SWEEP_SECONDS = 60
+# Maps an Authorization header to the signed-in caller ({"member_id", "role"}), or None; registered by the main app
+_caller_resolver: Optional[Callable[[Optional[str]], Optional[Dict[str, str]]]] = None
+
+def set_caller_resolver(resolver: Optional[Callable[[Optional[str]], Optional[Dict[str, str]]]]) -> None:
+    global _caller_resolver
+    _caller_resolver = resolver
+
+def resolve_caller(authorization: Optional[str]) -> Optional[Dict[str, str]]:
+    """The verified caller; a role in the request body is not trusted for admission or history."""
+    return _caller_resolver(authorization) if _caller_resolver is not None and authorization else None
+
+def session_key(session_id: str, caller: Optional[Dict[str, str]]) -> str:
+    """The history key for a conversation: a signed-in member's sessions live under their member id,
+    so another caller sending the same session_id never sees them."""
+    if caller is not None:
+        return f"member:{caller['member_id']}:{session_id}"
+    return f"anon:{session_id}"
+
+def register_admission_gauges(rag_service: AzureRAGService) -> None:
+    registry = get_telemetry().registry
+    registry.gauge("planshopper_admission_limit", "Adaptive limit on concurrent Azure OpenAI calls",
+                   lambda: rag_service.admission.limit)
+    registry.gauge("planshopper_admission_in_flight", "Azure OpenAI calls holding an admission permit",
+                   lambda: rag_service.admission.in_flight)
+    registry.gauge("planshopper_admission_queued", "Chat requests waiting for admission, by priority",
+                   lambda: {(role,): queued for role, queued in rag_service.admission.metrics()["queued"].items()},
+                   ("priority",))
+
+async def sweep_sessions():
+    while True:
+        await asyncio.sleep(SESSION_SWEEP_SECONDS)
+        get_rag_service().sessions.sweep()
+
+@router.get("/chat/metrics")
+async def chat_metrics(rag_service: AzureRAGService = Depends(get_rag_service)):
+    return {
+        "http_pool": get_http_client().metrics(),
+        "response_cache": rag_service.response_cache.metrics(),
+        "intent": rag_service.intent_classifier.metrics(),
+        "sessions": rag_service.sessions.metrics(),
+        "retriever": rag_service.retriever.metrics() if rag_service.retriever is not None else {"backend": "azure"},
+        "plan_data": rag_service.plan_data.metrics() if rag_service.plan_data is not None else None,
+        "prompt_budget": rag_service.prompt_budget.metrics(),
+        "upstream": rag_service.upstream.metrics(),
+        "admission": rag_service.admission.metrics(),
+        "single_flight": {
+            "in_flight": len(rag_service.single_flight),
+            "started": rag_service.single_flight.started,
+            "coalesced": rag_service.single_flight.coalesced
+        },
+        "stream_single_flight": {
+            "in_flight": len(rag_service.stream_single_flight),
+            "started": rag_service.stream_single_flight.started,
+            "coalesced": rag_service.stream_single_flight.coalesced,
+            "cancelled": rag_service.stream_single_flight.cancelled
+        }
+    }
 
 @router.post("/chat", response_model=ChatResponse)
-async def chat_endpoint(request: ChatRequest):
+async def chat_endpoint(request: ChatRequest, authorization: Optional[str] = Header(None),
+                        rag_service: AzureRAGService = Depends(get_rag_service)):
     try:
         if not request.message.strip():
             raise HTTPException(status_code=400, detail="Message cannot be empty")
         
-        rag_service = AzureRAGService()
-        response = await rag_service.chat_completion(request.message, request.session_id)
+        caller = resolve_caller(authorization)
+        priority = caller["role"] if caller is not None else None
+        response = await rag_service.chat_completion(request.message, session_key(request.session_id, caller),
+                                                   request.filters, request.role or priority, priority,
+                                                   utilization=request.utilization)
         
         return response
         
+    except HTTPException:
+        raise
+    except UpstreamTimeout:
+        raise HTTPException(status_code=504, detail="Request timed out. Please try again.")
+    except UpstreamError as e:
+        # Throttled or unavailable upstream: tell the client when to come back
+        headers = {"Retry-After": str(math.ceil(e.retry_after))} if e.retry_after is not None else None
+        raise HTTPException(status_code=e.status_code, detail=f"External API error: {e}", headers=headers)
     except ValueError as e:
         raise HTTPException(status_code=500, detail=f"Configuration error: {str(e)}")
     except Exception as e:
-        error_msg = str(e)
-        if "timeout" in error_msg.lower():
-            raise HTTPException(status_code=504, detail="Request timed out. Please try again.")
-        elif "api error" in error_msg.lower():
-            raise HTTPException(status_code=502, detail=f"External API error: {error_msg}")
-        else:
-            raise HTTPException(status_code=500, detail=f"Internal server error: {error_msg}")
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
 @router.post("/chat/stream")
-async def chat_stream_endpoint(request: ChatRequest):
-    async def generate_stream():
-        try:
-            if not request.message.strip():
-                error_data = json.dumps({"error": "Message cannot be empty"})
-                yield f"data: {error_data}\n\n"
-                return
-            
-            rag_service = AzureRAGService()
-            async for chunk in rag_service.chat_completion_stream(request.message, request.session_id):
-                chunk_data = json.dumps(chunk)
-                yield f"data: {chunk_data}\n\n"
-        except Exception as e:
-            error_data = json.dumps({"error": str(e)})
-            yield f"data: {error_data}\n\n"
-        yield "data: [DONE]\n\n"
+async def chat_stream_endpoint(request: ChatRequest, http_request: Request, authorization: Optional[str] = Header(None),
+                               rag_service: AzureRAGService = Depends(get_rag_service)):
+    if not request.message.strip():
+        async def empty_message():
+            yield encode_event({"type": "error", "error": "Message cannot be empty"})
+        return StreamingResponse(empty_message(), media_type="text/event-stream", headers=SSE_HEADERS)
+    
+    # Once the stream starts the status is 200, so a full queue is turned away before it
+    caller = resolve_caller(authorization)
+    priority = caller["role"] if caller is not None else None
+    retry_after = rag_service.admission.retry_after(priority)
+    if retry_after is not None:
+        raise HTTPException(status_code=503, detail="Too many chat requests in progress, please retry shortly",
+                            headers={"Retry-After": str(math.ceil(retry_after))})
     
-    return StreamingResponse(generate_stream(), media_type="text/plain", headers={
-        "Cache-Control": "no-cache",
-        "Connection": "keep-alive"
-    })
+    resume_from = parse_last_event_id(http_request)
+    chunks = rag_service.chat_completion_stream(request.message, session_key(request.session_id, caller),
+                                                 request.filters, request.role or priority, priority,
+                                                 resume=resume_from > 0, utilization=request.utilization)
+    return StreamingResponse(
+        sse_stream(chunks, http_request, sse_config, resume_from=resume_from),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS
+    )
@@ -0,0 +1,298 @@
+import asyncio
+import logging
+import math
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Deque, Dict, Optional, Tuple
+
+from planshopper_bot.services.telemetry import get_telemetry
+from planshopper_bot.services.upstream import LatencyWindow, UpstreamError
+
+logger = logging.getLogger(__name__)
+
+ANONYMOUS = "anonymous"
+TPM_WINDOW_SECONDS = 60.0
+
+
+class AdmissionRejected(UpstreamError):
+    """The request was not sent to Azure: its priority queue is full or it waited too long."""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message, status_code=503, retry_after=retry_after)
+
+
+def _parse_queue_sizes(value: str) -> Tuple[Tuple[str, int], ...]:
+    """``role=size`` entries, highest priority first."""
+    entries = []
+    for part in value.split(","):
+        role, _, size = part.strip().partition("=")
+        if role.strip():
+            entries.append((role.strip(), int(size)))
+    return tuple(entries)
+
+
+@dataclass(frozen=True)
+class AdmissionConfig:
+    enabled: bool = True
+    # Concurrent Azure calls: additive increase while responses are fast, multiplicative decrease on congestion
+    initial_limit: int = 16
+    min_limit: int = 2
+    max_limit: int = 128
+    backoff: float = 0.7
+    decrease_interval: float = 1.0
+    # A time-to-headers above this multiple of the recent p10 counts as congestion
+    latency_tolerance: float = 2.5
+    # The deployment's tokens-per-minute quota; 0 disables the token budget
+    tpm_limit: int = 0
+    expected_completion_tokens: int = 400
+    # Queues in priority order with their sizes; roles not listed queue as anonymous
+    queue_sizes: Tuple[Tuple[str, int], ...] = (("agent", 64), ("payer", 64), ("member", 32), (ANONYMOUS, 16))
+    queue_timeout: float = 10.0
+
+    @classmethod
+    def from_env(cls) -> "AdmissionConfig":
+        queue_sizes = os.getenv("ADMISSION_QUEUE_SIZES")
+        return cls(
+            enabled=os.getenv("ADMISSION_ENABLED", "true").lower() in ("1", "true", "yes", "on"),
+            initial_limit=int(os.getenv("ADMISSION_INITIAL_LIMIT", cls.initial_limit)),
+            min_limit=int(os.getenv("ADMISSION_MIN_LIMIT", cls.min_limit)),
+            max_limit=int(os.getenv("ADMISSION_MAX_LIMIT", cls.max_limit)),
+            backoff=float(os.getenv("ADMISSION_BACKOFF", cls.backoff)),
+            decrease_interval=float(os.getenv("ADMISSION_DECREASE_INTERVAL", cls.decrease_interval)),
+            latency_tolerance=float(os.getenv("ADMISSION_LATENCY_TOLERANCE", cls.latency_tolerance)),
+            tpm_limit=int(os.getenv("ADMISSION_TPM_LIMIT", cls.tpm_limit)),
+            expected_completion_tokens=int(os.getenv("ADMISSION_EXPECTED_COMPLETION_TOKENS",
+                                                     cls.expected_completion_tokens)),
+            queue_sizes=_parse_queue_sizes(queue_sizes) if queue_sizes else cls.queue_sizes,
+            queue_timeout=float(os.getenv("ADMISSION_QUEUE_TIMEOUT", cls.queue_timeout)),
+        )
+
+
+class Permit:
+    """One admitted Azure call; ``latency`` and ``usage`` are filled in while it runs."""
+    __slots__ = ("priority", "tokens", "admitted_at", "latency", "usage")
+
+    def __init__(self, priority: str, tokens: int, admitted_at: float):
+        self.priority = priority
+        self.tokens = tokens
+        self.admitted_at = admitted_at
+        self.latency: Optional[float] = None
+        self.usage: Optional[Dict[str, int]] = None
+
+    def headers_received(self) -> None:
+        self.latency = time.monotonic() - self.admitted_at
+
+
+class _Waiter:
+    __slots__ = ("priority", "tokens", "future", "permit")
+
+    def __init__(self, priority: str, tokens: int, future: "asyncio.Future[None]"):
+        self.priority = priority
+        self.tokens = tokens
+        self.future = future
+        self.permit: Optional[Permit] = None
+
+
+class AdmissionController:
+    """Bounds concurrent Azure calls and tokens per minute, admitting queued requests by priority.
+
+    The concurrency limit follows AIMD: it grows by one per limit's worth of
+    fast responses while it is being used, and shrinks by ``backoff`` (at most
+    once per ``decrease_interval``) when Azure throttles, times out or is
+    unavailable, or when time-to-headers exceeds ``latency_tolerance`` times
+    its recent p10. With a ``tpm_limit``, each call reserves its prompt plus
+    the average completion size, and is charged its reported usage when it
+    finishes, over a sliding minute.
+
+    A request that cannot start waits in its role's queue; queues are
+    served strictly in priority order. A full queue, or a wait longer than
+    ``queue_timeout``, is rejected right away with a Retry-After estimate.
+    """
+
+    def __init__(self, config: Optional[AdmissionConfig] = None):
+        self.config = config or AdmissionConfig.from_env()
+        self.limit = float(self.config.initial_limit)
+        self.in_flight = 0
+        self._reserved = 0
+        self._window: Deque[Tuple[float, int]] = deque()
+        self._window_tokens = 0
+        self._queue_sizes = dict(self.config.queue_sizes)
+        self._queue_sizes.setdefault(ANONYMOUS, 16)
+        self._queues: Dict[str, Deque[_Waiter]] = {role: deque() for role in self._queue_sizes}
+        self._latency = LatencyWindow()
+        self._completion_tokens = float(self.config.expected_completion_tokens)
+        self._hold_seconds = 1.0
+        self._last_decrease = -math.inf
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self.admitted = 0
+        self.queued = 0
+        self.rejected: Dict[str, int] = {role: 0 for role in self._queue_sizes}
+        self.queue_timeouts = 0
+        self.decreases = 0
+
+    def priority(self, role: Optional[str]) -> str:
+        return role if role in self._queues else ANONYMOUS
+
+    def retry_after(self, role: Optional[str]) -> Optional[float]:
+        """Seconds to suggest when ``role``'s queue is full right now, otherwise None."""
+        priority = self.priority(role)
+        if not self.config.enabled or len(self._queues[priority]) < self._queue_sizes[priority]:
+            return None
+        return self._suggest_retry(time.monotonic())
+
+    @asynccontextmanager
+    async def admit(self, role: Optional[str], prompt_tokens: int) -> AsyncIterator[Permit]:
+        """Hold a permit for one Azure call; its outcome adjusts the concurrency limit."""
+        with get_telemetry().span("admission.wait"):
+            permit = await self.acquire(role, prompt_tokens)
+        try:
+            yield permit
+        except UpstreamError as e:
+            # Throttling, timeouts and open circuits all mean Azure has more work than it can take
+            self.release(permit, congested=e.status_code in (503, 504))
+            raise
+        except BaseException:
+            self.release(permit)
+            raise
+        else:
+            self.release(permit)
+
+    async def acquire(self, role: Optional[str], prompt_tokens: int) -> Permit:
+        priority = self.priority(role)
+        tokens = prompt_tokens + round(self._completion_tokens)
+        now = time.monotonic()
+        if not self.config.enabled or (not any(self._queues.values()) and self._can_admit(tokens, now)):
+            return self._grant(priority, tokens, now)
+
+        queue = self._queues[priority]
+        if len(queue) >= self._queue_sizes[priority]:
+            self.rejected[priority] += 1
+            raise AdmissionRejected("Too many chat requests in progress, please retry shortly",
+                                    self._suggest_retry(now))
+        waiter = _Waiter(priority, tokens, asyncio.get_running_loop().create_future())
+        queue.append(waiter)
+        self.queued += 1
+        self._dispatch()
+        try:
+            await asyncio.wait_for(waiter.future, timeout=self.config.queue_timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter.permit is not None:
+                # Admitted at the moment the wait ended; give the slot to the next request
+                self.release(waiter.permit)
+            elif waiter in queue:
+                queue.remove(waiter)
+            if isinstance(e, asyncio.TimeoutError):
+                self.queue_timeouts += 1
+                raise AdmissionRejected("Timed out waiting for a chat slot, please retry shortly",
+                                        self._suggest_retry(time.monotonic()))
+            raise
+        return waiter.permit
+
+    def release(self, permit: Permit, congested: bool = False) -> None:
+        now = time.monotonic()
+        self.in_flight -= 1
+        self._reserved -= permit.tokens
+        used = permit.tokens
+        if permit.usage and permit.usage.get("total_tokens"):
+            used = permit.usage["total_tokens"]
+            if permit.usage.get("completion_tokens"):
+                self._completion_tokens += 0.1 * (permit.usage["completion_tokens"] - self._completion_tokens)
+        if self.config.tpm_limit:
+            self._window.append((now, used))
+            self._window_tokens += used
+        self._hold_seconds += 0.1 * ((now - permit.admitted_at) - self._hold_seconds)
+
+        if congested:
+            self._decrease(now)
+        elif permit.latency is not None:
+            baseline = self._latency.percentile(0.1) if len(self._latency) >= 20 else None
+            self._latency.add(permit.latency)
+            if baseline is not None and permit.latency > baseline * self.config.latency_tolerance:
+                self._decrease(now)
+            elif self.in_flight + 1 >= self.limit / 2:
+                # Only a limit that is actually being used earns an increase
+                self.limit = min(float(self.config.max_limit), self.limit + 1 / self.limit)
+        self._dispatch()
+
+    def _decrease(self, now: float) -> None:
+        if now - self._last_decrease < self.config.decrease_interval:
+            return
+        self._last_decrease = now
+        self.limit = max(float(self.config.min_limit), self.limit * self.config.backoff)
+        self.decreases += 1
+        logger.info("Admission limit lowered to %.1f", self.limit)
+
+    def _grant(self, priority: str, tokens: int, now: float) -> Permit:
+        self.in_flight += 1
+        self._reserved += tokens
+        self.admitted += 1
+        return Permit(priority, tokens, now)
+
+    def _tokens_used(self, now: float) -> int:
+        while self._window and now - self._window[0][0] >= TPM_WINDOW_SECONDS:
+            self._window_tokens -= self._window.popleft()[1]
+        return self._window_tokens + self._reserved
+
+    def _can_admit(self, tokens: int, now: float) -> bool:
+        if self.in_flight >= max(1, int(self.limit)):
+            return False
+        if self.config.tpm_limit:
+            used = self._tokens_used(now)
+            # A request larger than the whole budget still runs once nothing else is charged
+            if used and used + tokens > self.config.tpm_limit:
+                return False
+        return True
+
+    def _dispatch(self) -> None:
+        now = time.monotonic()
+        for queue in self._queues.values():
+            while queue:
+                waiter = queue[0]
+                if waiter.future.done():
+                    queue.popleft()
+                    continue
+                if not self._can_admit(waiter.tokens, now):
+                    self._wake_for_budget(now)
+                    return
+                queue.popleft()
+                waiter.permit = self._grant(waiter.priority, waiter.tokens, now)
+                waiter.future.set_result(None)
+
+    def _wake_for_budget(self, now: float) -> None:
+        # Held back by the token budget with capacity to spare: retry when the oldest charge expires
+        if self._timer is not None or not self._window or self.in_flight >= max(1, int(self.limit)):
+            return
+        delay = max(0.01, TPM_WINDOW_SECONDS - (now - self._window[0][0]))
+        self._timer = asyncio.get_running_loop().call_later(delay, self._on_timer)
+
+    def _on_timer(self) -> None:
+        self._timer = None
+        self._dispatch()
+
+    def _suggest_retry(self, now: float) -> float:
+        waiting = sum(len(queue) for queue in self._queues.values())
+        estimate = self._hold_seconds * (waiting + self.in_flight) / max(1.0, self.limit)
+        if self.config.tpm_limit and self._window and self._tokens_used(now) >= self.config.tpm_limit:
+            estimate = max(estimate, TPM_WINDOW_SECONDS - (now - self._window[0][0]))
+        return max(1.0, estimate)
+
+    def metrics(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        return {
+            "enabled": self.config.enabled,
+            "limit": round(self.limit, 2),
+            "in_flight": self.in_flight,
+            "queued": {role: len(queue) for role, queue in self._queues.items()},
+            "admitted": self.admitted,
+            "waited": self.queued,
+            "rejected": dict(self.rejected),
+            "queue_timeouts": self.queue_timeouts,
+            "decreases": self.decreases,
+            "tpm_limit": self.config.tpm_limit,
+            "tokens_last_minute": self._tokens_used(now) if self.config.tpm_limit else None,
+            "avg_completion_tokens": round(self._completion_tokens, 1),
+            "p10_time_to_headers_ms": round(self._latency.percentile(0.1) * 1000, 1) if len(self._latency) else None,
+        }
@@ -1,73 +1,263 @@
 import os
+import hashlib
 import httpx
 import re
 import json
-from typing import Dict, Any, List, Optional, Tuple, AsyncGenerator
-from planshopper_bot.models.chatmodel import ChatResponse, Citation, RetrievedChunk, ErrorResponse
-from planshopper_bot.utils.prompts import PLAN_SHOPPER_SYSTEM_PROMPT
+import logging
+import time
+from typing import Dict, Any, List, Optional, Tuple, AsyncGenerator, AsyncIterator, Iterable, Union
+from planshopper_bot.models.chatmodel import ChatResponse, Citation, RetrievedChunk, ErrorResponse, TableData
+from planshopper_bot.services.admission import AdmissionController
+from planshopper_bot.services.intent_classifier import IntentClassifier, GREETING, THANKS, OUT_OF_DOMAIN
+from planshopper_bot.services.plan_data import PlanDataStore, PlanLookup, get_plan_data_store
+from planshopper_bot.services.prompt_budget import PromptBudget, PromptPlan
+from planshopper_bot.services.retriever import Retriever, create_retriever
+from planshopper_bot.services.session_store import SessionStore, InMemorySessionStore, SessionStoreConfig, Turn
+from planshopper_bot.services.response_cache import ResponseCache, cache_fingerprint, normalize_message
+from planshopper_bot.services.single_flight import SingleFlight, StreamSingleFlight
+from planshopper_bot.services.telemetry import get_telemetry
+from planshopper_bot.services.upstream import Deployment, ResilientUpstream, UpstreamConfig, UpstreamError
+from planshopper_bot.utils.sse_decoder import SSEDecoder, extract_delta_content, FULL_PARSE
+from planshopper_bot.utils.citation_filter import CitationMarkerFilter
+from planshopper_bot.utils.markdown_table import MarkdownTableParser, parse_tables
+
+logger = logging.getLogger(__name__)
+
+AZURE_OPENAI_API_VERSION = "2024-10-21"
+
+# Stand-in for the conversation messages while the payload template is serialized once;
+# it is split out of the JSON so each request only encodes the history and the message itself.
+_MESSAGES_PLACEHOLDER = "\u0000messages\u0000"
+
+GREETING_REPLY = "Hello! I'm your Plan Shopper assistant. I can help you find and compare Medicare plans, check drug coverage, find providers, and more. What would you like to know?"
+THANKS_REPLY = "You're welcome! Feel free to ask if you have any other questions about Medicare plans."
+COMPARISON_NARRATIVE_PROMPT = "The user is already shown this cost comparison, computed from plan data:\n\n{comparison}\n\n{facts}\n\nDo not repeat the table or recalculate any numbers. Write only the key takeaway in one or two sentences, then the follow-up questions."
+OUT_OF_DOMAIN_REPLY = "I'm a Medicare plan assistant and can only help with questions about health insurance plans, benefits, coverage, costs, and providers. Please ask me about Medicare plans or health insurance topics."
 
 class AzureRAGService:
-    def __init__(self):
+    def __init__(self, session_store: Optional[SessionStore] = None, retriever: Optional[Retriever] = None,
+                 plan_data: Optional[PlanDataStore] = None):
         self.azure_openai_endpoint = os.getenv("AZURE_OPENAI_ENDPOINT")
         self.azure_openai_api_key = os.getenv("AZURE_OPENAI_API_KEY")
         self.azure_openai_deployment = os.getenv("AZURE_OPENAI_DEPLOYMENT")
         self.azure_search_endpoint = os.getenv("AZURE_SEARCH_ENDPOINT")
         self.azure_search_index = os.getenv("AZURE_SEARCH_INDEX")
         self.azure_search_api_key = os.getenv("AZURE_SEARCH_API_KEY")
+        # None means Azure "on your data" retrieves inside the chat call
+        self.retriever = retriever if retriever is not None else create_retriever()
+        # Structured plan/formulary/provider data; None when it is not configured
+        self.plan_data = plan_data if plan_data is not None else get_plan_data_store()
+        self.prompt_budget = PromptBudget()
+        self.telemetry = get_telemetry()
         
         self._validate_credentials()
+        
+        # The configured deployment first, then the failover ones in order
+        upstream_config = UpstreamConfig.from_env()
+        deployments = [Deployment.azure(self.azure_openai_endpoint, self.azure_openai_deployment,
+                                        self.azure_openai_api_key, AZURE_OPENAI_API_VERSION)]
+        for endpoint, deployment, api_key in upstream_config.failover:
+            deployments.append(Deployment.azure(endpoint or self.azure_openai_endpoint, deployment,
+                                                api_key or self.azure_openai_api_key, AZURE_OPENAI_API_VERSION))
+        self.upstream = ResilientUpstream(deployments, upstream_config)
+        self.admission = AdmissionController()
+        # (prompt variant, stream, retrieval) -> serialized payload around the messages
+        self._payload_templates = {
+            (variant, stream, retrieval): self._build_payload_template(system_prompt, stream, retrieval)
+            for variant, system_prompt in self.prompt_budget.system_prompts().items()
+            for stream in (False, True) for retrieval in (False, True)
+        }
+        
+        self._plan_data_version = self.plan_data.version if self.plan_data is not None else ""
+        self.response_cache = ResponseCache(fingerprint=self._cache_fingerprint())
+        self.single_flight = SingleFlight()
+        self.stream_single_flight = StreamSingleFlight()
+        self.stream_parse_errors = 0
+        self.intent_classifier = IntentClassifier()
+        self.sessions = session_store or InMemorySessionStore()
+        self.history_token_budget = SessionStoreConfig.from_env().history_token_budget
     
+    def _cache_fingerprint(self) -> str:
+        return cache_fingerprint(
+            self.azure_openai_endpoint, self.azure_openai_deployment,
+            self.azure_search_endpoint, self.azure_search_index, *self.prompt_budget.system_prompts().values(),
+            self.retriever.version if self.retriever is not None else "",
+            self.plan_data.version if self.plan_data is not None else ""
+        )
+    
+    def _refresh_index(self) -> None:
+        # A newly published local index or reloaded plan data makes every cached answer stale
+        reloaded = self.retriever is not None and self.retriever.refresh()
+        plan_data_version = self.plan_data.version if self.plan_data is not None else ""
+        if reloaded or plan_data_version != self._plan_data_version:
+            self._plan_data_version = plan_data_version
+            self.response_cache.ensure_fingerprint(self._cache_fingerprint())
+    
+    async def warm(self) -> None:
+        """Prefetch the local index and open upstream connections before the first request."""
+        if self.retriever is not None:
+            self.retriever.warm()
+        opened = await self.upstream.warm()
+        if opened:
+            logger.info("Opened %d warm connection(s) to Azure OpenAI", opened)
+
     def _validate_credentials(self):
-        required_vars = [
-            "AZURE_OPENAI_ENDPOINT", "AZURE_OPENAI_API_KEY", "AZURE_OPENAI_DEPLOYMENT",
-            "AZURE_SEARCH_ENDPOINT", "AZURE_SEARCH_INDEX", "AZURE_SEARCH_API_KEY"
-        ]
+        required_vars = ["AZURE_OPENAI_ENDPOINT", "AZURE_OPENAI_API_KEY", "AZURE_OPENAI_DEPLOYMENT"]
+        if self.retriever is None:
+            required_vars += ["AZURE_SEARCH_ENDPOINT", "AZURE_SEARCH_INDEX", "AZURE_SEARCH_API_KEY"]
         missing = [var for var in required_vars if not os.getenv(var)]
         if missing:
             raise ValueError(f"Missing required environment variables: {', '.join(missing)}")
     
-    def _is_greeting_or_thanks(self, user_message: str) -> Optional[str]:
-        message_lower = user_message.lower().strip()
-        
-        greetings = ['hi', 'hello', 'hey', 'good morning', 'good afternoon', 'good evening']
-        thanks = ['thank', 'thanks', 'thank you', 'appreciate']
+    def _data_sources(self) -> List[Dict[str, Any]]:
+        return [
+            {
+                "type": "azure_search",
+                "parameters": {
+                    "endpoint": self.azure_search_endpoint,
+                    "index_name": self.azure_search_index,
+                    "authentication": {
+                        "type": "api_key",
+                        "key": self.azure_search_api_key
+                    },
+                    "top_n_documents": self.prompt_budget.config.azure_top_n_documents,
+                    "query_type": "semantic"
+                }
+            }
+        ]
+    
+    def _build_payload_template(self, system_prompt: str, stream: bool, retrieval: bool = True) -> Tuple[bytes, bytes]:
+        payload: Dict[str, Any] = {
+            "messages": [
+                {"role": "system", "content": system_prompt},
+                _MESSAGES_PLACEHOLDER
+            ]
+        }
+        if self.retriever is None and retrieval:
+            payload["data_sources"] = self._data_sources()
+        if stream:
+            payload["stream"] = True
+            # Without it Azure sends no usage chunk, and streamed answers never report their tokens
+            payload["stream_options"] = {"include_usage": True}
         
-        if any(greeting in message_lower for greeting in greetings):
-            return "Hello! I'm your Plan Shopper assistant. I can help you find and compare Medicare plans, check drug coverage, find providers, and more. What would you like to know?"
+        serialized = json.dumps(payload)
+        prefix, suffix = serialized.split(json.dumps(_MESSAGES_PLACEHOLDER))
+        return prefix.encode(), suffix.encode()
+    
+    def _build_payload(self, user_message: str, stream: bool = False, history: Optional[List[Dict[str, str]]] = None,
+                       retrieval: bool = True, variant: Optional[str] = None) -> bytes:
+        messages = [json.dumps(message) for message in history or ()]
+        messages.append(json.dumps({"role": "user", "content": user_message}))
+        body = ", ".join(messages).encode()
+        prefix, suffix = self._payload_templates[(variant or self.prompt_budget.variant_for(None), stream, retrieval)]
+        return prefix + body + suffix
+    
+    def _flight_key(self, user_message: str, history: List[Dict[str, str]], filters: Optional[Dict[str, Any]],
+                    variant: str = "", utilization: Optional[Dict[str, float]] = None) -> str:
+        # Follow-ups only share an upstream call when the conversation before them is identical too
+        key = f"{variant}\0{normalize_message(user_message)}"
+        if history or filters or utilization:
+            context = json.dumps([history, filters, utilization], sort_keys=True).encode()
+            key += "\0" + hashlib.blake2b(context, digest_size=16).hexdigest()
+        return key
+    
+    async def _retrieve(self, user_message: str, prompt: PromptPlan,
+                        filters: Optional[Dict[str, Any]]) -> Tuple[List[Dict[str, str]], List[Citation], List[RetrievedChunk]]:
+        """Local retrieval: the sources message for the prompt plus the citations/chunks to return.
         
-        if any(thank in message_lower for thank in thanks):
-            return "You're welcome! Feel free to ask if you have any other questions about Medicare plans."
+        Chunks come best first and are kept while they fit the prompt's context budget.
+        """
+        if self.retriever is None:
+            return [], [], []
+        # A follow-up is searched together with the question it follows up on
+        previous = next((m["content"] for m in reversed(prompt.history) if m["role"] == "user"), "")
+        with self.telemetry.span("chat.retrieve") as span:
+            chunks = await self.retriever.retrieve(f"{previous} {user_message}".strip(), filters=filters)
+            
+            candidates = [((chunk.metadata or {}).get("title") or "", chunk.content) for chunk in chunks]
+            kept = self.prompt_budget.fit_sources(prompt, candidates)
+            span.set_attribute("chat.chunks_kept", len(kept))
+        chunks = [chunks[i] for i in kept]
         
+        citations = []
+        sources = []
+        for doc, i in enumerate(kept, 1):
+            metadata = chunks[doc - 1].metadata or {}
+            citations.append(Citation(
+                content=chunks[doc - 1].content,
+                title=metadata.get("title"),
+                url=metadata.get("url"),
+                filepath=metadata.get("filepath")
+            ))
+            title, content = candidates[i]
+            sources.append(f"[doc{doc}] {title}\n{content}")
+        if sources:
+            content = "Answer from these plan documents:\n\n" + "\n\n".join(sources)
+        else:
+            content = "No plan documents matched this question."
+        return [{"role": "system", "content": content}], citations, chunks
+    
+    def _local_reply(self, user_message: str, turns: List[Turn]) -> Optional[str]:
+        """Answer greetings, thanks and off-topic questions locally, before any retrieval."""
+        intent = self.intent_classifier.classify(user_message, context=turns[-1][0] if turns else "")
+        if intent.intent == GREETING:
+            return GREETING_REPLY
+        if intent.intent == THANKS:
+            return THANKS_REPLY
+        if intent.intent == OUT_OF_DOMAIN:
+            return OUT_OF_DOMAIN_REPLY
         return None
     
-    async def _is_medicare_related(self, user_message: str) -> bool:
-        """Check if the question is related to Medicare/health insurance without RAG"""
-        medicare_keywords = [
-            'plan', 'medicare', 'insurance', 'health', 'coverage', 'benefit', 'drug', 'prescription',
-            'provider', 'doctor', 'hospital', 'copay', 'deductible', 'premium', 'cost', 'network',
-            'hmo', 'ppo', 'medicaid', 'cigna', 'formulary', 'pharmacy', 'medical', 'care'
-        ]
-        
-        message_lower = user_message.lower()
-        return any(keyword in message_lower for keyword in medicare_keywords)
+    def _plan_lookup(self, user_message: str, turns: List[Turn], filters: Optional[Dict[str, Any]],
+                     utilization: Optional[Dict[str, float]]) -> Tuple[Optional[ChatResponse], Optional[PlanLookup]]:
+        """A direct answer from the plan data, or the lookup to ground the model's answer with."""
+        if self.plan_data is None:
+            return None, None
+        lookup = self.plan_data.lookup(user_message, filters, context=turns[-1][0] if turns else "",
+                                       utilization=utilization)
+        if lookup is None or lookup.answer is None:
+            return None, lookup
+        has_table, table_data, tables = self._extract_table(lookup.answer)
+        return ChatResponse(
+            answer=lookup.answer,
+            citations=[],
+            retrieved_chunks=[],
+            token_usage=None,
+            has_table=has_table,
+            table_data=table_data,
+            tables=tables
+        ), None
     
-    async def chat_completion(self, user_message: str, session_id: str) -> ChatResponse:
-        # Check for greetings/thanks first
-        greeting_response = self._is_greeting_or_thanks(user_message)
-        if greeting_response:
-            return ChatResponse(
-                answer=greeting_response,
-                citations=[],
-                retrieved_chunks=[],
-                token_usage=None,
-                has_table=False,
-                table_data=None
-            )
+    def _plan_data_messages(self, lookup: Optional[PlanLookup]) -> List[Dict[str, str]]:
+        if lookup is None:
+            return []
+        facts = "\n".join(f"- {fact}" for fact in lookup.facts)
+        if lookup.preamble:
+            content = COMPARISON_NARRATIVE_PROMPT.format(comparison=lookup.preamble, facts=facts)
+        elif facts:
+            content = "Verified plan data (prefer these figures over the documents):\n" + facts
+        else:
+            return []
+        return [{"role": "system", "content": content}]
+    
+    async def chat_completion(self, user_message: str, session_id: str, filters: Optional[Dict[str, Any]] = None,
+                              role: Optional[str] = None, priority: Optional[str] = None,
+                              utilization: Optional[Dict[str, float]] = None) -> ChatResponse:
+        """Answer one message of the session's conversation.
+        
+        ``role`` picks the audience of the system prompt; ``priority`` is the
+        signed-in caller's role, which orders admission to Azure (None queues
+        as anonymous). ``utilization`` is the expected yearly use a cost
+        comparison assumes; ``filters`` only narrow retrieval and plan lookups.
+        """
+        self._refresh_index()
+        turns = await self.sessions.get_turns(session_id)
         
-        # Guardrail: Check if question is Medicare-related
-        if not await self._is_medicare_related(user_message):
+        # Greetings, thanks and off-topic questions are answered without calling Azure
+        local_reply = self._local_reply(user_message, turns)
+        if local_reply:
             return ChatResponse(
-                answer="I'm a Medicare plan assistant and can only help with questions about health insurance plans, benefits, coverage, costs, and providers. Please ask me about Medicare plans or health insurance topics.",
+                answer=local_reply,
                 citations=[],
                 retrieved_chunks=[],
                 token_usage=None,
@@ -75,60 +265,128 @@ class AzureRAGService:
                 table_data=None
             )
         
+        # Exact plan, formulary and network lookups are answered from the plan data without retrieval
+        response, lookup = self._plan_lookup(user_message, turns, filters, utilization)
+        if response is not None:
+            await self.sessions.append(session_id, user_message, response.answer)
+            return response
+        
+        # The role picks the system prompt; history gets what the token budget leaves it
+        prompt = self.prompt_budget.plan(role, user_message, turns, self._plan_data_messages(lookup),
+                                         self.history_token_budget)
+        
+        # Only unfiltered opening questions are cached; a follow-up's answer depends on the conversation
+        history = prompt.history
+        cacheable = not history and not filters and not utilization
+        response = self.response_cache.get(user_message, prompt.variant) if cacheable else None
+        if response is None:
+            # Identical questions asked concurrently share one upstream call
+            response = await self.single_flight.do(
+                self._flight_key(user_message, history, filters, prompt.variant, utilization),
+                lambda: self._fetch_completion(user_message, prompt, filters, lookup, priority, cacheable)
+            )
+        await self.sessions.append(session_id, user_message, response.answer)
+        return response
+    
+    async def _fetch_completion(self, user_message: str, prompt: PromptPlan,
+                                filters: Optional[Dict[str, Any]] = None, lookup: Optional[PlanLookup] = None,
+                                priority: Optional[str] = None, cacheable: bool = False) -> ChatResponse:
+        history = prompt.history
+        # A computed comparison needs no documents: the model only writes the narrative after it
+        preamble = lookup.preamble if lookup is not None else None
         try:
-            url = f"{self.azure_openai_endpoint}/openai/deployments/{self.azure_openai_deployment}/chat/completions?api-version=2024-10-21"
-            
-            headers = {
-                "Content-Type": "application/json",
-                "api-key": self.azure_openai_api_key
-            }
-            
-            payload = {
-                "messages": [
-                    {"role": "system", "content": PLAN_SHOPPER_SYSTEM_PROMPT},
-                    {"role": "user", "content": user_message}
-                ],
-                "data_sources": [
-                    {
-                        "type": "azure_search",
-                        "parameters": {
-                            "endpoint": self.azure_search_endpoint,
-                            "index_name": self.azure_search_index,
-                            "authentication": {
-                                "type": "api_key",
-                                "key": self.azure_search_api_key
-                            },
-                            "top_n_documents": 6,
-                            "query_type": "semantic"
-                        }
-                    }
-                ]
-            }
+            if preamble:
+                sources, citations, retrieved_chunks = [], [], []
+            else:
+                sources, citations, retrieved_chunks = await self._retrieve(user_message, prompt, filters)
+            payload = self._build_payload(user_message, history=history + prompt.plan_data + sources,
+                                          retrieval=not preamble, variant=prompt.variant)
             
-            async with httpx.AsyncClient(timeout=60.0) as client:
-                response = await client.post(url, json=payload, headers=headers)
-                response.raise_for_status()
+            async with self.admission.admit(priority, prompt.total) as permit:
+                started_ns = time.perf_counter_ns()
+                response = await self.upstream.post(payload)
+                answered_ns = time.perf_counter_ns()
+                permit.headers_received()
+                with self.telemetry.span("azure.decode"):
+                    result = response.json()
+                chat_response = self._parse_azure_response(result)
+                permit.usage = chat_response.token_usage
+            # Without streaming the whole answer is generated before the response arrives
+            self._record_generation("blocking", started_ns, answered_ns, chat_response.token_usage)
+            self.prompt_budget.record(prompt, chat_response.token_usage)
+            if preamble:
+                chat_response.answer = f"{preamble}\n\n{chat_response.answer}"
+                chat_response.has_table, chat_response.table_data, chat_response.tables = \
+                    self._extract_table(chat_response.answer)
+            if self.retriever is not None:
+                chat_response.citations = citations
+                chat_response.retrieved_chunks = retrieved_chunks
+            if cacheable:
+                self.response_cache.put(user_message, chat_response, prompt.variant)
+            return chat_response
                 
-                result = response.json()
-                return self._parse_azure_response(result)
-                
-        except httpx.TimeoutException:
-            raise Exception("Request timed out")
-        except httpx.HTTPStatusError as e:
-            raise Exception(f"Azure API error: {e.response.status_code} - {e.response.text}")
+        except UpstreamError:
+            raise
         except Exception as e:
             raise Exception(f"Unexpected error: {str(e)}")
     
+    def _record_generation(self, mode: str, started_ns: int, ended_ns: int,
+                           token_usage: Optional[Dict[str, int]]) -> None:
+        completion_tokens = (token_usage or {}).get("completion_tokens")
+        if completion_tokens and ended_ns > started_ns:
+            self.telemetry.tokens_per_second.observe(completion_tokens * 1e9 / (ended_ns - started_ns), (mode,))
+    
     def _clean_answer(self, answer: str) -> str:
         answer = re.sub(r'\[doc\d+\]', '', answer)
         return answer.strip()
     
-    def _extract_table(self, answer: str) -> Tuple[bool, Optional[str]]:
-        if '|' in answer and '---' in answer:
-            return True, answer
-        return False, None
+    def _extract_table(self, answer: str) -> Tuple[bool, Optional[str], List[TableData]]:
+        return self._table_fields(parse_tables(answer))
+    
+    def _table_fields(self, parser: MarkdownTableParser) -> Tuple[bool, Optional[str], List[TableData]]:
+        # table_data carries only the table markdown, not the whole answer again
+        if not parser.tables:
+            return False, None, []
+        tables = [TableData(columns=table["columns"], rows=table["rows"]) for table in parser.tables]
+        return True, "\n\n".join(parser.markdown), tables
+    
+    def _parse_context(self, context: Dict[str, Any]) -> Tuple[List[Citation], List[RetrievedChunk]]:
+        citations = []
+        retrieved_chunks = []
+        
+        if "citations" in context:
+            for citation in context["citations"]:
+                citations.append(Citation(
+                    content=citation.get("content", ""),
+                    title=citation.get("title"),
+                    url=citation.get("url"),
+                    filepath=citation.get("filepath")
+                ))
+        
+        if "messages" in context:
+            for msg in context["messages"]:
+                if msg.get("role") == "tool":
+                    retrieved_chunks.append(RetrievedChunk(
+                        content=msg.get("content", ""),
+                        metadata={"role": "tool"}
+                    ))
+        
+        return citations, retrieved_chunks
+    
+    def _parse_usage(self, result: Dict[str, Any]) -> Optional[Dict[str, int]]:
+        if not result.get("usage"):
+            return None
+        return {
+            "prompt_tokens": result["usage"].get("prompt_tokens", 0),
+            "completion_tokens": result["usage"].get("completion_tokens", 0),
+            "total_tokens": result["usage"].get("total_tokens", 0)
+        }
     
     def _parse_azure_response(self, result: Dict[str, Any]) -> ChatResponse:
+        with self.telemetry.span("azure.parse"):
+            return self._parse_azure_result(result)
+    
+    def _parse_azure_result(self, result: Dict[str, Any]) -> ChatResponse:
         try:
             choice = result["choices"][0]
             message = choice["message"]
@@ -136,38 +394,10 @@ class AzureRAGService:
             answer = message.get("content", "")
             answer = self._clean_answer(answer)
             
-            has_table, table_data = self._extract_table(answer)
-            
-            citations = []
-            retrieved_chunks = []
-            
-            if "context" in message:
-                context = message["context"]
-                
-                if "citations" in context:
-                    for citation in context["citations"]:
-                        citations.append(Citation(
-                            content=citation.get("content", ""),
-                            title=citation.get("title"),
-                            url=citation.get("url"),
-                            filepath=citation.get("filepath")
-                        ))
-                
-                if "messages" in context:
-                    for msg in context["messages"]:
-                        if msg.get("role") == "tool":
-                            retrieved_chunks.append(RetrievedChunk(
-                                content=msg.get("content", ""),
-                                metadata={"role": "tool"}
-                            ))
+            has_table, table_data, tables = self._extract_table(answer)
             
-            token_usage = None
-            if "usage" in result:
-                token_usage = {
-                    "prompt_tokens": result["usage"].get("prompt_tokens", 0),
-                    "completion_tokens": result["usage"].get("completion_tokens", 0),
-                    "total_tokens": result["usage"].get("total_tokens", 0)
-                }
+            citations, retrieved_chunks = self._parse_context(message.get("context") or {})
+            token_usage = self._parse_usage(result)
             
             return ChatResponse(
                 answer=answer,
@@ -175,7 +405,8 @@ class AzureRAGService:
                 retrieved_chunks=retrieved_chunks,
                 token_usage=token_usage,
                 has_table=has_table,
-                table_data=table_data
+                table_data=table_data,
+                tables=tables
             )
             
         except KeyError as e:
@@ -183,75 +414,241 @@ class AzureRAGService:
         except Exception as e:
             raise Exception(f"Error parsing response: {str(e)}")
     
-    async def chat_completion_stream(self, user_message: str, session_id: str) -> AsyncGenerator[Dict[str, Any], None]:
-        # Check for greetings/thanks first
-        greeting_response = self._is_greeting_or_thanks(user_message)
-        if greeting_response:
-            yield {"type": "content", "content": greeting_response, "done": True}
-            return
+    async def chat_completion_stream(self, user_message: str, session_id: str, filters: Optional[Dict[str, Any]] = None,
+                                     role: Optional[str] = None, priority: Optional[str] = None,
+                                     resume: bool = False, utilization: Optional[Dict[str, float]] = None
+                                     ) -> AsyncGenerator[Dict[str, Any], None]:
+        """Stream an answer as service chunks.
+
+        With ``resume`` (a client reconnecting after a dropped stream), the
+        answer is only replayable when it comes from a fixed text or from a
+        shared upstream stream that is still in flight. A fresh upstream
+        answer differs from the one the client saw, so it starts with a
+        ``reset`` chunk telling the client to discard what it has.
+        """
+        started_ns = time.perf_counter_ns()
+        self._refresh_index()
+        turns = await self.sessions.get_turns(session_id)
         
-        # Guardrail: Check if question is Medicare-related
-        if not await self._is_medicare_related(user_message):
-            response = "I'm a Medicare plan assistant and can only help with questions about health insurance plans, benefits, coverage, costs, and providers. Please ask me about Medicare plans or health insurance topics."
-            yield {"type": "content", "content": response, "done": True}
+        # Greetings, thanks and off-topic questions are answered without calling Azure
+        local_reply = self._local_reply(user_message, turns)
+        if local_reply:
+            self.telemetry.ttft.observe((time.perf_counter_ns() - started_ns) / 1e9, ("local",))
+            yield {"type": "content", "content": local_reply, "done": True}
             return
         
+        # Exact plan, formulary and network lookups are answered from the plan data without retrieval
+        direct, lookup = self._plan_lookup(user_message, turns, filters, utilization)
+        
+        # The role picks the system prompt; history gets what the token budget leaves it
+        prompt = self.prompt_budget.plan(role, user_message, turns, self._plan_data_messages(lookup),
+                                         self.history_token_budget)
+        
+        # Only unfiltered opening questions are cached; a follow-up's answer depends on the conversation
+        history = prompt.history
+        cacheable = not history and not filters and not utilization
+        cached = self.response_cache.get(user_message, prompt.variant) if direct is None and cacheable else None
+        if direct is not None:
+            source = "plan_data"
+            chunks = self.response_cache.replay_chunks(direct)
+        elif cached is not None:
+            source = "cache"
+            chunks = self.response_cache.replay_chunks(cached)
+        else:
+            source = "upstream"
+            # Concurrent identical questions subscribe to one shared upstream stream
+            flight_key = self._flight_key(user_message, history, filters, prompt.variant, utilization)
+            if resume and not self.stream_single_flight.in_flight(flight_key):
+                yield {"type": "reset", "done": False}
+            chunks = self.stream_single_flight.subscribe(
+                flight_key, lambda: self._stream_completion(user_message, prompt, filters, lookup, priority, cacheable)
+            )
+        
+        # The turn is remembered once the answer completed; a stream the client
+        # abandoned or that failed is not added to the conversation
+        answer_parts: List[str] = []
+        first_token_ns: Optional[int] = None
+        error: Optional[str] = "cancelled"
         try:
-            url = f"{self.azure_openai_endpoint}/openai/deployments/{self.azure_openai_deployment}/chat/completions?api-version=2024-10-21"
-            
-            headers = {
-                "Content-Type": "application/json",
-                "api-key": self.azure_openai_api_key
-            }
-            
-            payload = {
-                "messages": [
-                    {"role": "system", "content": PLAN_SHOPPER_SYSTEM_PROMPT},
-                    {"role": "user", "content": user_message}
-                ],
-                "data_sources": [
-                    {
-                        "type": "azure_search",
-                        "parameters": {
-                            "endpoint": self.azure_search_endpoint,
-                            "index_name": self.azure_search_index,
-                            "authentication": {
-                                "type": "api_key",
-                                "key": self.azure_search_api_key
-                            },
-                            "top_n_documents": 6,
-                            "query_type": "semantic"
-                        }
-                    }
-                ],
-                "stream": True
-            }
+            async for chunk in _as_async(chunks):
+                if chunk.get("type") == "content" and chunk.get("content"):
+                    if first_token_ns is None:
+                        first_token_ns = time.perf_counter_ns()
+                        self.telemetry.ttft.observe((first_token_ns - started_ns) / 1e9, (source,))
+                    answer_parts.append(chunk["content"])
+                elif chunk.get("type") == "done":
+                    error = None
+                    if answer_parts:
+                        await self.sessions.append(session_id, user_message, "".join(answer_parts))
+                elif chunk.get("type") == "error":
+                    error = chunk.get("error")
+                yield chunk
+        finally:
+            # Time to first token against the whole stream; a client that left shows up as "cancelled"
+            attributes = {"chat.source": source}
+            if first_token_ns is not None:
+                attributes["chat.ttft_ms"] = round((first_token_ns - started_ns) / 1e6, 2)
+            self.telemetry.tracer.record("chat.stream", started_ns, time.perf_counter_ns(), attributes, error)
+    
+    def _parse_stream_chunk(self, data: bytes) -> Optional[Dict[str, Any]]:
+        try:
+            return json.loads(data)
+        except json.JSONDecodeError:
+            self.stream_parse_errors += 1
+            logger.warning("Skipping unparseable Azure stream chunk: %r", data[:200])
+            return None
+    
+    async def _stream_completion(self, user_message: str, prompt: PromptPlan,
+                                 filters: Optional[Dict[str, Any]] = None, lookup: Optional[PlanLookup] = None,
+                                 priority: Optional[str] = None,
+                                 cacheable: bool = False) -> AsyncGenerator[Dict[str, Any], None]:
+        history = prompt.history
+        answer_parts: List[str] = []
+        citations: List[Citation] = []
+        retrieved_chunks: List[RetrievedChunk] = []
+        token_usage: Optional[Dict[str, int]] = None
+        marker_filter = CitationMarkerFilter()
+        table_parser = MarkdownTableParser()
+        preamble = lookup.preamble if lookup is not None else None
+        try:
+            if preamble:
+                # The computed comparison is sent right away; the model's narrative streams after it
+                sources = []
+                text = f"{preamble}\n\n"
+                answer_parts.append(text)
+                yield {"type": "content", "content": text, "done": False}
+                for row_event in table_parser.feed(text):
+                    yield {"type": "table_row", **row_event, "done": False}
+            else:
+                sources, citations, retrieved_chunks = await self._retrieve(user_message, prompt, filters)
+            if citations:
+                # Locally retrieved sources are known before the model starts answering
+                yield {
+                    "type": "citation",
+                    "citations": [citation.model_dump() for citation in citations],
+                    "retrieved_chunks": [chunk.model_dump() for chunk in retrieved_chunks],
+                    "done": False
+                }
+            payload = self._build_payload(user_message, stream=True,
+                                          history=history + prompt.plan_data + sources,
+                                          retrieval=not preamble, variant=prompt.variant)
             
-            async with httpx.AsyncClient(timeout=60.0) as client:
-                async with client.stream('POST', url, json=payload, headers=headers) as response:
-                    response.raise_for_status()
-                    
-                    async for line in response.aiter_lines():
-                        if line.startswith('data: '):
-                            chunk_data = line[6:].strip()
-                            if chunk_data == '[DONE]':
-                                yield {"type": "done", "done": True}
-                                break
+            # Admission holds a slot for the whole stream; retries, hedging and failover
+            # happen until the response headers arrive
+            async with self.admission.admit(priority, prompt.total) as permit, self.upstream.stream(payload) as response:
+                permit.headers_received()
+                headers_ns = time.perf_counter_ns()
+                first_token_ns: Optional[int] = None
+                # Decode SSE frames straight from the byte stream; most chunks are plain
+                # text deltas whose content is sliced out without a full json.loads
+                decoder = SSEDecoder()
+                async for raw in response.aiter_bytes():
+                    for event in decoder.feed(raw):
+                        if event.data == b'[DONE]':
+                            tail = marker_filter.flush()
+                            if tail:
+                                yield {"type": "content", "content": tail, "done": False}
+                                for row_event in table_parser.feed(tail):
+                                    yield {"type": "table_row", **row_event, "done": False}
+                            for row_event in table_parser.close():
+                                yield {"type": "table_row", **row_event, "done": False}
                             
-                            try:
-                                chunk_json = json.loads(chunk_data)
-                                if 'choices' in chunk_json and len(chunk_json['choices']) > 0:
-                                    choice = chunk_json['choices'][0]
-                                    if 'delta' in choice and 'content' in choice['delta']:
-                                        content = choice['delta']['content']
-                                        if content:
-                                            yield {"type": "content", "content": content, "done": False}
-                            except json.JSONDecodeError:
+                            answer = self._clean_answer("".join(answer_parts))
+                            done_ns = time.perf_counter_ns()
+                            self._record_generation("stream", first_token_ns or headers_ns, done_ns, token_usage)
+                            self.telemetry.tracer.record("azure.stream", headers_ns, done_ns, {
+                                "azure.completion_tokens": (token_usage or {}).get("completion_tokens", 0)
+                            })
+                            self.prompt_budget.record(prompt, token_usage)
+                            permit.usage = token_usage
+                            has_table, table_data, tables = self._table_fields(table_parser)
+                            if has_table:
+                                yield {
+                                    "type": "table",
+                                    "table_data": table_data,
+                                    "tables": [table.model_dump() for table in tables],
+                                    "done": False
+                                }
+                            
+                            if answer and cacheable:
+                                self.response_cache.put(user_message, ChatResponse(
+                                    answer=answer,
+                                    citations=citations,
+                                    retrieved_chunks=retrieved_chunks,
+                                    token_usage=token_usage,
+                                    has_table=has_table,
+                                    table_data=table_data,
+                                    tables=tables
+                                ), prompt.variant)
+                            yield {"type": "done", "done": True}
+                            return
+                        
+                        content = extract_delta_content(event.data)
+                        if content is FULL_PARSE:
+                            chunk_json = self._parse_stream_chunk(event.data)
+                            if chunk_json is None:
                                 continue
+                            
+                            choices = chunk_json.get("choices") or []
+                            delta = (choices[0].get("delta") or {}) if choices else {}
+                            content = delta.get("content")
+                            
+                            # "On your data" sends citations and retrieved documents in the first delta
+                            if delta.get("context"):
+                                citations, retrieved_chunks = self._parse_context(delta["context"])
+                                yield {
+                                    "type": "citation",
+                                    "citations": [citation.model_dump() for citation in citations],
+                                    "retrieved_chunks": [chunk.model_dump() for chunk in retrieved_chunks],
+                                    "done": False
+                                }
+                            
+                            usage = self._parse_usage(chunk_json)
+                            if usage:
+                                token_usage = usage
+                                yield {"type": "usage", "token_usage": token_usage, "done": False}
+                        
+                        if content:
+                            if first_token_ns is None:
+                                first_token_ns = time.perf_counter_ns()
+                            answer_parts.append(content)
+                            text = marker_filter.feed(content)
+                            if text:
+                                yield {"type": "content", "content": text, "done": False}
+                                # Table rows are emitted as soon as their line completes
+                                for row_event in table_parser.feed(text):
+                                    yield {"type": "table_row", **row_event, "done": False}
                                 
+        except UpstreamError as e:
+            yield {"type": "error", "error": str(e)}
         except httpx.TimeoutException:
             yield {"type": "error", "error": "Request timed out"}
-        except httpx.HTTPStatusError as e:
-            yield {"type": "error", "error": f"Azure API error: {e.response.status_code}"}
         except Exception as e:
             yield {"type": "error", "error": f"Unexpected error: {str(e)}"}
+
+
+async def _as_async(chunks: Union[Iterable[Dict[str, Any]], AsyncIterator[Dict[str, Any]]]) -> AsyncIterator[Dict[str, Any]]:
+    if hasattr(chunks, "__aiter__"):
+        async for chunk in chunks:
+            yield chunk
+    else:
+        for chunk in chunks:
+            yield chunk
+
+
+_rag_service: Optional[AzureRAGService] = None
+
+
+def init_rag_service() -> AzureRAGService:
+    """Build the shared service at startup so missing configuration fails fast."""
+    global _rag_service
+    if _rag_service is None:
+        _rag_service = AzureRAGService()
+    return _rag_service
+
+
+def get_rag_service() -> AzureRAGService:
+    """FastAPI dependency returning the process-wide AzureRAGService."""
+    if _rag_service is None:
+        return init_rag_service()
+    return _rag_service
@@ -0,0 +1,237 @@
+import math
+import re
+from dataclasses import dataclass, field, replace
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - numpy is optional
+    np = None
+
+# (profile field, plan copay column, typical allowed amount when the plan charges coinsurance instead)
+SERVICES = (
+    ("pcp_visits", "pcp_copay", 150.0),
+    ("specialist_visits", "specialist_copay", 250.0),
+    ("er_visits", "er_copay", 1500.0),
+    ("urgent_care_visits", "urgent_care_copay", 200.0),
+    ("inpatient_days", "inpatient_copay", 2800.0),
+)
+# Typical retail price of a 30-day fill per formulary tier, for coinsurance tiers and the drug deductible
+TIER_FILL_COSTS = {1: 10.0, 2: 40.0, 3: 500.0, 4: 800.0, 5: 1500.0}
+# Full price assumed for a drug the plan does not cover; it counts toward no cap
+UNCOVERED_FILL_COST = 500.0
+DEFAULT_COINSURANCE = 0.2
+# Part D out-of-pocket cap on covered drugs
+DRUG_OOP_CAP = 2100.0
+FILLS_PER_YEAR = 12
+
+_SERVICE_PATTERNS = (
+    ("pcp_visits", re.compile(
+        r"(\d+)\s+(?:primary care |pcp |doctor'?s? |office )?(?:visits?|appointments?|checkups?)\b"
+        r"|(?:primary care|pcp|my doctor)\s+(\d+)\s+times")),
+    ("specialist_visits", re.compile(r"(\d+)\s+specialist(?: visits?)?|specialists?\s+(\d+)\s+times")),
+    ("er_visits", re.compile(r"(\d+)\s+(?:er|emergency(?: room)?)(?: visits?| trips?)?\b|(?:er|emergency room)\s+(\d+)\s+times")),
+    ("urgent_care_visits", re.compile(r"(\d+)\s+urgent care(?: visits?)?|urgent care\s+(\d+)\s+times")),
+    ("inpatient_days", re.compile(r"(\d+)\s+(?:days?|nights?)\s+(?:in (?:the |a )?)?hospital|hospital stay of (\d+) days?")),
+)
+_LOW_USE = re.compile(r"\b(?:healthy|rarely|low use|low usage|don'?t see (?:the |a )?doctor)\b")
+_HIGH_USE = re.compile(r"\b(?:chronic|surgery|frequent|high use|high usage|a lot of (?:doctor|care))\b")
+
+
+@dataclass(frozen=True)
+class UtilizationProfile:
+    """Expected care in one year; ``drugs`` are formulary keys filled every month."""
+    pcp_visits: float = 4
+    specialist_visits: float = 2
+    er_visits: float = 0
+    urgent_care_visits: float = 1
+    inpatient_days: float = 0
+    drugs: Tuple[str, ...] = field(default_factory=tuple)
+    label: str = "moderate use"
+
+    def describe(self, drug_names: Optional[Dict[str, str]] = None) -> str:
+        parts = [f"{self.pcp_visits:g} primary care", f"{self.specialist_visits:g} specialist"]
+        if self.urgent_care_visits:
+            parts.append(f"{self.urgent_care_visits:g} urgent care")
+        if self.er_visits:
+            parts.append(f"{self.er_visits:g} ER")
+        text = ", ".join(parts) + " visits"
+        if self.inpatient_days:
+            text += f", {self.inpatient_days:g} hospital days"
+        if self.drugs:
+            names = [(drug_names or {}).get(drug, drug) for drug in self.drugs]
+            text += ", monthly " + ", ".join(names)
+        return text
+
+
+LOW_USE = UtilizationProfile(pcp_visits=2, specialist_visits=0, urgent_care_visits=0, label="low use")
+MODERATE_USE = UtilizationProfile()
+HIGH_USE = UtilizationProfile(pcp_visits=6, specialist_visits=6, er_visits=1, urgent_care_visits=2,
+                              inpatient_days=3, label="high use")
+
+
+def parse_profile(message: str, drugs: Sequence[str] = (),
+                  overrides: Optional[Dict[str, Any]] = None) -> UtilizationProfile:
+    """Utilization described in ``message`` on top of a low/moderate/high preset.
+
+    ``overrides`` (the request's ``utilization``) sets fields
+    directly, e.g. ``{"specialist_visits": 6}``.
+    """
+    text = message.lower()
+    profile = LOW_USE if _LOW_USE.search(text) else HIGH_USE if _HIGH_USE.search(text) else MODERATE_USE
+    values: Dict[str, Any] = {}
+    for name, pattern in _SERVICE_PATTERNS:
+        match = pattern.search(text)
+        if match:
+            values[name] = float(next(group for group in match.groups() if group))
+    for name, value in (overrides or {}).items():
+        if name in {service for service, _, _ in SERVICES}:
+            values[name] = float(value)
+    if drugs:
+        values["drugs"] = tuple(drugs)
+    if values:
+        values["label"] = "your expected use"
+    return replace(profile, **values)
+
+
+@dataclass
+class CostEstimate:
+    """Estimated yearly member cost of one plan row for a profile."""
+    row: int
+    premiums: float
+    medical: float
+    drugs: float
+    total: float
+    uncovered_drugs: Tuple[str, ...] = ()
+
+
+def _drug_columns(snapshot, plan_ids: Sequence[str], drugs: Sequence[str]) -> Tuple[List[float], List[float], List[float], List[Tuple[str, ...]]]:
+    """Per plan: yearly plan cost and retail value of covered fills, full price of uncovered ones."""
+    plan_cost = [0.0] * len(plan_ids)
+    retail = [0.0] * len(plan_ids)
+    uncovered = [0.0] * len(plan_ids)
+    missing: List[Tuple[str, ...]] = [()] * len(plan_ids)
+    for drug in drugs:
+        entries = snapshot.formulary.get(drug, {})
+        for i, plan_id in enumerate(plan_ids):
+            index = entries.get(plan_id)
+            if index is None:
+                uncovered[i] += UNCOVERED_FILL_COST * FILLS_PER_YEAR
+                missing[i] += (snapshot.drug_display.get(drug, drug),)
+                continue
+            fill_retail = TIER_FILL_COSTS.get(snapshot.drug_tier[index], UNCOVERED_FILL_COST)
+            copay = snapshot.drug_copay[index]
+            coinsurance = snapshot.drug_coinsurance[index]
+            if not math.isnan(copay):
+                fill = copay
+            else:
+                fill = fill_retail * (DEFAULT_COINSURANCE if math.isnan(coinsurance) else coinsurance)
+            plan_cost[i] += fill * FILLS_PER_YEAR
+            retail[i] += fill_retail * FILLS_PER_YEAR
+    return plan_cost, retail, uncovered, missing
+
+
+def estimate_costs(snapshot, rows: Sequence[int], profile: UtilizationProfile) -> List[CostEstimate]:
+    """Estimated yearly cost of every plan row for ``profile``, cheapest first.
+
+    Services with a copay cost the copay; services without one cost their
+    typical allowed amount, paid through the deductible and then at the
+    plan's coinsurance, with medical spending capped at the plan's MOOP.
+    Covered drugs are paid at retail until the drug deductible is met and at
+    the plan's tier cost after that, up to the Part D cap; uncovered drugs
+    cost full price. With numpy the plan columns are gathered and computed
+    as arrays in one pass; ties rank the higher star rating first.
+    """
+    if not rows:
+        return []
+    numbers = snapshot.plan_numbers
+    plan_ids = [snapshot.plan_columns["plan_id"][row] for row in rows]
+    drug_cost, drug_retail, uncovered, missing = _drug_columns(snapshot, plan_ids, profile.drugs)
+    counts = [getattr(profile, service) for service, _, _ in SERVICES]
+
+    if np is not None:
+        index = np.asarray(rows, dtype=np.intp)
+
+        def column(name: str) -> "np.ndarray":
+            return np.frombuffer(numbers[name], dtype=np.float64)[index]
+
+        copays = np.zeros(len(rows))
+        coinsurance_base = np.zeros(len(rows))
+        for count, (_, copay_column, allowed) in zip(counts, SERVICES):
+            if count:
+                copay = column(copay_column)
+                copays += np.where(np.isnan(copay), 0.0, copay * count)
+                coinsurance_base += np.where(np.isnan(copay), allowed * count, 0.0)
+        deductible = np.minimum(coinsurance_base, np.nan_to_num(column("deductible")))
+        coinsurance = column("coinsurance")
+        coinsurance = np.where(np.isnan(coinsurance), DEFAULT_COINSURANCE, coinsurance)
+        medical = copays + deductible + (coinsurance_base - deductible) * coinsurance
+        medical = np.minimum(medical, np.nan_to_num(column("moop"), nan=np.inf))
+
+        drug_cost, drug_retail = np.asarray(drug_cost), np.asarray(drug_retail)
+        drug_deductible = np.minimum(drug_retail, np.nan_to_num(column("drug_deductible")))
+        after_deductible = np.divide(drug_cost * (drug_retail - drug_deductible), drug_retail,
+                                     out=np.zeros(len(rows)), where=drug_retail > 0)
+        drugs = np.minimum(drug_deductible + after_deductible, DRUG_OOP_CAP) + np.asarray(uncovered)
+        premiums = np.nan_to_num(column("monthly_premium")) * 12
+        totals = premiums + medical + drugs
+        stars = np.nan_to_num(column("star_rating"))
+        order = np.lexsort((-stars, np.round(totals, 2)))
+        return [
+            CostEstimate(rows[i], float(premiums[i]), float(medical[i]), float(drugs[i]), float(totals[i]), missing[i])
+            for i in order
+        ]
+
+    estimates = []
+    for i, row in enumerate(rows):
+        copays = coinsurance_base = 0.0
+        for count, (_, copay_column, allowed) in zip(counts, SERVICES):
+            copay = numbers[copay_column][row]
+            if math.isnan(copay):
+                coinsurance_base += allowed * count
+            else:
+                copays += copay * count
+        deductible = min(coinsurance_base, _or(numbers["deductible"][row], 0.0))
+        coinsurance = _or(numbers["coinsurance"][row], DEFAULT_COINSURANCE)
+        medical = min(copays + deductible + (coinsurance_base - deductible) * coinsurance,
+                      _or(numbers["moop"][row], math.inf))
+        drug_deductible = min(drug_retail[i], _or(numbers["drug_deductible"][row], 0.0))
+        after_deductible = drug_cost[i] * (drug_retail[i] - drug_deductible) / drug_retail[i] if drug_retail[i] else 0.0
+        drugs = min(drug_deductible + after_deductible, DRUG_OOP_CAP) + uncovered[i]
+        premiums = _or(numbers["monthly_premium"][row], 0.0) * 12
+        estimates.append(CostEstimate(row, premiums, medical, drugs, premiums + medical + drugs, missing[i]))
+    estimates.sort(key=lambda e: (round(e.total, 2), -_or(numbers["star_rating"][e.row], 0.0)))
+    return estimates
+
+
+def _or(value: float, default: float) -> float:
+    return default if math.isnan(value) else value
+
+
+def _money(value: float) -> str:
+    return f"${value:,.0f}"
+
+
+def comparison_table(snapshot, estimates: Sequence[CostEstimate], limit: int = 10) -> str:
+    """Markdown table of the ``limit`` cheapest estimates; uncovered drugs are flagged with ``*``."""
+    lines = [
+        "| Rank | Plan | Plan ID | Type | Yearly premiums | Medical costs | Drug costs | Estimated yearly total | Stars |",
+        "|---|---|---|---|---|---|---|---|---|",
+    ]
+    flagged = False
+    for rank, estimate in enumerate(estimates[:limit], 1):
+        row = estimate.row
+        stars = snapshot.plan_numbers["star_rating"][row]
+        drugs = _money(estimate.drugs)
+        if estimate.uncovered_drugs:
+            drugs += "*"
+            flagged = True
+        lines.append(
+            f"| {rank} | {snapshot.plan_columns['name'][row]} | {snapshot.plan_columns['plan_id'][row]} | "
+            f"{snapshot.plan_columns['plan_type'][row]} | {_money(estimate.premiums)} | {_money(estimate.medical)} | "
+            f"{drugs} | {_money(estimate.total)} | {'n/a' if math.isnan(stars) else f'{stars:g}'} |"
+        )
+    table = "\n".join(lines)
+    if flagged:
+        table += "\n\n\\* Includes drugs the plan does not cover, at full retail price."
+    return table
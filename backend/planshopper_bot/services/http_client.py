@@ -0,0 +1,245 @@
+import asyncio
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Dict, Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+
+def _env_float(name: str, default: float) -> float:
+    value = os.getenv(name)
+    return float(value) if value else default
+
+
+def _env_int(name: str, default: int) -> int:
+    value = os.getenv(name)
+    return int(value) if value else default
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+    if not value:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+@dataclass(frozen=True)
+class HTTPClientConfig:
+    max_connections: int = 100
+    max_keepalive_connections: int = 20
+    keepalive_expiry: float = 30.0
+    http2: bool = False
+    connect_timeout: float = 5.0
+    read_timeout: float = 60.0
+    write_timeout: float = 10.0
+    pool_timeout: float = 5.0
+    first_byte_timeout: float = 30.0
+    # Keep-alive connections opened per upstream host at startup, so the first requests skip TCP/TLS setup
+    warm_connections: int = 0
+
+    @classmethod
+    def from_env(cls) -> "HTTPClientConfig":
+        return cls(
+            max_connections=_env_int("AZURE_HTTP_MAX_CONNECTIONS", cls.max_connections),
+            max_keepalive_connections=_env_int("AZURE_HTTP_MAX_KEEPALIVE", cls.max_keepalive_connections),
+            keepalive_expiry=_env_float("AZURE_HTTP_KEEPALIVE_EXPIRY", cls.keepalive_expiry),
+            http2=_env_bool("AZURE_HTTP2", cls.http2),
+            connect_timeout=_env_float("AZURE_HTTP_CONNECT_TIMEOUT", cls.connect_timeout),
+            read_timeout=_env_float("AZURE_HTTP_READ_TIMEOUT", cls.read_timeout),
+            write_timeout=_env_float("AZURE_HTTP_WRITE_TIMEOUT", cls.write_timeout),
+            pool_timeout=_env_float("AZURE_HTTP_POOL_TIMEOUT", cls.pool_timeout),
+            first_byte_timeout=_env_float("AZURE_HTTP_FIRST_BYTE_TIMEOUT", cls.first_byte_timeout),
+            warm_connections=_env_int("AZURE_HTTP_WARM_CONNECTIONS", cls.warm_connections),
+        )
+
+
+class PooledHTTPClient:
+    """Process-wide httpx.AsyncClient with pool accounting.
+
+    httpx does not expose its connection pool state, so the wrapper counts
+    requests in flight around every call; with keep-alive that is the number
+    of connections checked out of the pool.
+    """
+
+    def __init__(self, config: Optional[HTTPClientConfig] = None):
+        self.config = config or HTTPClientConfig.from_env()
+        self._client: Optional[httpx.AsyncClient] = None
+        self._in_flight = 0
+        self._peak_in_flight = 0
+        self._total_requests = 0
+        self._saturated_requests = 0
+        self._first_byte_timeouts = 0
+        self._wait_seconds_total = 0.0
+
+    def _build_client(self) -> httpx.AsyncClient:
+        http2 = self.config.http2
+        if http2:
+            try:
+                import h2  # noqa: F401
+            except ImportError:
+                logger.warning("AZURE_HTTP2 is enabled but the 'h2' package is not installed; using HTTP/1.1")
+                http2 = False
+
+        limits = httpx.Limits(
+            max_connections=self.config.max_connections,
+            max_keepalive_connections=self.config.max_keepalive_connections,
+            keepalive_expiry=self.config.keepalive_expiry,
+        )
+        timeout = httpx.Timeout(
+            connect=self.config.connect_timeout,
+            read=self.config.read_timeout,
+            write=self.config.write_timeout,
+            pool=self.config.pool_timeout,
+        )
+        return httpx.AsyncClient(limits=limits, timeout=timeout, http2=http2)
+
+    async def start(self) -> None:
+        if self._client is None:
+            self._client = self._build_client()
+
+    async def close(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            raise RuntimeError("HTTP client is not started")
+        return self._client
+
+    async def warm(self, url: str, connections: Optional[int] = None) -> int:
+        """Open keep-alive connections to ``url``'s host; returns how many came up.
+
+        Each connection is opened with a GET of the host root, whose status
+        is ignored. Failures are logged and left to the first real request.
+        """
+        connections = min(self.config.warm_connections if connections is None else connections,
+                          self.config.max_keepalive_connections)
+        origin = httpx.URL(url).copy_with(path="/", query=None)
+
+        async def connect() -> bool:
+            try:
+                await self.client.get(origin)
+                return True
+            except httpx.HTTPError as e:
+                logger.warning("Could not warm a connection to %s: %s", origin.host, e)
+                return False
+
+        # Concurrent requests cannot share a connection, so each one opens its own
+        results = await asyncio.gather(*(connect() for _ in range(connections)))
+        return sum(results)
+
+    def _acquire(self) -> None:
+        self._total_requests += 1
+        if self._in_flight >= self.config.max_connections:
+            self._saturated_requests += 1
+        self._in_flight += 1
+        self._peak_in_flight = max(self._peak_in_flight, self._in_flight)
+
+    def _release(self) -> None:
+        self._in_flight -= 1
+
+    async def _send(self, request: httpx.Request) -> httpx.Response:
+        # The read timeout applies per socket read; the first-byte timeout
+        # bounds the wait for response headers, which for Azure "on your data"
+        # includes the whole retrieval step.
+        started = time.perf_counter()
+        try:
+            return await asyncio.wait_for(
+                self.client.send(request, stream=True),
+                timeout=self.config.first_byte_timeout,
+            )
+        except asyncio.TimeoutError:
+            self._first_byte_timeouts += 1
+            raise httpx.ReadTimeout("Timed out waiting for the first response byte", request=request)
+        finally:
+            self._wait_seconds_total += time.perf_counter() - started
+
+    async def post(self, url: str, **kwargs: Any) -> httpx.Response:
+        request = self.client.build_request("POST", url, **kwargs)
+        self._acquire()
+        try:
+            response = await self._send(request)
+            try:
+                await response.aread()
+            finally:
+                await response.aclose()
+            return response
+        finally:
+            self._release()
+
+    async def open_stream(self, method: str, url: str, **kwargs: Any) -> httpx.Response:
+        """Send a request and return once its headers arrived; the body is left unread.
+
+        The response holds a pooled connection until it is passed to
+        ``close_stream``, which may happen in another task.
+        """
+        request = self.client.build_request(method, url, **kwargs)
+        self._acquire()
+        try:
+            return await self._send(request)
+        except BaseException:
+            self._release()
+            raise
+
+    async def close_stream(self, response: httpx.Response) -> None:
+        try:
+            await response.aclose()
+        finally:
+            self._release()
+
+    @asynccontextmanager
+    async def stream(self, method: str, url: str, **kwargs: Any) -> AsyncIterator[httpx.Response]:
+        response = await self.open_stream(method, url, **kwargs)
+        try:
+            yield response
+        finally:
+            await self.close_stream(response)
+
+    def metrics(self) -> Dict[str, Any]:
+        max_connections = self.config.max_connections
+        return {
+            "started": self._client is not None,
+            "http2": self.config.http2,
+            "max_connections": max_connections,
+            "max_keepalive_connections": self.config.max_keepalive_connections,
+            "in_flight": self._in_flight,
+            "peak_in_flight": self._peak_in_flight,
+            "saturation": round(self._in_flight / max_connections, 4) if max_connections else 0.0,
+            "peak_saturation": round(self._peak_in_flight / max_connections, 4) if max_connections else 0.0,
+            "total_requests": self._total_requests,
+            "saturated_requests": self._saturated_requests,
+            "first_byte_timeouts": self._first_byte_timeouts,
+            "avg_time_to_headers_ms": round(
+                self._wait_seconds_total / self._total_requests * 1000, 3
+            ) if self._total_requests else 0.0,
+        }
+
+
+_http_client: Optional[PooledHTTPClient] = None
+
+
+async def start_http_client() -> None:
+    global _http_client
+    if _http_client is None:
+        _http_client = PooledHTTPClient()
+    await _http_client.start()
+
+
+async def close_http_client() -> None:
+    global _http_client
+    if _http_client is not None:
+        await _http_client.close()
+        _http_client = None
+
+
+def get_http_client() -> PooledHTTPClient:
+    if _http_client is None:
+        raise RuntimeError("HTTP client is not started; start_http_client() must run at application startup")
+    return _http_client
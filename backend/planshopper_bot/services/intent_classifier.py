@@ -0,0 +1,191 @@
+import json
+import math
+import os
+import re
+from collections import Counter
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
+
+GREETING = "greeting"
+THANKS = "thanks"
+IN_DOMAIN = "in_domain"
+OUT_OF_DOMAIN = "out_of_domain"
+
+DEFAULT_MODEL_PATH = Path(__file__).resolve().parent.parent / "data" / "intent_model.json"
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+# Longest phrase in the lexicons ("out of pocket", "over the counter")
+_MAX_PHRASE = 3
+
+
+def _stem(token: str) -> str:
+    # Fold simple plurals so "plans", "copays" and "doctors" hit the same entries as the singular
+    if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+        return token[:-1]
+    return token
+
+
+def tokenize(text: str) -> List[str]:
+    return [_stem(token) for token in _TOKEN.findall(text.lower())]
+
+
+def _phrase_set(phrases: Iterable[str]) -> FrozenSet[Tuple[str, ...]]:
+    return frozenset(tuple(tokenize(phrase)) for phrase in phrases if tokenize(phrase))
+
+
+def _features(tokens: List[str]) -> Set[str]:
+    features = set(tokens)
+    features.update(f"{a} {b}" for a, b in zip(tokens, tokens[1:]))
+    return features
+
+
+@dataclass(frozen=True)
+class IntentConfig:
+    model_path: str = str(DEFAULT_MODEL_PATH)
+    # Only answer "out of domain" when fairly sure: a wrong refusal sends a member away,
+    # a wrong acceptance only costs one Azure call
+    out_of_domain_threshold: float = 0.6
+    smoothing: float = 0.5
+    # Log-odds added when the message names at least one domain lexicon phrase; such a message is
+    # never refused, the bonus only raises the reported confidence
+    domain_match_bonus: float = 1.5
+
+    @classmethod
+    def from_env(cls) -> "IntentConfig":
+        return cls(
+            model_path=os.getenv("INTENT_MODEL_PATH", cls.model_path),
+            out_of_domain_threshold=float(os.getenv("INTENT_OUT_OF_DOMAIN_THRESHOLD", cls.out_of_domain_threshold)),
+            smoothing=float(os.getenv("INTENT_SMOOTHING", cls.smoothing)),
+            domain_match_bonus=float(os.getenv("INTENT_DOMAIN_MATCH_BONUS", cls.domain_match_bonus)),
+        )
+
+
+@dataclass(frozen=True)
+class IntentResult:
+    intent: str
+    confidence: float
+    # Domain lexicon phrases found in the message, for logging and evaluation
+    matched: Tuple[str, ...] = field(default=())
+
+
+class IntentClassifier:
+    """Local pre-retrieval intent engine: greeting / thanks / in-domain / out-of-domain.
+
+    Messages are tokenized on word boundaries, so "this plan" no longer
+    contains the greeting "hi". A message is small talk only when every
+    token is part of a greeting, thanks or filler phrase; "hi, what is my
+    deductible?" is a question and goes to retrieval.
+
+    Everything else is scored by a naive Bayes model over unigrams and
+    bigrams, trained once at load from the labelled examples in the model
+    file with the domain lexicon added as extra in-domain evidence. The
+    model is reduced to one log-odds weight per feature, so classifying is
+    a handful of set and dict lookups per message. A message naming a
+    domain lexicon phrase ("dental", "enroll", a carrier) is never refused,
+    whatever the other words weigh; one made only of words the model has
+    never seen is.
+    """
+
+    def __init__(self, config: Optional[IntentConfig] = None):
+        self.config = config or IntentConfig.from_env()
+        with open(self.config.model_path, encoding="utf-8") as f:
+            model = json.load(f)
+
+        self.version = model.get("version", 0)
+        self._greetings = _phrase_set(model["greetings"])
+        self._thanks = _phrase_set(model["thanks"])
+        self._filler = _phrase_set(model["small_talk_filler"])
+        self._domain_terms = _phrase_set(model["domain_terms"])
+        self._weights, self._bias = self._train(model["examples"], model["domain_terms"])
+        self.counts: Counter = Counter()
+
+    def _train(self, examples: Dict[str, List[str]], domain_terms: List[str]) -> Tuple[Dict[str, float], float]:
+        documents = {
+            IN_DOMAIN: [_features(tokenize(text)) for text in examples[IN_DOMAIN] + domain_terms],
+            OUT_OF_DOMAIN: [_features(tokenize(text)) for text in examples[OUT_OF_DOMAIN]],
+        }
+        counts = {label: Counter(f for doc in docs for f in doc) for label, docs in documents.items()}
+        vocabulary = set(counts[IN_DOMAIN]) | set(counts[OUT_OF_DOMAIN])
+        alpha = self.config.smoothing
+
+        def log_likelihoods(label: str) -> Dict[str, float]:
+            denominator = sum(counts[label].values()) + alpha * len(vocabulary)
+            return {f: math.log((counts[label][f] + alpha) / denominator) for f in vocabulary}
+
+        in_domain, out_of_domain = log_likelihoods(IN_DOMAIN), log_likelihoods(OUT_OF_DOMAIN)
+        weights = {f: in_domain[f] - out_of_domain[f] for f in vocabulary}
+        # Priors from the real examples only; the lexicon entries are not questions
+        bias = math.log(len(examples[IN_DOMAIN]) / len(examples[OUT_OF_DOMAIN]))
+        return weights, bias
+
+    def _small_talk(self, tokens: List[str]) -> Optional[str]:
+        greeting = thanks = False
+        i = 0
+        while i < len(tokens):
+            for size in range(min(_MAX_PHRASE, len(tokens) - i), 0, -1):
+                phrase = tuple(tokens[i:i + size])
+                if phrase in self._thanks:
+                    thanks = True
+                elif phrase in self._greetings:
+                    greeting = True
+                elif phrase not in self._filler:
+                    continue
+                i += size
+                break
+            else:
+                return None
+        if thanks:
+            return THANKS
+        return GREETING if greeting else None
+
+    def _domain_matches(self, tokens: List[str]) -> Tuple[str, ...]:
+        matched = []
+        for size in range(1, _MAX_PHRASE + 1):
+            for i in range(len(tokens) - size + 1):
+                phrase = tuple(tokens[i:i + size])
+                if phrase in self._domain_terms:
+                    matched.append(" ".join(phrase))
+        return tuple(matched)
+
+    def classify(self, message: str, context: str = "") -> IntentResult:
+        """Classify ``message``; ``context`` (the previous question) also counts towards the domain score.
+
+        Follow-ups such as "what about the second one?" carry no domain words
+        of their own, so in a conversation they are judged with the question
+        they follow up on.
+        """
+        tokens = tokenize(message)
+        if not tokens:
+            result = IntentResult(OUT_OF_DOMAIN, 1.0)
+        else:
+            small_talk = self._small_talk(tokens)
+            if small_talk is not None:
+                result = IntentResult(small_talk, 1.0)
+            else:
+                if context:
+                    tokens = tokenize(context) + tokens
+                weights = self._weights
+                matched = self._domain_matches(tokens)
+                known = [weights[f] for f in _features(tokens) if f in weights]
+                score = self._bias + sum(known)
+                if matched:
+                    score += self.config.domain_match_bonus
+                p_in = 1.0 / (1.0 + math.exp(-max(-50.0, min(50.0, score))))
+                if not known:
+                    # No word the model has ever seen (gibberish, another language): nothing to answer from
+                    result = IntentResult(OUT_OF_DOMAIN, 1.0)
+                elif not matched and 1.0 - p_in >= self.config.out_of_domain_threshold:
+                    result = IntentResult(OUT_OF_DOMAIN, 1.0 - p_in, matched)
+                else:
+                    result = IntentResult(IN_DOMAIN, p_in, matched)
+        self.counts[result.intent] += 1
+        return result
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "model_version": self.version,
+            "features": len(self._weights),
+            "out_of_domain_threshold": self.config.out_of_domain_threshold,
+            "classified": dict(self.counts),
+        }
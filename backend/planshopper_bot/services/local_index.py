@@ -0,0 +1,375 @@
+import hashlib
+import heapq
+import json
+import math
+import mmap
+import os
+import re
+import shutil
+import sys
+from array import array
+from bisect import bisect_left
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - numpy is optional
+    np = None
+
+INDEX_FORMAT = 1
+CURRENT_POINTER = "CURRENT"
+VERSIONS_DIR = "versions"
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+_STOPWORDS = frozenset(
+    "a an and are as at be by can do does for from has have how i if in is it its me my of on or "
+    "our so than that the their them then there these they this to was what when where which who "
+    "why will with would you your".split()
+)
+
+# Files of an index directory; every array is little-endian and read through mmap
+_META = "meta.json"
+_TERMS = "terms.u64"              # sorted 64-bit term hashes
+_POSTING_OFFSETS = "postings.idx"  # uint64, len(terms) + 1 offsets into postings (in entries)
+_POSTINGS = "postings.u32"        # interleaved (chunk id, term frequency) pairs, ids ascending
+_CHUNK_LENGTHS = "lengths.u32"     # indexed terms per chunk
+_CHUNK_OFFSETS = "chunks.idx"      # uint64, len(chunks) + 1 byte offsets into chunks.jsonl
+_CHUNKS = "chunks.jsonl"
+_VECTORS = "vectors.f32"           # optional, len(chunks) x dim, L2-normalized
+
+
+def analyze(text: str) -> List[str]:
+    """Index/query terms: lowercase words without stopwords, simple plurals folded."""
+    terms = []
+    for token in _TOKEN.findall(text.lower()):
+        if token in _STOPWORDS:
+            continue
+        if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+            token = token[:-1]
+        terms.append(token)
+    return terms
+
+
+def term_hash(term: str) -> int:
+    return int.from_bytes(hashlib.blake2b(term.encode(), digest_size=8).digest(), "little")
+
+
+def metadata_term(field: str, value: Any) -> str:
+    # Metadata values are indexed as ordinary terms that no text token can produce
+    return f"{field}={str(value).strip().lower()}"
+
+
+def resolve_index_path(path: str) -> str:
+    """The live index directory for ``path``.
+
+    ``path`` is either an index directory or an artifact root written by
+    ``scripts/ingest_documents.py``, whose ``CURRENT`` file names the live
+    version under ``versions/``.
+    """
+    pointer = os.path.join(path, CURRENT_POINTER)
+    if not os.path.exists(pointer):
+        return path
+    with open(pointer, encoding="utf-8") as f:
+        return os.path.join(path, VERSIONS_DIR, f.read().strip())
+
+
+def publish_index(root: str, version: str) -> None:
+    """Point ``root``'s ``CURRENT`` at ``versions/<version>`` with an atomic rename."""
+    tmp = os.path.join(root, f".{CURRENT_POINTER}.{os.getpid()}")
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(version + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, os.path.join(root, CURRENT_POINTER))
+
+
+def _write_array(path: str, typecode: str, values: Iterable[Any]) -> None:
+    data = array(typecode, values)
+    if sys.byteorder != "little":
+        data.byteswap()
+    with open(path, "wb") as f:
+        data.tofile(f)
+
+
+def _normalize(vector: Sequence[float]) -> List[float]:
+    norm = math.sqrt(sum(x * x for x in vector)) or 1.0
+    return [x / norm for x in vector]
+
+
+def build_index(
+    chunks: Iterable[Dict[str, Any]],
+    out_dir: str,
+    metadata_fields: Sequence[str] = ("county", "plan_type"),
+    embeddings: Optional[Iterable[Sequence[float]]] = None,
+    version: str = "",
+) -> Dict[str, Any]:
+    """Write a BM25 (and optionally vector) index of ``chunks`` to ``out_dir``.
+
+    Each chunk is a dict with ``content`` and optionally ``title``, ``url``,
+    ``filepath`` and ``metadata``. ``metadata_fields`` values become
+    filterable. ``embeddings``, if given, holds one vector per chunk in the
+    same order. The directory is written next to ``out_dir`` and renamed
+    into place, so readers never see a half-written index.
+    """
+    tmp_dir = out_dir.rstrip("/") + ".tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    postings: Dict[int, List[int]] = {}
+    lengths: List[int] = []
+    offsets = [0]
+    total_length = 0
+    vectors = iter(embeddings) if embeddings is not None else None
+    dim = 0
+
+    with open(os.path.join(tmp_dir, _CHUNKS), "wb") as chunk_file, \
+            (open(os.path.join(tmp_dir, _VECTORS), "wb") if vectors is not None else open(os.devnull, "wb")) as vector_file:
+        for chunk_id, chunk in enumerate(chunks):
+            metadata = chunk.get("metadata") or {}
+            record = {
+                "content": chunk["content"],
+                "title": chunk.get("title"),
+                "url": chunk.get("url"),
+                "filepath": chunk.get("filepath"),
+                "metadata": metadata,
+            }
+            line = json.dumps(record, ensure_ascii=False).encode() + b"\n"
+            chunk_file.write(line)
+            offsets.append(offsets[-1] + len(line))
+
+            terms = analyze(f"{chunk.get('title') or ''}\n{chunk['content']}")
+            lengths.append(len(terms))
+            total_length += len(terms)
+            counts = Counter(terms)
+            for field in metadata_fields:
+                values = metadata.get(field)
+                for value in values if isinstance(values, list) else [values] if values is not None else []:
+                    counts[metadata_term(field, value)] = 1
+            for term, tf in counts.items():
+                postings.setdefault(term_hash(term), []).extend((chunk_id, min(tf, 0xFFFFFFFF)))
+
+            if vectors is not None:
+                vector = _normalize(next(vectors))
+                dim = dim or len(vector)
+                if len(vector) != dim:
+                    raise ValueError(f"Embedding {chunk_id} has {len(vector)} dimensions, expected {dim}")
+                data = array("f", vector)
+                if sys.byteorder != "little":
+                    data.byteswap()
+                data.tofile(vector_file)
+
+    terms = sorted(postings)
+    posting_offsets = [0]
+    flat = array("I")
+    for term in terms:
+        flat.extend(postings[term])
+        posting_offsets.append(len(flat) // 2)
+
+    _write_array(os.path.join(tmp_dir, _TERMS), "Q", terms)
+    _write_array(os.path.join(tmp_dir, _POSTING_OFFSETS), "Q", posting_offsets)
+    _write_array(os.path.join(tmp_dir, _POSTINGS), "I", flat)
+    _write_array(os.path.join(tmp_dir, _CHUNK_LENGTHS), "I", lengths)
+    _write_array(os.path.join(tmp_dir, _CHUNK_OFFSETS), "Q", offsets)
+
+    meta = {
+        "format": INDEX_FORMAT,
+        "version": version,
+        "chunks": len(lengths),
+        "terms": len(terms),
+        "avg_length": total_length / len(lengths) if lengths else 0.0,
+        "metadata_fields": list(metadata_fields),
+        "vector_dim": dim,
+    }
+    with open(os.path.join(tmp_dir, _META), "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+
+    shutil.rmtree(out_dir, ignore_errors=True)
+    os.replace(tmp_dir, out_dir)
+    return meta
+
+
+class _Mapped:
+    """A read-only mmap of one index file viewed as a typed array."""
+
+    def __init__(self, path: str, typecode: str):
+        self._file = open(path, "rb")
+        size = os.fstat(self._file.fileno()).st_size
+        if size:
+            self._mmap: Optional[mmap.mmap] = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            self.view = memoryview(self._mmap).cast(typecode) if typecode else memoryview(self._mmap)
+        else:
+            self._mmap = None
+            self.view = memoryview(b"").cast(typecode) if typecode else memoryview(b"")
+
+    def prefetch(self) -> None:
+        if self._mmap is not None and hasattr(mmap, "MADV_WILLNEED"):
+            self._mmap.madvise(mmap.MADV_WILLNEED)
+
+    def close(self) -> None:
+        self.view.release()
+        if self._mmap is not None:
+            self._mmap.close()
+        self._file.close()
+
+
+class LocalIndex:
+    """Memory-mapped reader for an index written by ``build_index``.
+
+    Opening an index maps its files and parses only ``meta.json``, so it
+    takes milliseconds whatever the index size, and every worker process
+    mapping the same directory shares one copy in the page cache. Terms
+    are found by binary search over the sorted hash array; chunk text is
+    decoded only for the results returned.
+    """
+
+    def __init__(self, path: str, k1: float = 1.2, b: float = 0.75):
+        if sys.byteorder != "little":  # pragma: no cover
+            raise RuntimeError("Local index files are little-endian")
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        with open(os.path.join(path, _META), encoding="utf-8") as f:
+            self.meta = json.load(f)
+        if self.meta.get("format") != INDEX_FORMAT:
+            raise ValueError(f"Unsupported index format {self.meta.get('format')} in {path}")
+
+        self._terms = _Mapped(os.path.join(path, _TERMS), "Q")
+        self._posting_offsets = _Mapped(os.path.join(path, _POSTING_OFFSETS), "Q")
+        self._postings = _Mapped(os.path.join(path, _POSTINGS), "I")
+        self._lengths = _Mapped(os.path.join(path, _CHUNK_LENGTHS), "I")
+        self._chunk_offsets = _Mapped(os.path.join(path, _CHUNK_OFFSETS), "Q")
+        self._chunks = _Mapped(os.path.join(path, _CHUNKS), "")
+        self._vectors: Optional[_Mapped] = None
+        self._matrix = None
+        if self.meta.get("vector_dim"):
+            self._vectors = _Mapped(os.path.join(path, _VECTORS), "f")
+            if np is not None:
+                self._matrix = np.frombuffer(self._vectors.view, dtype="<f4").reshape(-1, self.meta["vector_dim"])
+
+    def __len__(self) -> int:
+        return self.meta["chunks"]
+
+    @property
+    def version(self) -> str:
+        return self.meta.get("version") or ""
+
+    @property
+    def has_vectors(self) -> bool:
+        return self._vectors is not None
+
+    @property
+    def full_vector_scan(self) -> bool:
+        """True when numpy is available to score every vector per query."""
+        return self._matrix is not None
+
+    def prefetch(self) -> None:
+        """Ask the kernel to read the index files into the page cache ahead of the first queries."""
+        for mapped in (self._terms, self._posting_offsets, self._postings, self._lengths,
+                       self._chunk_offsets, self._chunks, self._vectors):
+            if mapped is not None:
+                mapped.prefetch()
+
+    def close(self) -> None:
+        self._matrix = None
+        for mapped in (self._terms, self._posting_offsets, self._postings, self._lengths,
+                       self._chunk_offsets, self._chunks, self._vectors):
+            if mapped is not None:
+                mapped.close()
+
+    def _posting_range(self, term: str) -> Tuple[int, int]:
+        terms = self._terms.view
+        key = term_hash(term)
+        i = bisect_left(terms, key)
+        if i == len(terms) or terms[i] != key:
+            return 0, 0
+        offsets = self._posting_offsets.view
+        return offsets[i], offsets[i + 1]
+
+    def _filter(self, filters: Optional[Dict[str, Any]]) -> Optional[Set[int]]:
+        """Chunk ids matching every field, any of the values given for a field."""
+        if not filters:
+            return None
+        postings = self._postings.view
+        allowed: Optional[Set[int]] = None
+        for field, values in filters.items():
+            ids: Set[int] = set()
+            for value in values if isinstance(values, (list, tuple, set)) else [values]:
+                start, end = self._posting_range(metadata_term(field, value))
+                ids.update(postings[2 * start:2 * end:2])
+            allowed = ids if allowed is None else allowed & ids
+            if not allowed:
+                return set()
+        return allowed
+
+    def search(self, query: str, top_k: int = 6, filters: Optional[Dict[str, Any]] = None) -> List[Tuple[int, float]]:
+        """BM25 over the query terms; returns ``(chunk id, score)`` best first."""
+        allowed = self._filter(filters)
+        if allowed is not None and not allowed:
+            return []
+
+        n = len(self)
+        avg_length = self.meta["avg_length"] or 1.0
+        k1, b = self.k1, self.b
+        postings = self._postings.view
+        lengths = self._lengths.view
+        scores: Dict[int, float] = {}
+        for term in set(analyze(query)):
+            start, end = self._posting_range(term)
+            if start == end:
+                continue
+            idf = math.log(1.0 + (n - (end - start) + 0.5) / ((end - start) + 0.5))
+            ids = postings[2 * start:2 * end:2]
+            tfs = postings[2 * start + 1:2 * end:2]
+            for chunk_id, tf in zip(ids, tfs):
+                if allowed is not None and chunk_id not in allowed:
+                    continue
+                norm = tf + k1 * (1.0 - b + b * lengths[chunk_id] / avg_length)
+                scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * tf * (k1 + 1.0) / norm
+        return heapq.nlargest(top_k, scores.items(), key=lambda item: item[1])
+
+    def vector_search(
+        self,
+        embedding: Sequence[float],
+        top_k: int = 6,
+        filters: Optional[Dict[str, Any]] = None,
+        candidates: Optional[Iterable[int]] = None,
+    ) -> List[Tuple[int, float]]:
+        """Cosine similarity against the stored vectors; returns ``(chunk id, score)`` best first.
+
+        With numpy every chunk is scored in one matrix product. Without it only
+        ``candidates`` (e.g. the BM25 hits) are scored, which keeps the pure
+        Python fallback to a few hundred dot products.
+        """
+        if self._vectors is None:
+            return []
+        allowed = self._filter(filters)
+        query = _normalize(embedding)
+        dim = self.meta["vector_dim"]
+
+        if self._matrix is not None and candidates is None:
+            scores = self._matrix @ np.asarray(query, dtype=np.float32)
+            if allowed is not None:
+                ids = np.fromiter(allowed, dtype=np.int64, count=len(allowed))
+                scores = scores[ids]
+            else:
+                ids = None
+            count = min(top_k, len(scores))
+            if count == 0:
+                return []
+            best = np.argpartition(-scores, count - 1)[:count]
+            best = best[np.argsort(-scores[best])]
+            return [(int(ids[i]) if ids is not None else int(i), float(scores[i])) for i in best]
+
+        vectors = self._vectors.view
+        results = []
+        for chunk_id in candidates if candidates is not None else range(len(self)):
+            if allowed is not None and chunk_id not in allowed:
+                continue
+            row = vectors[chunk_id * dim:(chunk_id + 1) * dim]
+            results.append((chunk_id, sum(q * v for q, v in zip(query, row))))
+        return heapq.nlargest(top_k, results, key=lambda item: item[1])
+
+    def chunk(self, chunk_id: int) -> Dict[str, Any]:
+        offsets = self._chunk_offsets.view
+        return json.loads(bytes(self._chunks.view[offsets[chunk_id]:offsets[chunk_id + 1]]))
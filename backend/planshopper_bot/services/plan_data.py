@@ -0,0 +1,782 @@
+import asyncio
+import csv
+import hashlib
+import logging
+import math
+import os
+import re
+import time
+from array import array
+from dataclasses import dataclass, field
+from datetime import date
+from typing import Any, Awaitable, Callable, Dict, FrozenSet, Iterable, List, Optional, Sequence, Set, Tuple
+
+from planshopper_bot.services.cost_engine import comparison_table, estimate_costs, parse_profile
+from planshopper_bot.services.local_index import analyze
+
+logger = logging.getLogger(__name__)
+
+_WORD = re.compile(r"[a-z0-9]+")
+# Provider credentials are dropped from name keys so "Dr. Jane Smith" finds "Jane Smith, MD"
+_CREDENTIALS = frozenset("md do np pa dds dmd od dpm phd rn aprn pac facc facp mph".split())
+_DOCTOR = frozenset(("dr", "doctor"))
+PLAN_TYPES = frozenset(("hmo", "ppo", "pffs", "snp", "pdp", "msa"))
+
+# Longest plan, drug or provider name (in words) the message matcher looks for
+_MAX_PHRASE = 6
+
+# formulary restriction bits
+PRIOR_AUTH = 1
+STEP_THERAPY = 2
+QUANTITY_LIMIT = 4
+
+# Words that make a message an exact lookup worth answering without the model;
+# anything else mentioning a known drug, plan or provider gets the facts injected instead
+_DRUG_CUES = frozenset(
+    "cover covered covers coverage copay copays cost costs price formulary tier tiers pay much "
+    "prior authorization step therapy quantity limit".split()
+)
+_PROVIDER_CUES = frozenset("network in-network accept accepts take takes covered cover see participate".split())
+_PLAN_CUES = frozenset(
+    "premium premiums deductible deductibles moop maximum copay copays star stars rating cost costs "
+    "detail details benefit benefits".split()
+)
+
+# Ranking plans by cost is done by the cost engine, not left to the model
+_COMPARE_CUES = frozenset(
+    "compare comparison comparing cheapest cheaper lowest least cheap affordable afford budget best rank "
+    "estimate estimated vs versus total spend".split()
+)
+_PLAN_ONLY_CUES = _PLAN_CUES - _DRUG_CUES - _PROVIDER_CUES
+
+_PLAN_COLUMNS = ("plan_id", "plan_year", "name", "carrier", "plan_type", "state", "county")
+_PLAN_NUMBERS = (
+    "monthly_premium", "deductible", "drug_deductible", "moop", "pcp_copay", "specialist_copay",
+    "er_copay", "urgent_care_copay", "inpatient_copay", "coinsurance", "star_rating",
+)
+
+
+def name_key(text: Any) -> str:
+    """Lowercased words joined by single spaces; the form names are indexed and matched in."""
+    return " ".join(_WORD.findall(str(text or "").lower()))
+
+
+def _provider_key(name: str) -> str:
+    words = [word for word in name_key(name).split() if word not in _CREDENTIALS and word not in _DOCTOR]
+    return " ".join(words)
+
+
+def _number(value: Any) -> float:
+    # Missing values are NaN in the numeric columns
+    if value is None or value == "":
+        return math.nan
+    return float(value)
+
+
+def _flag(value: Any) -> bool:
+    if isinstance(value, str):
+        return value.strip().lower() in ("1", "true", "yes", "y")
+    return bool(value)
+
+
+@dataclass
+class PlanRows:
+    """Raw rows of the four plan data tables, as dicts keyed by column name.
+
+    Rows come in a stable order (the loaders sort by primary key) so the
+    same content always produces the same snapshot version.
+    """
+    plans: List[Dict[str, Any]] = field(default_factory=list)
+    formulary: List[Dict[str, Any]] = field(default_factory=list)
+    providers: List[Dict[str, Any]] = field(default_factory=list)
+    provider_networks: List[Dict[str, Any]] = field(default_factory=list)
+
+
+def _fetch_all(connection, query: str, params: Tuple = ()) -> List[Dict[str, Any]]:
+    cursor = connection.cursor(dictionary=True)
+    try:
+        cursor.execute(query, params)
+        return cursor.fetchall()
+    finally:
+        cursor.close()
+
+
+def load_plan_rows(connection, plan_year: int) -> PlanRows:
+    """Read one plan year from MySQL (schema/plan_data.sql); runs on the DB pool's executor."""
+    return PlanRows(
+        plans=_fetch_all(connection, "SELECT * FROM plans WHERE plan_year = %s ORDER BY plan_id, county", (plan_year,)),
+        formulary=_fetch_all(
+            connection,
+            "SELECT plan_id, drug_name, tier, copay, coinsurance, prior_auth, step_therapy, quantity_limit "
+            "FROM formulary WHERE plan_year = %s ORDER BY plan_id, drug_key", (plan_year,)
+        ),
+        providers=_fetch_all(connection, "SELECT npi, name, specialty, city, state, county FROM providers ORDER BY npi"),
+        provider_networks=_fetch_all(
+            connection, "SELECT plan_id, npi FROM provider_networks WHERE plan_year = %s ORDER BY npi, plan_id",
+            (plan_year,)
+        ),
+    )
+
+
+def load_plan_rows_csv(directory: str, plan_year: int) -> PlanRows:
+    """Read plans.csv, formulary.csv, providers.csv and provider_networks.csv with the table columns."""
+    tables = {}
+    for table in ("plans", "formulary", "providers", "provider_networks"):
+        path = os.path.join(directory, f"{table}.csv")
+        if not os.path.exists(path):
+            tables[table] = []
+            continue
+        with open(path, newline="", encoding="utf-8") as f:
+            tables[table] = [
+                row for row in csv.DictReader(f)
+                if table == "providers" or not row.get("plan_year") or int(row["plan_year"]) == plan_year
+            ]
+    return PlanRows(**tables)
+
+
+@dataclass(frozen=True)
+class PlanDataConfig:
+    # "mysql": the plan data tables next to `people` (apply schema/plan_data.sql first);
+    # "csv": PLAN_DATA_PATH directory; "off": disabled, chat answers from retrieval only
+    source: str = "off"
+    path: str = ""
+    plan_year: int = 0
+    refresh_seconds: float = 300.0
+    # Lookups matching more plans than this are given to the model as facts instead of answered directly
+    max_direct_rows: int = 12
+    max_facts: int = 12
+    # Rows shown in a cost comparison table; every matching plan is still estimated and ranked
+    max_compare_rows: int = 10
+
+    @classmethod
+    def from_env(cls) -> "PlanDataConfig":
+        return cls(
+            source=os.getenv("PLAN_DATA_SOURCE", cls.source).lower(),
+            path=os.getenv("PLAN_DATA_PATH", cls.path),
+            plan_year=int(os.getenv("PLAN_DATA_YEAR", cls.plan_year) or date.today().year),
+            refresh_seconds=float(os.getenv("PLAN_DATA_REFRESH_SECONDS", cls.refresh_seconds)),
+            max_direct_rows=int(os.getenv("PLAN_DATA_MAX_DIRECT_ROWS", cls.max_direct_rows)),
+            max_facts=int(os.getenv("PLAN_DATA_MAX_FACTS", cls.max_facts)),
+            max_compare_rows=int(os.getenv("PLAN_DATA_MAX_COMPARE_ROWS", cls.max_compare_rows)),
+        )
+
+
+def rows_version(rows: PlanRows) -> str:
+    """Digest of the rows; the snapshot version, computed before deciding whether to rebuild."""
+    if not rows.plans:
+        return ""
+    digest = hashlib.blake2b(digest_size=8)
+    for table in (rows.plans, rows.formulary, rows.providers, rows.provider_networks):
+        for row in table:
+            digest.update(repr(tuple(row.values())).encode())
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class PlanSnapshot:
+    """Immutable, columnar copy of the plan data built for in-process lookups.
+
+    Plan attributes live in parallel columns (lists for text, ``array('d')``
+    with NaN for missing numbers) addressed by row number, with dict indexes
+    by plan id, county and plan type. Formulary entries are columns too,
+    indexed drug -> plan id -> row; provider networks are sets of plan ids
+    per NPI. ``version`` is a digest of the rows, so reloading unchanged
+    tables keeps cached answers valid.
+    """
+
+    def __init__(self, rows: PlanRows, version: Optional[str] = None):
+        self.plan_columns: Dict[str, List[str]] = {column: [] for column in _PLAN_COLUMNS}
+        self.plan_numbers: Dict[str, array] = {column: array("d") for column in _PLAN_NUMBERS}
+        self.plans_by_id: Dict[str, List[int]] = {}
+        self.plans_by_county: Dict[str, List[int]] = {}
+        self.plans_by_type: Dict[str, List[int]] = {}
+        for row in rows.plans:
+            index = len(self.plan_columns["plan_id"])
+            for column in _PLAN_COLUMNS:
+                self.plan_columns[column].append(str(row.get(column) or ""))
+            for column in _PLAN_NUMBERS:
+                self.plan_numbers[column].append(_number(row.get(column)))
+            self.plans_by_id.setdefault(str(row["plan_id"]), []).append(index)
+            self.plans_by_county.setdefault(name_key(row.get("county")), []).append(index)
+            self.plans_by_type.setdefault(name_key(row.get("plan_type")), []).append(index)
+
+        self.drug_names: List[str] = []
+        self.drug_plan: List[str] = []
+        self.drug_tier = array("b")
+        self.drug_copay = array("d")
+        self.drug_coinsurance = array("d")
+        self.drug_flags = array("B")
+        self.formulary: Dict[str, Dict[str, int]] = {}
+        self.drug_display: Dict[str, str] = {}
+        drug_keys: Dict[str, str] = {}
+        for row in rows.formulary:
+            key = drug_keys.get(row["drug_name"])
+            if key is None:
+                key = drug_keys[row["drug_name"]] = name_key(row["drug_name"])
+            index = len(self.drug_names)
+            self.drug_names.append(str(row["drug_name"]))
+            self.drug_plan.append(str(row["plan_id"]))
+            self.drug_tier.append(int(row.get("tier") or 0))
+            self.drug_copay.append(_number(row.get("copay")))
+            self.drug_coinsurance.append(_number(row.get("coinsurance")))
+            self.drug_flags.append(
+                (PRIOR_AUTH if _flag(row.get("prior_auth")) else 0)
+                | (STEP_THERAPY if _flag(row.get("step_therapy")) else 0)
+                | (QUANTITY_LIMIT if _flag(row.get("quantity_limit")) else 0)
+            )
+            self.formulary.setdefault(key, {})[str(row["plan_id"])] = index
+            self.drug_display.setdefault(key, str(row["drug_name"]))
+
+        self.provider_npi: List[str] = []
+        self.provider_name: List[str] = []
+        self.provider_specialty: List[str] = []
+        self.provider_city: List[str] = []
+        self.provider_county: List[str] = []
+        self.providers_by_name: Dict[str, List[int]] = {}
+        self.providers_by_last_name: Dict[str, List[int]] = {}
+        for row in rows.providers:
+            index = len(self.provider_npi)
+            self.provider_npi.append(str(row["npi"]))
+            self.provider_name.append(str(row["name"]))
+            self.provider_specialty.append(str(row.get("specialty") or ""))
+            self.provider_city.append(str(row.get("city") or ""))
+            self.provider_county.append(str(row.get("county") or ""))
+            key = _provider_key(row["name"])
+            if key:
+                self.providers_by_name.setdefault(key, []).append(index)
+                self.providers_by_last_name.setdefault(key.split()[-1], []).append(index)
+
+        networks: Dict[str, Set[str]] = {}
+        for row in rows.provider_networks:
+            networks.setdefault(str(row["npi"]), set()).add(str(row["plan_id"]))
+        self.networks: Dict[str, FrozenSet[str]] = {npi: frozenset(ids) for npi, ids in networks.items()}
+
+        self.version = rows_version(rows) if version is None else version
+        self._phrases = self._build_phrases()
+
+    def _build_phrases(self) -> Dict[str, List[Tuple[str, str]]]:
+        phrases: Dict[str, List[Tuple[str, str]]] = {}
+
+        def add(phrase: str, kind: str, value: str) -> None:
+            entries = phrases.setdefault(phrase, [])
+            if (kind, value) not in entries:
+                entries.append((kind, value))
+
+        for plan_id, rows in self.plans_by_id.items():
+            add(name_key(plan_id), "plan", plan_id)
+            add(name_key(self.plan_columns["name"][rows[0]]), "plan", plan_id)
+        for county in self.plans_by_county:
+            if county:
+                # "Will" or "Lake" alone are ordinary words; those counties need "county" after them
+                if analyze(county):
+                    add(county, "county", county)
+                add(f"{county} county", "county", county)
+        for drug in self.formulary:
+            add(drug, "drug", drug)
+            # "metformin" names "Metformin HCl ER" when it is the only such drug
+            first = drug.split()[0]
+            if first != drug and len(first) >= 5:
+                add(first, "drug", drug)
+        for key, rows in self.providers_by_name.items():
+            add(key, "provider", key)
+            for prefix in _DOCTOR:
+                add(f"{prefix} {key}", "provider", key)
+                add(f"{prefix} {key.split()[-1]}", "provider", key)
+        for plan_type in self.plans_by_type:
+            if plan_type in PLAN_TYPES:
+                add(plan_type, "plan_type", plan_type)
+        return phrases
+
+    @property
+    def plan_count(self) -> int:
+        return len(self.plan_columns["plan_id"])
+
+    def match(self, text: str) -> Dict[str, List[str]]:
+        """Known drugs, plans, providers, counties and plan types named in ``text``, longest phrase first."""
+        words = name_key(text).split()
+        found: Dict[str, List[str]] = {}
+        i = 0
+        while i < len(words):
+            for n in range(min(_MAX_PHRASE, len(words) - i), 0, -1):
+                entries = self._phrases.get(" ".join(words[i:i + n]))
+                if entries:
+                    for kind, value in entries:
+                        values = found.setdefault(kind, [])
+                        if value not in values:
+                            values.append(value)
+                    i += n
+                    break
+            else:
+                i += 1
+        return found
+
+    # -- lookup tools: plain functions of the snapshot the chat pipeline (or a model tool call) can use
+
+    def find_plans(self, county: Optional[Any] = None, plan_type: Optional[Any] = None,
+                   plan_ids: Optional[Sequence[str]] = None, max_premium: Optional[float] = None) -> List[int]:
+        """Plan rows matching every given condition, one row per plan id (the county's row when given).
+
+        ``county`` and ``plan_type`` take one value or a list of them, any of which may match.
+        """
+        candidates: Optional[Set[int]] = None
+        if plan_ids:
+            candidates = {row for plan_id in plan_ids for row in self.plans_by_id.get(plan_id, ())}
+        if county:
+            rows = {row for value in _filter_values(county) for row in self.plans_by_county.get(name_key(value), ())}
+            candidates = rows if candidates is None else candidates & rows
+        if plan_type:
+            rows = {row for value in _filter_values(plan_type) for row in self.plans_by_type.get(name_key(value), ())}
+            candidates = rows if candidates is None else candidates & rows
+        if candidates is None:
+            candidates = set(range(self.plan_count))
+
+        premiums = self.plan_numbers["monthly_premium"]
+        seen: Set[str] = set()
+        result = []
+        for row in sorted(candidates):
+            plan_id = self.plan_columns["plan_id"][row]
+            if plan_id in seen or (max_premium is not None and not premiums[row] <= max_premium):
+                continue
+            seen.add(plan_id)
+            result.append(row)
+        return result
+
+    def plan_details(self, row: int) -> Dict[str, Any]:
+        details: Dict[str, Any] = {column: self.plan_columns[column][row] for column in _PLAN_COLUMNS}
+        for column in _PLAN_NUMBERS:
+            value = self.plan_numbers[column][row]
+            details[column] = None if math.isnan(value) else value
+        return details
+
+    def drug_coverage(self, drug: str, plan_id: str) -> Optional[Dict[str, Any]]:
+        """Formulary entry of ``drug`` on ``plan_id``, or None when the plan does not cover it."""
+        index = self.formulary.get(name_key(drug), {}).get(plan_id)
+        if index is None:
+            return None
+        flags = self.drug_flags[index]
+        return {
+            "drug_name": self.drug_names[index],
+            "plan_id": plan_id,
+            "tier": self.drug_tier[index],
+            "copay": None if math.isnan(self.drug_copay[index]) else self.drug_copay[index],
+            "coinsurance": None if math.isnan(self.drug_coinsurance[index]) else self.drug_coinsurance[index],
+            "prior_auth": bool(flags & PRIOR_AUTH),
+            "step_therapy": bool(flags & STEP_THERAPY),
+            "quantity_limit": bool(flags & QUANTITY_LIMIT),
+        }
+
+    def find_providers(self, name: str, county: Optional[Any] = None) -> List[int]:
+        key = _provider_key(name)
+        rows = self.providers_by_name.get(key) or self.providers_by_last_name.get(key, [])
+        if county:
+            counties = {name_key(value) for value in _filter_values(county)}
+            in_county = [row for row in rows if name_key(self.provider_county[row]) in counties]
+            rows = in_county or rows
+        return list(rows)
+
+    def in_network(self, npi: str, plan_id: str) -> bool:
+        return plan_id in self.networks.get(npi, ())
+
+
+@dataclass
+class PlanLookup:
+    """Outcome of matching a message against the plan data.
+
+    ``answer`` is set when the data answers the question completely. A
+    ``preamble`` (a cost comparison) is shown as-is with the model only
+    adding the narrative after it. Otherwise ``facts`` are short verified
+    statements to put in front of the model.
+    """
+    tool: str
+    answer: Optional[str] = None
+    preamble: Optional[str] = None
+    facts: List[str] = field(default_factory=list)
+
+
+def _money(value: float) -> str:
+    if value is None or math.isnan(value):
+        return "n/a"
+    return f"${value:,.0f}" if value == int(value) else f"${value:,.2f}"
+
+
+def _percent(value: float) -> str:
+    return f"{value * 100:g}%"
+
+
+def _drug_cost(entry: Dict[str, Any]) -> str:
+    if entry["copay"] is not None:
+        return f"{_money(entry['copay'])} copay"
+    if entry["coinsurance"] is not None:
+        return f"{_percent(entry['coinsurance'])} coinsurance"
+    return "cost not listed"
+
+
+def _restrictions(entry: Dict[str, Any]) -> List[str]:
+    names = []
+    if entry["prior_auth"]:
+        names.append("prior authorization")
+    if entry["step_therapy"]:
+        names.append("step therapy")
+    if entry["quantity_limit"]:
+        names.append("quantity limit")
+    return names
+
+
+def _filter_values(value: Any) -> List[str]:
+    """A request filter as a list of non-empty strings; filters hold one value or a list of them."""
+    values = value if isinstance(value, (list, tuple, set)) else [value]
+    return [str(item) for item in values if item not in (None, "")]
+
+
+def _county_scope(counties: Sequence[str]) -> str:
+    names = [name.title() for name in counties]
+    if len(names) == 1:
+        return f"{names[0]} County"
+    return f"{', '.join(names[:-1])} and {names[-1]} Counties"
+
+
+def _table(columns: Sequence[str], rows: Iterable[Sequence[str]]) -> str:
+    lines = ["| " + " | ".join(columns) + " |", "|" + "---|" * len(columns)]
+    lines.extend("| " + " | ".join(str(cell).replace("|", "/") for cell in row) + " |" for row in rows)
+    return "\n".join(lines)
+
+
+class PlanDataStore:
+    """Holds the current ``PlanSnapshot`` and answers lookups from it.
+
+    ``refresh`` loads the tables through ``loader`` and builds the new
+    snapshot off the event loop; it is swapped in with a single assignment,
+    so lookups in progress finish on the snapshot they started with. The
+    store answers nothing until the first successful refresh.
+    """
+
+    def __init__(self, loader: Callable[[], Awaitable[PlanRows]], config: Optional[PlanDataConfig] = None):
+        self.config = config or PlanDataConfig.from_env()
+        self._loader = loader
+        self.snapshot: Optional[PlanSnapshot] = None
+        self.loaded_at: Optional[float] = None
+        self.refreshes = 0
+        self.refresh_failures = 0
+        self._failing = 0
+        self.last_load_seconds = 0.0
+        self.lookups = 0
+        self.direct_answers = 0
+        self.fact_lookups = 0
+        self._lookup_seconds = 0.0
+
+    @property
+    def version(self) -> str:
+        return self.snapshot.version if self.snapshot is not None else ""
+
+    async def refresh(self) -> bool:
+        """Reload the tables; True when the content changed."""
+        started = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        try:
+            rows = await self._loader()
+            version = await loop.run_in_executor(None, rows_version, rows)
+            # Unchanged tables (the usual case) skip building the columns and indexes again
+            snapshot = None
+            if self.snapshot is None or version != self.snapshot.version:
+                snapshot = await loop.run_in_executor(None, PlanSnapshot, rows, version)
+        except Exception as e:
+            self.refresh_failures += 1
+            self._failing += 1
+            # Warn once per run of failures (missing tables would otherwise log every refresh)
+            log = logger.warning if self._failing == 1 else logger.debug
+            log("Plan data refresh failed, keeping version %r: %s", self.version, e)
+            return False
+        if self._failing:
+            logger.info("Plan data refresh succeeded after %d failures", self._failing)
+            self._failing = 0
+        self.last_load_seconds = time.perf_counter() - started
+        self.refreshes += 1
+        self.loaded_at = time.time()
+        if snapshot is None:
+            return False
+        self.snapshot = snapshot
+        logger.info("Loaded plan data %s: %d plans, %d formulary entries, %d providers in %.0f ms",
+                    snapshot.version, snapshot.plan_count, len(snapshot.drug_names),
+                    len(snapshot.provider_npi), self.last_load_seconds * 1000)
+        return True
+
+    def lookup(self, message: str, filters: Optional[Dict[str, Any]] = None,
+               context: str = "", utilization: Optional[Dict[str, float]] = None) -> Optional[PlanLookup]:
+        """Answer or ground ``message`` from the plan data.
+
+        ``context`` is the previous question: a follow-up such as "what
+        about the PPO?" borrows the drug or provider it does not name itself.
+        ``utilization`` overrides the expected use a cost comparison assumes.
+        """
+        snapshot = self.snapshot
+        if snapshot is None:
+            return None
+        started = time.perf_counter()
+        try:
+            result = self._lookup(snapshot, message, filters or {}, context, utilization)
+        finally:
+            self.lookups += 1
+            self._lookup_seconds += time.perf_counter() - started
+        if result is not None:
+            if result.answer is not None:
+                self.direct_answers += 1
+            else:
+                self.fact_lookups += 1
+        return result
+
+    def _lookup(self, snapshot: PlanSnapshot, message: str, filters: Dict[str, Any],
+                context: str, utilization: Optional[Dict[str, float]]) -> Optional[PlanLookup]:
+        found = snapshot.match(message)
+        if not found:
+            return None
+        words = set(name_key(message).split())
+        # "What about the PPO?" continues the previous drug or network question; "what is its
+        # deductible?" asks about the plan itself
+        if context and not (found.keys() & {"drug", "provider"}) and not (words & _PLAN_ONLY_CUES):
+            borrowed = snapshot.match(context)
+            for kind in ("drug", "provider"):
+                if kind in borrowed:
+                    found[kind] = borrowed[kind]
+                    words.update(name_key(context).split())
+
+        # Filters hold one value or a list of them, like the retriever's metadata filters
+        counties = _filter_values(filters.get("county"))
+        if not counties and len(found.get("county", ())) == 1:
+            counties = found["county"]
+        plan_type = _filter_values(filters.get("plan_type")) or found.get("plan_type")
+        if found.get("plan"):
+            rows = snapshot.find_plans(county=counties, plan_ids=found["plan"]) or \
+                snapshot.find_plans(plan_ids=found["plan"])
+        elif counties:
+            rows = snapshot.find_plans(county=counties, plan_type=plan_type)
+        else:
+            rows = []
+        scope = _county_scope(counties) if counties and not found.get("plan") else "the selected plans"
+        direct = 0 < len(rows) <= self.config.max_direct_rows
+
+        if len(rows) > 1 and words & _COMPARE_CUES:
+            profile = parse_profile(message, found.get("drug", ()), utilization)
+            return self._compare(snapshot, rows, profile, scope)
+        if found.get("drug"):
+            return self._drug_lookup(snapshot, found["drug"], rows, scope, direct and bool(words & _DRUG_CUES))
+        if found.get("provider"):
+            return self._provider_lookup(snapshot, found["provider"], rows, counties,
+                                         direct and bool(words & _PROVIDER_CUES))
+        if rows:
+            return self._plan_lookup(snapshot, rows, bool(found.get("plan")) and direct and bool(words & _PLAN_CUES))
+        return None
+
+    def _plan_label(self, snapshot: PlanSnapshot, row: int) -> str:
+        return f"{snapshot.plan_columns['name'][row]} ({snapshot.plan_columns['plan_id'][row]})"
+
+    def _drug_lookup(self, snapshot: PlanSnapshot, drugs: List[str], rows: List[int], scope: str,
+                     direct: bool) -> PlanLookup:
+        if not rows:
+            return PlanLookup("drug_coverage", facts=[
+                self._drug_summary(snapshot, drug) for drug in drugs[:self.config.max_facts]
+            ])
+
+        entries = [
+            (drug, row, snapshot.drug_coverage(drug, snapshot.plan_columns["plan_id"][row]))
+            for drug in drugs for row in rows
+        ]
+        if not direct:
+            facts = []
+            for drug, row, entry in entries[:self.config.max_facts]:
+                name = snapshot.drug_display[drug]
+                if entry is None:
+                    facts.append(f"{name} is not on the {self._plan_label(snapshot, row)} formulary.")
+                else:
+                    restrictions = ", ".join(_restrictions(entry)) or "no restrictions"
+                    facts.append(f"{name} on {self._plan_label(snapshot, row)}: tier {entry['tier']}, "
+                                 f"{_drug_cost(entry)} per 30-day fill, {restrictions}.")
+            return PlanLookup("drug_coverage", facts=facts)
+
+        if len(entries) == 1:
+            drug, row, entry = entries[0]
+            name = snapshot.drug_display[drug]
+            label = self._plan_label(snapshot, row)
+            if entry is None:
+                return PlanLookup("drug_coverage", answer=(
+                    f"**{name}** is not on the {label} formulary. You can ask about a covered "
+                    "alternative or request a formulary exception from the plan."
+                ))
+            answer = f"**{name}** is covered by {label} on tier {entry['tier']}: {_drug_cost(entry)} per 30-day fill."
+            restrictions = _restrictions(entry)
+            if restrictions:
+                answer += f" Requires {' and '.join(restrictions)}."
+            return PlanLookup("drug_coverage", answer=answer)
+
+        table_rows = []
+        for drug, row, entry in entries:
+            if entry is None:
+                cells = ["Not covered", "-", "-"]
+            else:
+                cells = [str(entry["tier"]), _drug_cost(entry), ", ".join(_restrictions(entry)) or "None"]
+            table_rows.append([snapshot.drug_display[drug], snapshot.plan_columns["name"][row],
+                               snapshot.plan_columns["plan_id"][row], *cells])
+        names = " / ".join(snapshot.drug_display[drug] for drug in drugs)
+        return PlanLookup("drug_coverage", answer=(
+            f"Formulary coverage for **{names}** in {scope}:\n\n"
+            + _table(["Drug", "Plan", "Plan ID", "Tier", "Cost per 30-day fill", "Restrictions"], table_rows)
+        ))
+
+    def _compare(self, snapshot: PlanSnapshot, rows: List[int], profile, scope: str) -> PlanLookup:
+        estimates = estimate_costs(snapshot, rows, profile)
+        shown = min(len(estimates), self.config.max_compare_rows)
+        intro = f"Estimated yearly costs for {len(estimates)} plans in {scope}"
+        if shown < len(estimates):
+            intro = f"The {shown} lowest estimated yearly costs of {len(estimates)} plans in {scope}"
+        intro += f", assuming {profile.describe(snapshot.drug_display)}:"
+        cheapest = estimates[0]
+        facts = [
+            f"Assumed yearly use ({profile.label}): {profile.describe(snapshot.drug_display)}.",
+            f"Lowest estimated total: {self._plan_label(snapshot, cheapest.row)} at ${cheapest.total:,.0f}/year.",
+        ]
+        if len(estimates) > 1:
+            facts.append(f"Highest estimated total: {self._plan_label(snapshot, estimates[-1].row)} "
+                         f"at ${estimates[-1].total:,.0f}/year.")
+        return PlanLookup("compare_costs", preamble=f"{intro}\n\n{comparison_table(snapshot, estimates, shown)}",
+                          facts=facts)
+
+    def _drug_summary(self, snapshot: PlanSnapshot, drug: str) -> str:
+        # Without a plan or county the question is about coverage in general
+        name = snapshot.drug_display[drug]
+        indexes = list(snapshot.formulary.get(drug, {}).values())
+        plans = len(snapshot.plans_by_id)
+        tiers = sorted({snapshot.drug_tier[i] for i in indexes})
+        copays = [snapshot.drug_copay[i] for i in indexes if not math.isnan(snapshot.drug_copay[i])]
+        fact = f"{name} is on the formulary of {len(indexes)} of {plans} plans"
+        if tiers:
+            fact += f", tier {tiers[0]}" if len(tiers) == 1 else f", tiers {tiers[0]}-{tiers[-1]}"
+        if copays:
+            low, high = _money(min(copays)), _money(max(copays))
+            fact += f", {low} copay" if low == high else f", copays {low}-{high}"
+            fact += " per 30-day fill"
+        return fact + "."
+
+    def _provider_lookup(self, snapshot: PlanSnapshot, providers: List[str], rows: List[int],
+                         counties: List[str], direct: bool) -> PlanLookup:
+        matches = [index for key in providers for index in snapshot.find_providers(key, counties)]
+        if not rows:
+            facts = []
+            for index in matches[:self.config.max_facts]:
+                plan_ids = sorted(snapshot.networks.get(snapshot.provider_npi[index], ()))
+                facts.append(f"{snapshot.provider_name[index]} ({snapshot.provider_specialty[index] or 'provider'}, "
+                             f"{snapshot.provider_city[index]}) is in network for {len(plan_ids)} "
+                             f"plan{'' if len(plan_ids) == 1 else 's'}"
+                             + (f": {', '.join(plan_ids[:8])}" if plan_ids else "") + ".")
+            return PlanLookup("provider_network", facts=facts)
+
+        pairs = [(index, row) for index in matches for row in rows]
+        # Several providers share the name: the model should ask which one is meant
+        direct = direct and len(matches) == 1
+
+        def sentence(index: int, row: int, name: str) -> str:
+            status = "in network" if snapshot.in_network(snapshot.provider_npi[index],
+                                                         snapshot.plan_columns["plan_id"][row]) else "not in network"
+            return (f"{name} ({snapshot.provider_specialty[index] or 'provider'}, "
+                    f"{snapshot.provider_city[index]}) is {status} for {self._plan_label(snapshot, row)}.")
+
+        if not direct:
+            return PlanLookup("provider_network", facts=[
+                sentence(index, row, snapshot.provider_name[index]) for index, row in pairs[:self.config.max_facts]
+            ])
+        if len(pairs) == 1:
+            index, row = pairs[0]
+            return PlanLookup("provider_network", answer=sentence(index, row, f"**{snapshot.provider_name[index]}**"))
+
+        index = matches[0]
+        table_rows = [
+            [snapshot.plan_columns["name"][row], snapshot.plan_columns["plan_id"][row],
+             "Yes" if snapshot.in_network(snapshot.provider_npi[index], snapshot.plan_columns["plan_id"][row]) else "No"]
+            for row in rows
+        ]
+        return PlanLookup("provider_network", answer=(
+            f"Network status for **{snapshot.provider_name[index]}** "
+            f"({snapshot.provider_specialty[index] or 'provider'}, {snapshot.provider_city[index]}):\n\n"
+            + _table(["Plan", "Plan ID", "In network"], table_rows)
+        ))
+
+    def _plan_lookup(self, snapshot: PlanSnapshot, rows: List[int], direct: bool) -> PlanLookup:
+        def cells(row: int) -> List[str]:
+            numbers = snapshot.plan_numbers
+            stars = numbers["star_rating"][row]
+            return [
+                _money(numbers["monthly_premium"][row]), _money(numbers["deductible"][row]),
+                _money(numbers["drug_deductible"][row]), _money(numbers["moop"][row]),
+                f"{_money(numbers['pcp_copay'][row])} / {_money(numbers['specialist_copay'][row])}",
+                "n/a" if math.isnan(stars) else f"{stars:g}",
+            ]
+
+        if not direct:
+            facts = []
+            for row in rows[:self.config.max_facts]:
+                premium, deductible, drug_deductible, moop, copays, stars = cells(row)
+                facts.append(
+                    f"{self._plan_label(snapshot, row)}, {snapshot.plan_columns['plan_type'][row]}, "
+                    f"{snapshot.plan_columns['county'][row]} County: premium {premium}/month, deductible {deductible}, "
+                    f"drug deductible {drug_deductible}, out-of-pocket max {moop}, PCP/specialist {copays}, "
+                    f"{stars} stars."
+                )
+            return PlanLookup("plan_details", facts=facts)
+
+        table_rows = [
+            [snapshot.plan_columns["name"][row], snapshot.plan_columns["plan_id"][row],
+             snapshot.plan_columns["plan_type"][row], *cells(row)]
+            for row in rows
+        ]
+        return PlanLookup("plan_details", answer=_table(
+            ["Plan", "Plan ID", "Type", "Monthly premium", "Deductible", "Drug deductible",
+             "Out-of-pocket max", "PCP / specialist copay", "Star rating"],
+            table_rows
+        ))
+
+    def metrics(self) -> Dict[str, Any]:
+        snapshot = self.snapshot
+        return {
+            "source": self.config.source,
+            "version": self.version,
+            "plan_year": self.config.plan_year,
+            "plans": snapshot.plan_count if snapshot else 0,
+            "formulary_entries": len(snapshot.drug_names) if snapshot else 0,
+            "providers": len(snapshot.provider_npi) if snapshot else 0,
+            "loaded_at": self.loaded_at,
+            "last_load_ms": round(self.last_load_seconds * 1000, 1),
+            "refreshes": self.refreshes,
+            "refresh_failures": self.refresh_failures,
+            "lookups": self.lookups,
+            "direct_answers": self.direct_answers,
+            "fact_lookups": self.fact_lookups,
+            "avg_lookup_us": round(self._lookup_seconds / self.lookups * 1e6, 1) if self.lookups else 0.0,
+        }
+
+
+def create_plan_data_store(mysql_loader: Optional[Callable[[int], Awaitable[PlanRows]]] = None,
+                           config: Optional[PlanDataConfig] = None) -> Optional[PlanDataStore]:
+    """The configured store; ``mysql_loader(plan_year)`` reads the tables for the "mysql" source."""
+    config = config or PlanDataConfig.from_env()
+    if config.source == "off":
+        return None
+    if config.source == "csv":
+        if not config.path:
+            raise ValueError("PLAN_DATA_PATH is required when PLAN_DATA_SOURCE=csv")
+        return PlanDataStore(lambda: asyncio.to_thread(load_plan_rows_csv, config.path, config.plan_year), config)
+    if config.source != "mysql":
+        raise ValueError(f"Unsupported PLAN_DATA_SOURCE: {config.source}")
+    if mysql_loader is None:
+        return None
+    return PlanDataStore(lambda: mysql_loader(config.plan_year), config)
+
+
+_plan_data_store: Optional[PlanDataStore] = None
+
+
+def set_plan_data_store(store: Optional[PlanDataStore]) -> None:
+    """Register the process-wide store; the chat service picks it up when it is built."""
+    global _plan_data_store
+    _plan_data_store = store
+
+
+def get_plan_data_store() -> Optional[PlanDataStore]:
+    return _plan_data_store
@@ -0,0 +1,273 @@
+import logging
+import math
+import os
+import re
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from planshopper_bot.services.session_store import Turn, pack_history
+from planshopper_bot.utils.prompts import PLAN_SHOPPER_SYSTEM_PROMPT, PROMPT_AUDIENCES, compact_system_prompt
+
+try:
+    import tiktoken
+except ImportError:  # pragma: no cover - tiktoken is optional
+    tiktoken = None
+
+logger = logging.getLogger(__name__)
+
+FULL = "full"
+COMPACT = "compact"
+DEFAULT_ROLE = "member"
+
+# Chat formatting overhead per message, and for priming the assistant reply
+_MESSAGE_OVERHEAD = 3
+_REPLY_OVERHEAD = 3
+
+# Pre-tokenization close to the GPT encoders: contractions, words with their leading
+# space, up to three digits, punctuation runs and whitespace
+_PIECES = re.compile(r"'(?:s|t|re|ve|m|ll|d)\b| ?[A-Za-z]+| ?\d{1,3}| ?[^\sA-Za-z\d]+|\s+")
+
+
+def _approximate_count(text: str) -> int:
+    count = 0
+    for piece in _PIECES.findall(text):
+        stripped = piece.strip()
+        if not stripped:
+            count += piece.count("\n") or 1
+        elif stripped[0].isalpha():
+            # Common words are one token; long or rare ones split into pieces of about five letters
+            count += 1 if len(stripped) <= 7 else math.ceil(len(stripped) / 5)
+        elif stripped[0].isdigit():
+            count += 1
+        else:
+            count += math.ceil(len(stripped) / 2)
+    return count
+
+
+class Tokenizer:
+    """Token counts for prompt parts.
+
+    Uses tiktoken's ``encoding`` when the package and its encoding files are
+    available, otherwise a regex approximation of the same pre-tokenization
+    that stays within a few percent on English prose.
+    """
+
+    def __init__(self, encoding: str = "o200k_base"):
+        self._encoding = None
+        self.backend = "approximate"
+        if tiktoken is not None:
+            try:
+                self._encoding = tiktoken.get_encoding(encoding)
+                self.backend = f"tiktoken:{encoding}"
+            except Exception as e:
+                logger.warning("tiktoken encoding %s unavailable, approximating token counts: %s", encoding, e)
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        if self._encoding is not None:
+            return len(self._encoding.encode(text, disallowed_special=()))
+        return _approximate_count(text)
+
+    def count_messages(self, messages: Sequence[Dict[str, str]]) -> int:
+        return sum(_MESSAGE_OVERHEAD + self.count(message["content"]) for message in messages)
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """``text`` cut at a word boundary to at most ``max_tokens`` tokens."""
+        if self.count(text) <= max_tokens:
+            return text
+        if self._encoding is not None:
+            cut = self._encoding.decode(self._encoding.encode(text, disallowed_special=())[:max(0, max_tokens - 1)])
+        else:
+            cut = text
+            while cut and self.count(cut) > max_tokens - 1:
+                cut = cut[:int(len(cut) * max(0.5, (max_tokens - 1) / self.count(cut)))]
+        space = cut.rfind(" ")
+        return (cut[:space] if space > 0 else cut).rstrip() + "…"
+
+
+@dataclass(frozen=True)
+class PromptBudgetConfig:
+    # Prompt tokens per request: system prompt, history, plan data, retrieved context and the question
+    total_tokens: int = 6000
+    # Ceiling for retrieved context; reserved ahead of conversation history
+    context_tokens: int = 3000
+    # A retrieved chunk is cut to fit only when at least this much room is left for it
+    min_chunk_tokens: int = 80
+    # "full": PLAN_SHOPPER_SYSTEM_PROMPT for everyone; "compact": role-specific short system prompts,
+    # opt-in (PROMPT_VARIANT=compact) until an answer-quality eval shows they are no worse
+    variant: str = FULL
+    encoding: str = "o200k_base"
+    log_breakdown: bool = True
+    # Documents Azure "on your data" adds per call; the only lever on context size in that mode
+    azure_top_n_documents: int = 6
+
+    @classmethod
+    def from_env(cls) -> "PromptBudgetConfig":
+        return cls(
+            total_tokens=int(os.getenv("PROMPT_TOKEN_BUDGET", cls.total_tokens)),
+            context_tokens=int(os.getenv("PROMPT_CONTEXT_TOKENS", cls.context_tokens)),
+            min_chunk_tokens=int(os.getenv("PROMPT_MIN_CHUNK_TOKENS", cls.min_chunk_tokens)),
+            variant=os.getenv("PROMPT_VARIANT", cls.variant).lower(),
+            encoding=os.getenv("PROMPT_TOKENIZER_ENCODING", cls.encoding),
+            log_breakdown=os.getenv("PROMPT_LOG_BREAKDOWN", "true").lower() in ("1", "true", "yes", "on"),
+            azure_top_n_documents=int(os.getenv("PROMPT_AZURE_TOP_N_DOCUMENTS", cls.azure_top_n_documents)),
+        )
+
+
+@dataclass
+class PromptPlan:
+    """Token accounting of one request's prompt, filled in as its parts are assembled."""
+    variant: str
+    system_prompt: str
+    history: List[Dict[str, str]]
+    plan_data: List[Dict[str, str]]
+    system: int = 0
+    user: int = 0
+    plan_data_tokens: int = 0
+    history_tokens: int = 0
+    context: int = 0
+    context_budget: int = 0
+    chunks_kept: int = 0
+    chunks_dropped: int = 0
+    reported_prompt_tokens: Optional[int] = None
+
+    @property
+    def total(self) -> int:
+        return self.system + self.user + self.plan_data_tokens + self.history_tokens + self.context + _REPLY_OVERHEAD
+
+    def breakdown(self) -> Dict[str, Any]:
+        return {
+            "variant": self.variant,
+            "system": self.system,
+            "history": self.history_tokens,
+            "plan_data": self.plan_data_tokens,
+            "context": self.context,
+            "user": self.user,
+            "total": self.total,
+            "chunks_kept": self.chunks_kept,
+            "chunks_dropped": self.chunks_dropped,
+            "reported_prompt_tokens": self.reported_prompt_tokens,
+        }
+
+
+class PromptBudget:
+    """Counts and fits every part of a prompt into ``total_tokens`` before it is sent.
+
+    The system prompt, the question and plan data facts are always sent.
+    Retrieved context is reserved up to ``context_tokens``, history gets
+    what is left (never more than the session's own history budget), and
+    context then takes the remainder: chunks are kept best first, duplicates
+    dropped and the last one cut to fit. Each request's breakdown is logged
+    and aggregated for ``/api/chat/metrics``.
+    """
+
+    def __init__(self, config: Optional[PromptBudgetConfig] = None, tokenizer: Optional[Tokenizer] = None):
+        self.config = config or PromptBudgetConfig.from_env()
+        if self.config.variant not in (FULL, COMPACT):
+            raise ValueError(f"Unsupported PROMPT_VARIANT: {self.config.variant}")
+        self.tokenizer = tokenizer or Tokenizer(self.config.encoding)
+        self._prompts: Dict[str, Tuple[str, int]] = {}
+        for variant, prompt in self.system_prompts().items():
+            self._prompts[variant] = (prompt, self.tokenizer.count(prompt) + _MESSAGE_OVERHEAD)
+        self.requests = 0
+        self.chunks_dropped = 0
+        self.chunks_truncated = 0
+        self._totals: Dict[str, int] = {}
+        self._reported = 0
+        self._reported_requests = 0
+
+    def system_prompts(self) -> Dict[str, str]:
+        """Every system prompt this configuration can send, keyed by variant name."""
+        if self.config.variant == FULL:
+            return {FULL: PLAN_SHOPPER_SYSTEM_PROMPT}
+        return {f"{COMPACT}-{role}": compact_system_prompt(role) for role in PROMPT_AUDIENCES}
+
+    def variant_for(self, role: Optional[str]) -> str:
+        if self.config.variant == FULL:
+            return FULL
+        return f"{COMPACT}-{role if role in PROMPT_AUDIENCES else DEFAULT_ROLE}"
+
+    def plan(self, role: Optional[str], user_message: str, turns: List[Turn],
+             plan_data: List[Dict[str, str]], history_cap: int) -> PromptPlan:
+        """Pick the system prompt and pack history into what the budget leaves for it."""
+        variant = self.variant_for(role)
+        system_prompt, system_tokens = self._prompts[variant]
+        prompt = PromptPlan(variant=variant, system_prompt=system_prompt, history=[], plan_data=plan_data)
+        prompt.system = system_tokens
+        prompt.user = self.tokenizer.count(user_message) + _MESSAGE_OVERHEAD
+        prompt.plan_data_tokens = self.tokenizer.count_messages(plan_data)
+
+        available = self.config.total_tokens - prompt.total
+        history_budget = max(0, min(history_cap, available - self.config.context_tokens))
+        if turns and history_budget:
+            prompt.history = pack_history(turns, history_budget, count=self.tokenizer.count)
+            prompt.history_tokens = self.tokenizer.count_messages(prompt.history)
+        prompt.context_budget = max(0, min(self.config.context_tokens, self.config.total_tokens - prompt.total))
+        return prompt
+
+    def fit_sources(self, prompt: PromptPlan, sources: List[Tuple[str, str]]) -> List[int]:
+        """Indexes of the (header, content) sources that fit ``prompt.context_budget``, best first.
+
+        The returned sources are rewritten in place when cut to fit; the
+        context's token count is recorded on ``prompt``.
+        """
+        remaining = prompt.context_budget - _MESSAGE_OVERHEAD
+        kept: List[int] = []
+        seen = set()
+        for i, (header, content) in enumerate(sources):
+            key = " ".join(content.split())
+            if key in seen:
+                continue
+            cost = self.tokenizer.count(header) + self.tokenizer.count(content) + 2
+            if cost > remaining:
+                room = remaining - self.tokenizer.count(header) - 2
+                if room >= self.config.min_chunk_tokens:
+                    sources[i] = (header, self.tokenizer.truncate(content, room))
+                    cost = self.tokenizer.count(header) + self.tokenizer.count(sources[i][1]) + 2
+                    self.chunks_truncated += 1
+                else:
+                    continue
+            seen.add(key)
+            kept.append(i)
+            remaining -= cost
+            prompt.context += cost
+        if kept:
+            prompt.context += _MESSAGE_OVERHEAD
+        prompt.chunks_kept = len(kept)
+        prompt.chunks_dropped = len(sources) - len(kept)
+        return kept
+
+    def record(self, prompt: PromptPlan, usage: Optional[Dict[str, int]] = None) -> None:
+        """Add one sent prompt to the aggregates; ``usage`` is Azure's count when it was reported."""
+        if usage and usage.get("prompt_tokens"):
+            prompt.reported_prompt_tokens = usage["prompt_tokens"]
+            self._reported += usage["prompt_tokens"]
+            self._reported_requests += 1
+        self.requests += 1
+        self.chunks_dropped += prompt.chunks_dropped
+        breakdown = prompt.breakdown()
+        for part in ("system", "history", "plan_data", "context", "user", "total"):
+            self._totals[part] = self._totals.get(part, 0) + breakdown[part]
+        if self.config.log_breakdown:
+            logger.info("prompt tokens %s", " ".join(f"{key}={value}" for key, value in breakdown.items()
+                                                     if value is not None))
+
+    def metrics(self) -> Dict[str, Any]:
+        averages = {
+            f"avg_{part}_tokens": round(total / self.requests, 1) if self.requests else 0.0
+            for part, total in self._totals.items()
+        }
+        return {
+            "tokenizer": self.tokenizer.backend,
+            "variant": self.config.variant,
+            "total_budget": self.config.total_tokens,
+            "context_budget": self.config.context_tokens,
+            "system_prompt_tokens": {variant: tokens for variant, (_, tokens) in self._prompts.items()},
+            "requests": self.requests,
+            **averages,
+            "avg_reported_prompt_tokens": round(self._reported / self._reported_requests, 1)
+            if self._reported_requests else None,
+            "chunks_dropped": self.chunks_dropped,
+            "chunks_truncated": self.chunks_truncated,
+        }
@@ -0,0 +1,254 @@
+import hashlib
+import os
+import re
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, FrozenSet, Iterator, List, Optional, Set
+
+from planshopper_bot.models.chatmodel import ChatResponse
+
+_NON_WORD = re.compile(r"[^\w\s$%.-]+")
+_WHITESPACE = re.compile(r"\s+")
+_DIGITS = re.compile(r"\d")
+
+
+def normalize_message(message: str) -> str:
+    """Lowercase, drop punctuation and collapse whitespace so trivially different phrasings share a key."""
+    text = _NON_WORD.sub(" ", message.lower())
+    text = _WHITESPACE.sub(" ", text).strip()
+    return text.rstrip(".")
+
+
+def _trigram_signature(normalized: str) -> FrozenSet[int]:
+    padded = f"  {normalized} "
+    return frozenset(hash(padded[i:i + 3]) for i in range(len(padded) - 2))
+
+
+def _numeric_tokens(tokens: List[str]) -> FrozenSet[str]:
+    return frozenset(token for token in tokens if _DIGITS.search(token))
+
+
+def cache_fingerprint(*parts: Optional[str]) -> str:
+    """Hash of everything that changes what an answer would be (index, deployment, system prompt)."""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update((part or "").encode())
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+@dataclass(frozen=True)
+class ResponseCacheConfig:
+    enabled: bool = True
+    ttl_seconds: float = 600.0
+    max_entries: int = 2000
+    max_bytes: int = 32 * 1024 * 1024
+    similarity_enabled: bool = False
+    similarity_threshold: float = 0.9
+    replay_chunk_chars: int = 64
+
+    @classmethod
+    def from_env(cls) -> "ResponseCacheConfig":
+        return cls(
+            enabled=os.getenv("RAG_CACHE_ENABLED", "true").lower() in ("1", "true", "yes", "on"),
+            ttl_seconds=float(os.getenv("RAG_CACHE_TTL_SECONDS", cls.ttl_seconds)),
+            max_entries=int(os.getenv("RAG_CACHE_MAX_ENTRIES", cls.max_entries)),
+            max_bytes=int(os.getenv("RAG_CACHE_MAX_BYTES", cls.max_bytes)),
+            similarity_enabled=os.getenv("RAG_CACHE_SIMILARITY", "false").lower() in ("1", "true", "yes", "on"),
+            similarity_threshold=float(os.getenv("RAG_CACHE_SIMILARITY_THRESHOLD", cls.similarity_threshold)),
+            replay_chunk_chars=int(os.getenv("RAG_CACHE_REPLAY_CHUNK_CHARS", cls.replay_chunk_chars)),
+        )
+
+
+def _cache_key(normalized: str, namespace: str) -> str:
+    return f"{namespace}\0{normalized}" if namespace else normalized
+
+
+class _Entry:
+    __slots__ = ("key", "namespace", "response", "size", "expires_at", "tokens", "numbers", "signature")
+
+    def __init__(self, normalized: str, namespace: str, response: ChatResponse, size: int, expires_at: float):
+        self.key = _cache_key(normalized, namespace)
+        self.namespace = namespace
+        self.response = response
+        self.size = size
+        self.expires_at = expires_at
+        tokens = normalized.split()
+        self.tokens = frozenset(tokens)
+        self.numbers = _numeric_tokens(tokens)
+        self.signature = _trigram_signature(normalized)
+
+
+class ResponseCache:
+    """In-process answer cache with an exact tier and an optional similarity tier.
+
+    Entries expire after ``ttl_seconds`` and are evicted least-recently-used
+    first once either ``max_entries`` or ``max_bytes`` is exceeded. The
+    similarity tier compares character-trigram signatures (Jaccard) of
+    candidates that share at least one word, and never matches two messages
+    whose numbers differ ("plan 2" vs "plan 3", ZIP codes, years).
+    ``namespace`` separates answers produced with different system prompts.
+    """
+
+    def __init__(self, config: Optional[ResponseCacheConfig] = None, fingerprint: str = ""):
+        self.config = config or ResponseCacheConfig.from_env()
+        self.fingerprint = fingerprint
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._word_index: Dict[str, Set[str]] = {}
+        self._bytes = 0
+        self.hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def ensure_fingerprint(self, fingerprint: str) -> None:
+        """Drop every entry when the index, deployment or system prompt changed."""
+        if fingerprint != self.fingerprint:
+            self.invalidate()
+            self.fingerprint = fingerprint
+
+    def invalidate(self) -> None:
+        self._entries.clear()
+        self._word_index.clear()
+        self._bytes = 0
+        self.invalidations += 1
+
+    def get(self, message: str, namespace: str = "") -> Optional[ChatResponse]:
+        if not self.config.enabled:
+            return None
+
+        normalized = normalize_message(message)
+        key = _cache_key(normalized, namespace)
+        now = time.monotonic()
+        entry = self._entries.get(key)
+        if entry is not None and entry.expires_at <= now:
+            self._remove(entry)
+            entry = None
+
+        similar = False
+        if entry is None and self.config.similarity_enabled:
+            entry = self._find_similar(normalized, namespace, now)
+            similar = entry is not None
+
+        if entry is None:
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(entry.key)
+        self.hits += 1
+        if similar:
+            self.similar_hits += 1
+        return entry.response
+
+    def put(self, message: str, response: ChatResponse, namespace: str = "") -> None:
+        if not self.config.enabled:
+            return
+
+        normalized = normalize_message(message)
+        key = _cache_key(normalized, namespace)
+        existing = self._entries.get(key)
+        if existing is not None:
+            self._remove(existing)
+
+        size = len(key) + len(response.model_dump_json())
+        if size > self.config.max_bytes:
+            return
+
+        entry = _Entry(normalized, namespace, response, size, time.monotonic() + self.config.ttl_seconds)
+        self._entries[key] = entry
+        self._bytes += size
+        for token in entry.tokens:
+            self._word_index.setdefault(token, set()).add(key)
+        self._evict()
+
+    def _find_similar(self, normalized: str, namespace: str, now: float) -> Optional[_Entry]:
+        tokens = normalized.split()
+        numbers = _numeric_tokens(tokens)
+        candidates: Set[str] = set()
+        for token in tokens:
+            candidates.update(self._word_index.get(token, ()))
+        if not candidates:
+            return None
+
+        signature = _trigram_signature(normalized)
+        best: Optional[_Entry] = None
+        best_score = self.config.similarity_threshold
+        for candidate_key in candidates:
+            entry = self._entries[candidate_key]
+            if entry.namespace != namespace or entry.expires_at <= now or entry.numbers != numbers:
+                continue
+            union = len(signature | entry.signature)
+            score = len(signature & entry.signature) / union if union else 0.0
+            if score >= best_score:
+                best, best_score = entry, score
+        return best
+
+    def _remove(self, entry: _Entry) -> None:
+        del self._entries[entry.key]
+        self._bytes -= entry.size
+        for token in entry.tokens:
+            keys = self._word_index.get(token)
+            if keys is not None:
+                keys.discard(entry.key)
+                if not keys:
+                    del self._word_index[token]
+
+    def _evict(self) -> None:
+        while self._entries and (
+            len(self._entries) > self.config.max_entries or self._bytes > self.config.max_bytes
+        ):
+            _, oldest = next(iter(self._entries.items()))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def replay_chunks(self, response: ChatResponse) -> Iterator[Dict[str, Any]]:
+        """Replay a cached answer as the same chunk sequence a live stream produces."""
+        if response.citations or response.retrieved_chunks:
+            yield {
+                "type": "citation",
+                "citations": [citation.model_dump() for citation in response.citations],
+                "retrieved_chunks": [chunk.model_dump() for chunk in response.retrieved_chunks],
+                "done": False
+            }
+
+        answer = response.answer
+        size = max(1, self.config.replay_chunk_chars)
+        start = 0
+        while start < len(answer):
+            end = min(len(answer), start + size)
+            # Break after whitespace so replayed words are not split mid-token
+            if end < len(answer):
+                space = answer.rfind(" ", start, end)
+                if space > start:
+                    end = space + 1
+            yield {"type": "content", "content": answer[start:end], "done": False}
+            start = end
+
+        if response.has_table:
+            yield {
+                "type": "table",
+                "table_data": response.table_data,
+                "tables": [table.model_dump() for table in response.tables],
+                "done": False
+            }
+        yield {"type": "done", "done": True}
+
+    def metrics(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.config.enabled,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.config.max_bytes,
+            "hits": self.hits,
+            "similar_hits": self.similar_hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
@@ -0,0 +1,215 @@
+import logging
+import os
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence
+
+from planshopper_bot.models.chatmodel import RetrievedChunk
+from planshopper_bot.services.http_client import get_http_client
+from planshopper_bot.services.local_index import LocalIndex, resolve_index_path
+
+logger = logging.getLogger(__name__)
+
+# Reciprocal rank fusion constant; 60 is the usual choice and rewards agreement
+# between the BM25 and vector rankings more than either score's scale
+_RRF_K = 60
+
+
+@dataclass(frozen=True)
+class RetrieverConfig:
+    # "azure": Azure "on your data" retrieves inside the chat call (no local retrieval)
+    # "local": retrieve from the memory-mapped index at index_path and send the chunks in the prompt
+    backend: str = "azure"
+    index_path: str = ""
+    top_k: int = 6
+    # BM25 hits rescored by the vector index when numpy is unavailable
+    vector_candidates: int = 50
+    embedding_deployment: str = ""
+    # How often an artifact root's CURRENT pointer is checked for a newly published version
+    reload_check_seconds: float = 10.0
+
+    @classmethod
+    def from_env(cls) -> "RetrieverConfig":
+        return cls(
+            backend=os.getenv("RAG_RETRIEVER", cls.backend).lower(),
+            index_path=os.getenv("RAG_INDEX_PATH", cls.index_path),
+            top_k=int(os.getenv("RAG_TOP_K", cls.top_k)),
+            vector_candidates=int(os.getenv("RAG_VECTOR_CANDIDATES", cls.vector_candidates)),
+            embedding_deployment=os.getenv("AZURE_OPENAI_EMBEDDING_DEPLOYMENT", cls.embedding_deployment),
+            reload_check_seconds=float(os.getenv("RAG_INDEX_RELOAD_SECONDS", cls.reload_check_seconds)),
+        )
+
+
+class Retriever(ABC):
+    """Finds the chunks a question should be answered from.
+
+    ``retrieve`` returns chunks best first with ``score`` set; ``filters``
+    maps metadata fields (county, plan_type) to a value or list of values.
+    ``version`` identifies the indexed content and is part of the response
+    cache fingerprint.
+    """
+
+    version = ""
+
+    def refresh(self) -> bool:
+        """Pick up newly published content; True when the version changed."""
+        return False
+
+    @abstractmethod
+    async def retrieve(self, query: str, top_k: Optional[int] = None,
+                       filters: Optional[Dict[str, Any]] = None) -> List[RetrievedChunk]:
+        ...
+
+    def warm(self) -> None:
+        """Load whatever the first queries would otherwise wait for."""
+
+    def close(self) -> None:
+        pass
+
+    def metrics(self) -> Dict[str, Any]:
+        return {}
+
+
+class AzureEmbedder:
+    """Query embeddings from an Azure OpenAI embeddings deployment over the shared HTTP pool."""
+
+    def __init__(self, deployment: str, api_version: str = "2024-10-21"):
+        endpoint = os.getenv("AZURE_OPENAI_ENDPOINT")
+        self.url = f"{endpoint}/openai/deployments/{deployment}/embeddings?api-version={api_version}"
+        self.headers = {"Content-Type": "application/json", "api-key": os.getenv("AZURE_OPENAI_API_KEY", "")}
+
+    async def embed(self, text: str) -> List[float]:
+        response = await get_http_client().post(self.url, json={"input": text}, headers=self.headers)
+        response.raise_for_status()
+        return response.json()["data"][0]["embedding"]
+
+
+class LocalRetriever(Retriever):
+    """BM25 retrieval over a ``LocalIndex``, fused with vector search when available.
+
+    Vector search is used when the index was built with embeddings and an
+    embedding deployment is configured; the two rankings are combined by
+    reciprocal rank fusion. If embedding the query fails, BM25 results are
+    returned alone. Index lookups run inline: they are CPU-bound
+    microsecond-to-millisecond work over mapped pages.
+
+    When ``root`` is an artifact root, ``refresh`` follows its ``CURRENT``
+    pointer: a newly published version is opened and swapped in between
+    requests, without restarting workers.
+    """
+
+    def __init__(self, index: LocalIndex, config: Optional[RetrieverConfig] = None,
+                 embedder: Optional[AzureEmbedder] = None, root: Optional[str] = None):
+        self.config = config or RetrieverConfig.from_env()
+        self.index = index
+        self.root = root
+        self._next_check = time.monotonic() + self.config.reload_check_seconds
+        self.reloads = 0
+        self.reload_failures = 0
+        self.embedder = embedder
+        if self.embedder is None and index.has_vectors and self.config.embedding_deployment:
+            self.embedder = AzureEmbedder(self.config.embedding_deployment)
+        self.queries = 0
+        self.vector_queries = 0
+        self.embedding_failures = 0
+        self.total_seconds = 0.0
+
+    @property
+    def version(self) -> str:
+        return self.index.version
+
+    def refresh(self) -> bool:
+        if self.root is None or time.monotonic() < self._next_check:
+            return False
+        self._next_check = time.monotonic() + self.config.reload_check_seconds
+        try:
+            path = resolve_index_path(self.root)
+            if os.path.realpath(path) == os.path.realpath(self.index.path):
+                return False
+            index = LocalIndex(path)
+        except (OSError, ValueError) as e:
+            self.reload_failures += 1
+            logger.warning("Keeping index %s, could not open the published one: %s", self.index.path, e)
+            return False
+        # Searches never await, so no request is using the old index at this point
+        old, self.index = self.index, index
+        old.close()
+        self.reloads += 1
+        logger.info("Swapped local index %s -> %s", old.path, index.path)
+        return True
+
+    async def retrieve(self, query: str, top_k: Optional[int] = None,
+                       filters: Optional[Dict[str, Any]] = None) -> List[RetrievedChunk]:
+        top_k = top_k or self.config.top_k
+        embedding: Optional[Sequence[float]] = None
+        if self.embedder is not None:
+            try:
+                embedding = await self.embedder.embed(query)
+            except Exception as e:
+                self.embedding_failures += 1
+                logger.warning("Query embedding failed, using BM25 only: %s", e)
+
+        started = time.perf_counter()
+        index = self.index
+        if embedding is None:
+            ranked = index.search(query, top_k, filters)
+        else:
+            self.vector_queries += 1
+            lexical = index.search(query, max(top_k, self.config.vector_candidates), filters)
+            candidates = None if index.full_vector_scan else [chunk_id for chunk_id, _ in lexical]
+            semantic = index.vector_search(embedding, max(top_k, self.config.vector_candidates), filters, candidates)
+            ranked = _fuse(lexical, semantic, top_k)
+
+        chunks = []
+        for chunk_id, score in ranked:
+            record = index.chunk(chunk_id)
+            metadata = dict(record.get("metadata") or {})
+            metadata.update({"chunk_id": chunk_id, "title": record.get("title"),
+                             "url": record.get("url"), "filepath": record.get("filepath")})
+            chunks.append(RetrievedChunk(content=record["content"], score=round(score, 6), metadata=metadata))
+        self.queries += 1
+        self.total_seconds += time.perf_counter() - started
+        return chunks
+
+    def warm(self) -> None:
+        self.index.prefetch()
+
+    def close(self) -> None:
+        self.index.close()
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "backend": "local",
+            "index_path": self.index.path,
+            "index_version": self.version,
+            "chunks": len(self.index),
+            "vectors": self.index.has_vectors,
+            "queries": self.queries,
+            "vector_queries": self.vector_queries,
+            "embedding_failures": self.embedding_failures,
+            "reloads": self.reloads,
+            "reload_failures": self.reload_failures,
+            "avg_search_ms": round(self.total_seconds / self.queries * 1000, 3) if self.queries else 0.0,
+        }
+
+
+def _fuse(lexical: List, semantic: List, top_k: int) -> List:
+    scores: Dict[int, float] = {}
+    for ranking in (lexical, semantic):
+        for rank, (chunk_id, _) in enumerate(ranking):
+            scores[chunk_id] = scores.get(chunk_id, 0.0) + 1.0 / (_RRF_K + rank + 1)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:top_k]
+
+
+def create_retriever(config: Optional[RetrieverConfig] = None) -> Optional[Retriever]:
+    """The configured local retriever, or None when Azure "on your data" does retrieval."""
+    config = config or RetrieverConfig.from_env()
+    if config.backend == "azure":
+        return None
+    if config.backend != "local":
+        raise ValueError(f"Unsupported RAG_RETRIEVER: {config.backend}")
+    if not config.index_path:
+        raise ValueError("RAG_INDEX_PATH is required when RAG_RETRIEVER=local")
+    root = config.index_path if resolve_index_path(config.index_path) != config.index_path else None
+    return LocalRetriever(LocalIndex(resolve_index_path(config.index_path)), config, root=root)
@@ -0,0 +1,222 @@
+import os
+import re
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# One completed exchange: (user message, compacted assistant answer)
+Turn = Tuple[str, str]
+
+# The system prompt asks for follow-up suggestions at the end of every answer;
+# they are useless as conversation context and are dropped before storing
+_FOLLOW_UPS = re.compile(r"\n\s*[*_]*you might also want to know\b.*\Z", re.IGNORECASE | re.DOTALL)
+
+# Token budget kept for the note summarizing turns too old to include
+_NOTE_TOKENS = 64
+
+
+def compact_answer(answer: str) -> str:
+    return _FOLLOW_UPS.sub("", answer).strip()
+
+
+def estimate_tokens(text: str) -> int:
+    # About four characters per token for English text
+    return (len(text) + 3) // 4
+
+
+def _truncate(text: str, max_tokens: int, count: Callable[[str], int] = estimate_tokens) -> str:
+    if count(text) <= max_tokens:
+        return text
+    max_chars = max_tokens * 4
+    while True:
+        cut = text.rfind(" ", 0, max_chars - 1)
+        truncated = text[:cut if cut > 0 else max_chars - 1].rstrip() + "…"
+        # A real tokenizer can count more than four characters per token; shrink until it fits
+        if count(truncated) <= max_tokens or max_chars <= 8:
+            return truncated
+        max_chars = int(max_chars * 0.8)
+
+
+@dataclass(frozen=True)
+class SessionStoreConfig:
+    max_sessions: int = 10000
+    idle_ttl_seconds: float = 1800.0
+    max_session_bytes: int = 16 * 1024
+    max_turns: int = 20
+    history_token_budget: int = 1500
+
+    @classmethod
+    def from_env(cls) -> "SessionStoreConfig":
+        return cls(
+            max_sessions=int(os.getenv("SESSION_MAX_SESSIONS", cls.max_sessions)),
+            idle_ttl_seconds=float(os.getenv("SESSION_IDLE_TTL_SECONDS", cls.idle_ttl_seconds)),
+            max_session_bytes=int(os.getenv("SESSION_MAX_BYTES", cls.max_session_bytes)),
+            max_turns=int(os.getenv("SESSION_MAX_TURNS", cls.max_turns)),
+            history_token_budget=int(os.getenv("SESSION_HISTORY_TOKEN_BUDGET", cls.history_token_budget)),
+        )
+
+
+def pack_history(turns: List[Turn], token_budget: int,
+                 count: Callable[[str], int] = estimate_tokens) -> List[Dict[str, str]]:
+    """Turn stored history into chat messages that fit ``token_budget``.
+
+    The newest turns are kept verbatim. The first turn that no longer fits
+    has its answer truncated to the remaining budget. Anything older is
+    folded into one short system note listing the earlier questions.
+    ``count`` measures text in tokens; the default estimates from length.
+    """
+    kept: List[Dict[str, str]] = []
+    remaining = token_budget
+    index = len(turns) - 1
+    while index >= 0:
+        question, answer = turns[index]
+        cost = count(question) + count(answer)
+        if cost <= remaining:
+            kept.append({"role": "assistant", "content": answer})
+            kept.append({"role": "user", "content": question})
+            remaining -= cost
+            index -= 1
+            continue
+        # Leave room for the note about even older turns
+        reserve = _NOTE_TOKENS if index > 0 else 0
+        answer_budget = remaining - count(question) - reserve
+        if answer_budget >= 32:
+            truncated = _truncate(answer, answer_budget, count)
+            kept.append({"role": "assistant", "content": truncated})
+            kept.append({"role": "user", "content": question})
+            remaining -= count(question) + count(truncated)
+            index -= 1
+        break
+    kept.reverse()
+
+    if index >= 0 and remaining > 16:
+        earlier = "; ".join(question for question, _ in turns[:index + 1])
+        note = _truncate(f"Earlier in this conversation the user asked about: {earlier}", remaining, count)
+        kept.insert(0, {"role": "system", "content": note})
+    return kept
+
+
+class SessionStore(ABC):
+    """Conversation history keyed by ``session_id``.
+
+    The in-memory store is per process; for multi-worker deployments a
+    shared store (e.g. Redis lists with an expiry) implementing the same
+    methods can be passed to ``AzureRAGService`` instead.
+    """
+
+    @abstractmethod
+    async def get_turns(self, session_id: str) -> List[Turn]:
+        ...
+
+    @abstractmethod
+    async def append(self, session_id: str, user_message: str, answer: str) -> None:
+        ...
+
+    @abstractmethod
+    async def clear(self, session_id: str) -> None:
+        ...
+
+    def sweep(self) -> int:
+        return 0
+
+    def metrics(self) -> Dict[str, Any]:
+        return {}
+
+
+class _Session:
+    __slots__ = ("turns", "size", "last_seen")
+
+    def __init__(self, now: float):
+        self.turns: List[Turn] = []
+        self.size = 0
+        self.last_seen = now
+
+
+class InMemorySessionStore(SessionStore):
+    """Sessions in an LRU dict, bounded by count, idle time and bytes per session.
+
+    A session idle for ``idle_ttl_seconds`` is forgotten, the least recently
+    used session is dropped beyond ``max_sessions``, and each session keeps
+    only its newest turns within ``max_turns`` and ``max_session_bytes``.
+    Answers are stored compacted (follow-up suggestions removed).
+    """
+
+    def __init__(self, config: Optional[SessionStoreConfig] = None):
+        self.config = config or SessionStoreConfig.from_env()
+        self._sessions: "OrderedDict[str, _Session]" = OrderedDict()
+        self._bytes = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def _live(self, session_id: str, now: float) -> Optional[_Session]:
+        session = self._sessions.get(session_id)
+        if session is not None and now - session.last_seen > self.config.idle_ttl_seconds:
+            self._drop(session_id)
+            self.expirations += 1
+            return None
+        return session
+
+    def _drop(self, session_id: str) -> None:
+        session = self._sessions.pop(session_id)
+        self._bytes -= session.size
+
+    async def get_turns(self, session_id: str) -> List[Turn]:
+        session = self._live(session_id, time.monotonic())
+        return list(session.turns) if session is not None else []
+
+    async def append(self, session_id: str, user_message: str, answer: str) -> None:
+        now = time.monotonic()
+        session = self._live(session_id, now)
+        if session is None:
+            session = self._sessions[session_id] = _Session(now)
+        else:
+            self._sessions.move_to_end(session_id)
+        session.last_seen = now
+
+        turn = (user_message, compact_answer(answer))
+        size = len(turn[0].encode()) + len(turn[1].encode())
+        session.turns.append(turn)
+        session.size += size
+        self._bytes += size
+
+        while len(session.turns) > 1 and (
+            len(session.turns) > self.config.max_turns or session.size > self.config.max_session_bytes
+        ):
+            question, old_answer = session.turns.pop(0)
+            removed = len(question.encode()) + len(old_answer.encode())
+            session.size -= removed
+            self._bytes -= removed
+
+        while len(self._sessions) > self.config.max_sessions:
+            self._drop(next(iter(self._sessions)))
+            self.evictions += 1
+
+    async def clear(self, session_id: str) -> None:
+        if session_id in self._sessions:
+            self._drop(session_id)
+
+    def sweep(self) -> int:
+        now = time.monotonic()
+        expired = [
+            session_id for session_id, session in self._sessions.items()
+            if now - session.last_seen > self.config.idle_ttl_seconds
+        ]
+        for session_id in expired:
+            self._drop(session_id)
+        self.expirations += len(expired)
+        return len(expired)
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "backend": "memory",
+            "sessions": len(self._sessions),
+            "max_sessions": self.config.max_sessions,
+            "bytes": self._bytes,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
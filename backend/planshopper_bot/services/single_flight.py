@@ -0,0 +1,133 @@
+import asyncio
+from typing import Any, AsyncGenerator, Awaitable, Callable, Dict, List, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """Share one in-flight coroutine between concurrent callers with the same key.
+
+    The shared call runs as its own task and callers await it through
+    ``asyncio.shield``, so a caller that goes away (client disconnect,
+    request timeout) never cancels the call the others are waiting on.
+    """
+
+    def __init__(self):
+        self._calls: Dict[str, "asyncio.Future[Any]"] = {}
+        self.started = 0
+        self.coalesced = 0
+
+    def __len__(self) -> int:
+        return len(self._calls)
+
+    async def do(self, key: str, factory: Callable[[], Awaitable[T]]) -> T:
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(factory())
+            self._calls[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+            self.started += 1
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def _forget(self, key: str, task: "asyncio.Future[Any]") -> None:
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        # Retrieve the exception so an unobserved failure is not logged twice
+        if not task.cancelled():
+            task.exception()
+
+
+class _StreamFlight:
+    __slots__ = ("chunks", "finished", "subscribers", "task", "_changed")
+
+    def __init__(self):
+        self.chunks: List[Dict[str, Any]] = []
+        self.finished = False
+        self.subscribers = 0
+        self.task: Optional["asyncio.Task[None]"] = None
+        self._changed = asyncio.Event()
+
+    def changed(self) -> asyncio.Event:
+        return self._changed
+
+    def notify(self) -> None:
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+
+class StreamSingleFlight:
+    """Fan one upstream chunk stream out to every concurrent subscriber of the same key.
+
+    The upstream generator is drained by a background task into an
+    append-only chunk log; each subscriber keeps its own read position in
+    that log. A slow subscriber only falls behind itself and never blocks
+    the upstream read or the other subscribers, and the log is bounded by
+    the size of a single answer. The upstream task is cancelled only when
+    its last subscriber disconnects.
+    """
+
+    def __init__(self):
+        self._flights: Dict[str, _StreamFlight] = {}
+        self.started = 0
+        self.coalesced = 0
+        self.cancelled = 0
+
+    def __len__(self) -> int:
+        return len(self._flights)
+
+    def in_flight(self, key: str) -> bool:
+        """True when a subscriber of ``key`` would replay an upstream stream that is already running."""
+        return key in self._flights
+
+    async def subscribe(
+        self, key: str, factory: Callable[[], AsyncGenerator[Dict[str, Any], None]]
+    ) -> AsyncGenerator[Dict[str, Any], None]:
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = _StreamFlight()
+            self._flights[key] = flight
+            flight.task = asyncio.ensure_future(self._pump(key, flight, factory()))
+            self.started += 1
+        else:
+            self.coalesced += 1
+
+        flight.subscribers += 1
+        position = 0
+        try:
+            while True:
+                changed = flight.changed()
+                if position < len(flight.chunks):
+                    chunk = flight.chunks[position]
+                    position += 1
+                    yield chunk
+                    continue
+                if flight.finished:
+                    return
+                await changed.wait()
+        finally:
+            flight.subscribers -= 1
+            if flight.subscribers == 0 and not flight.finished:
+                self._detach(key, flight)
+                flight.task.cancel()
+                self.cancelled += 1
+
+    async def _pump(self, key: str, flight: _StreamFlight, upstream: AsyncGenerator[Dict[str, Any], None]) -> None:
+        try:
+            async for chunk in upstream:
+                flight.chunks.append(chunk)
+                flight.notify()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            flight.chunks.append({"type": "error", "error": f"Unexpected error: {str(e)}"})
+        finally:
+            flight.finished = True
+            flight.notify()
+            self._detach(key, flight)
+            await upstream.aclose()
+
+    def _detach(self, key: str, flight: _StreamFlight) -> None:
+        if self._flights.get(key) is flight:
+            del self._flights[key]
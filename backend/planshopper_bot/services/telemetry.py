@@ -0,0 +1,585 @@
+import contextvars
+import json
+import logging
+import math
+import os
+import queue
+import random
+import threading
+import time
+from bisect import bisect_left
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+Labels = Tuple[str, ...]
+
+# Seconds; request stages range from a cached JWT check to a full streamed answer
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# Spans are mostly in-process stages, so the low end is finer
+SPAN_BUCKETS = (0.00001, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+POOL_WAIT_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+TOKENS_PER_SECOND_BUCKETS = (5, 10, 20, 30, 40, 50, 75, 100, 150, 200, 300, 500)
+
+# OTLP span kinds and status codes
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_SERVER = 2
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+# Maps perf_counter_ns readings to wall-clock nanoseconds without calling time.time_ns() per span
+_EPOCH_OFFSET_NS = time.time_ns() - time.perf_counter_ns()
+
+
+@dataclass(frozen=True)
+class TelemetryConfig:
+    enabled: bool = True
+    # OTLP/JSON span batches are appended here, one per line; empty disables tracing
+    trace_file: str = ""
+    trace_sample_rate: float = 1.0
+    trace_flush_seconds: float = 2.0
+    trace_batch_size: int = 512
+    service_name: str = "planshopper-backend"
+
+    @classmethod
+    def from_env(cls) -> "TelemetryConfig":
+        return cls(
+            enabled=os.getenv("TELEMETRY_ENABLED", "true").lower() in ("1", "true", "yes"),
+            trace_file=os.getenv("TRACE_FILE", cls.trace_file),
+            trace_sample_rate=float(os.getenv("TRACE_SAMPLE_RATE", cls.trace_sample_rate)),
+            trace_flush_seconds=float(os.getenv("TRACE_FLUSH_SECONDS", cls.trace_flush_seconds)),
+            trace_batch_size=int(os.getenv("TRACE_BATCH_SIZE", cls.trace_batch_size)),
+            service_name=os.getenv("TELEMETRY_SERVICE_NAME", cls.service_name),
+        )
+
+
+class Counter:
+    """Monotonic counter with an optional fixed set of label names."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Labels, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, labels: Labels = ()) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def value(self, labels: Labels = ()) -> float:
+        return self._values.get(labels, 0.0)
+
+    def samples(self) -> List[Tuple[str, Labels, float]]:
+        with self._lock:
+            return [(self.name + "_total", labels, value) for labels, value in self._values.items()]
+
+
+class Histogram:
+    """Fixed-bucket histogram; an observation is one bisect and three additions under a lock.
+
+    Observations may come from the database executor threads as well as the
+    event loop, hence the (uncontended, ~50 ns) lock.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, buckets: Sequence[float], labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(sorted(buckets))
+        self.labelnames = tuple(labelnames)
+        # labels -> [per-bucket counts (+Inf last), sum, count]
+        self._series: Dict[Labels, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, labels: Labels = ()) -> None:
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def count(self, labels: Labels = ()) -> int:
+        series = self._series.get(labels)
+        return series[2] if series else 0
+
+    def quantile(self, q: float, labels: Labels = ()) -> Optional[float]:
+        """Upper bound of the bucket holding the ``q`` quantile, like ``histogram_quantile`` without interpolation."""
+        series = self._series.get(labels)
+        if not series or not series[2]:
+            return None
+        rank, seen = q * series[2], 0
+        for bound, count in zip(self.buckets + (math.inf,), series[0]):
+            seen += count
+            if seen >= rank:
+                return bound
+        return math.inf
+
+    def samples(self) -> List[Tuple[str, Labels, float]]:
+        with self._lock:
+            snapshot = [(labels, list(counts), total, count) for labels, (counts, total, count) in self._series.items()]
+        samples = []
+        for labels, counts, total, count in snapshot:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (math.inf,), counts):
+                cumulative += bucket_count
+                samples.append((self.name + "_bucket", labels + (_format_value(bound),), cumulative))
+            samples.append((self.name + "_sum", labels, total))
+            samples.append((self.name + "_count", labels, count))
+        return samples
+
+
+class Gauge:
+    """Gauge read at scrape time from a callback returning a number or ``{labels: number}``."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, read: Callable[[], Any], labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._read = read
+
+    def samples(self) -> List[Tuple[str, Labels, float]]:
+        try:
+            value = self._read()
+        except Exception:
+            logger.exception("Reading gauge %s failed", self.name)
+            return []
+        if isinstance(value, dict):
+            return [(self.name, labels, float(v)) for labels, v in value.items() if v is not None]
+        return [] if value is None else [(self.name, (), float(value))]
+
+
+class MetricsRegistry:
+    """Holds metrics by name and renders them in the Prometheus text exposition format (0.0.4)."""
+
+    def __init__(self):
+        self._metrics: Dict[str, Any] = {}
+
+    def _register(self, metric: Any) -> Any:
+        existing = self._metrics.get(metric.name)
+        if existing is not None and type(existing) is type(metric) and not isinstance(metric, Gauge):
+            return existing
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, help, labelnames))
+
+    def histogram(self, name: str, help: str, buckets: Sequence[float] = LATENCY_BUCKETS,
+                  labelnames: Sequence[str] = ()) -> Histogram:
+        return self._register(Histogram(name, help, buckets, labelnames))
+
+    def gauge(self, name: str, help: str, read: Callable[[], Any], labelnames: Sequence[str] = ()) -> Gauge:
+        """Register (or replace) a gauge sampled from ``read`` on every scrape."""
+        return self._register(Gauge(name, help, read, labelnames))
+
+    def get(self, name: str) -> Any:
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            labelnames = metric.labelnames + (("le",) if metric.kind == "histogram" else ())
+            for name, labels, value in metric.samples():
+                if labels:
+                    pairs = ",".join(f'{key}="{_escape(label)}"' for key, label in zip(labelnames, labels))
+                    lines.append(f"{name}{{{pairs}}} {_format_value(value)}")
+                else:
+                    lines.append(f"{name} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(value)
+
+
+class Span:
+    """One timed stage of a request; use as a context manager, in sync or async code.
+
+    Every span feeds the per-stage duration histogram. Only when a trace file
+    is configured does it also take ids, become the current span for its
+    children and get exported.
+    """
+
+    __slots__ = ("tracer", "name", "attributes", "kind", "trace_id", "span_id", "parent_id", "sampled",
+                 "start_ns", "end_ns", "error", "_token")
+
+    def __init__(self, tracer: "Tracer", name: str, attributes: Optional[Dict[str, Any]] = None,
+                 kind: int = SPAN_KIND_INTERNAL):
+        self.tracer = tracer
+        self.name = name
+        self.attributes = attributes
+        self.kind = kind
+        self.trace_id = 0
+        self.span_id = 0
+        self.parent_id = 0
+        self.sampled = False
+        self.error: Optional[str] = None
+        self._token = None
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        if self.attributes is None:
+            self.attributes = {}
+        self.attributes[key] = value
+
+    def set_error(self, message: str) -> None:
+        self.error = message
+
+    def __enter__(self) -> "Span":
+        if self.tracer.exporter is not None:
+            self.tracer._open(self)
+        self.start_ns = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.end_ns = time.perf_counter_ns()
+        if exc_type is not None and self.error is None:
+            self.error = exc_type.__name__
+        self.tracer._close(self)
+
+
+class _NoopSpan:
+    """Returned when telemetry is disabled; costs one method call per enter and exit."""
+
+    __slots__ = ()
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        pass
+
+    def set_error(self, message: str) -> None:
+        pass
+
+    def __enter__(self) -> "_NoopSpan":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+_current_span: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar("planshopper_span", default=None)
+
+
+class Tracer:
+    def __init__(self, durations: Histogram, enabled: bool = True, exporter: Optional["SpanFileExporter"] = None,
+                 sample_rate: float = 1.0, rng: Optional[random.Random] = None):
+        self.durations = durations
+        self.enabled = enabled
+        self.exporter = exporter
+        self.sample_rate = sample_rate
+        self._random = rng or random.Random()
+
+    def span(self, name: str, attributes: Optional[Dict[str, Any]] = None) -> Span:
+        if not self.enabled:
+            return _NOOP_SPAN
+        return Span(self, name, attributes)
+
+    def server_span(self, name: str, attributes: Optional[Dict[str, Any]] = None,
+                    traceparent: Optional[str] = None) -> Span:
+        """Root span of an incoming request, continuing the caller's W3C ``traceparent`` when valid."""
+        span = Span(self, name, attributes, SPAN_KIND_SERVER)
+        if traceparent and self.exporter is not None:
+            parts = traceparent.split("-")
+            if len(parts) == 4 and len(parts[1]) == 32 and len(parts[2]) == 16:
+                try:
+                    span.trace_id, span.parent_id = int(parts[1], 16), int(parts[2], 16)
+                    span.sampled = bool(int(parts[3], 16) & 1)
+                except ValueError:
+                    span.trace_id = span.parent_id = 0
+        return span
+
+    def record(self, name: str, start_ns: int, end_ns: int, attributes: Optional[Dict[str, Any]] = None,
+               error: Optional[str] = None) -> None:
+        """Record a stage timed by the caller, e.g. one spanning the yields of an async generator.
+
+        It is parented to the current span but never becomes current itself, so
+        code running between the generator's yields is not attributed to it.
+        """
+        if not self.enabled:
+            return
+        span = Span(self, name, attributes)
+        if self.exporter is not None:
+            self._link(span)
+        span.start_ns, span.end_ns, span.error = start_ns, end_ns, error
+        self._close(span)
+
+    def current(self) -> Optional[Span]:
+        return _current_span.get()
+
+    def _link(self, span: Span) -> None:
+        parent = _current_span.get()
+        if parent is not None:
+            span.trace_id, span.parent_id, span.sampled = parent.trace_id, parent.span_id, parent.sampled
+        elif not span.trace_id:
+            span.trace_id = self._random.getrandbits(128) or 1
+            span.sampled = self._random.random() < self.sample_rate
+        span.span_id = self._random.getrandbits(64) or 1
+
+    def _open(self, span: Span) -> None:
+        if span.kind != SPAN_KIND_SERVER or not span.trace_id:
+            self._link(span)
+        else:
+            span.span_id = self._random.getrandbits(64) or 1
+        span._token = _current_span.set(span)
+
+    def _close(self, span: Span) -> None:
+        if span._token is not None:
+            try:
+                _current_span.reset(span._token)
+            except ValueError:
+                # Exited in another context than it was entered in (a generator resumed elsewhere)
+                pass
+        if span.kind != SPAN_KIND_SERVER:
+            self.durations.observe((span.end_ns - span.start_ns) / 1e9, (span.name,))
+        if span.sampled and self.exporter is not None:
+            self.exporter.export(span)
+
+
+class SpanFileExporter:
+    """Writes finished spans to a file as OTLP/JSON ``ExportTraceServiceRequest`` lines.
+
+    The format is what the OpenTelemetry Collector's file exporter writes and
+    its ``otlpjsonfile`` receiver reads. Spans are handed to a writer thread
+    through a queue, so the request path never touches the file.
+    """
+
+    def __init__(self, path: str, service_name: str, flush_seconds: float = 2.0, batch_size: int = 512):
+        self.path = path
+        self.service_name = service_name
+        self.flush_seconds = flush_seconds
+        self.batch_size = batch_size
+        self._queue: "queue.SimpleQueue[Optional[Span]]" = queue.SimpleQueue()
+        self._thread: Optional[threading.Thread] = None
+        self.exported = 0
+        self.write_errors = 0
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="span-exporter", daemon=True)
+            self._thread.start()
+
+    def close(self) -> None:
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join(timeout=self.flush_seconds + 5)
+            self._thread = None
+
+    def export(self, span: Span) -> None:
+        self._queue.put(span)
+
+    def _run(self) -> None:
+        batch: List[Span] = []
+        deadline = time.monotonic() + self.flush_seconds
+        while True:
+            try:
+                span = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                span = False
+            if span:
+                batch.append(span)
+            if span is None or len(batch) >= self.batch_size or time.monotonic() >= deadline:
+                if batch:
+                    self._write(batch)
+                    batch = []
+                deadline = time.monotonic() + self.flush_seconds
+            if span is None:
+                return
+
+    def _write(self, batch: List[Span]) -> None:
+        line = json.dumps({"resourceSpans": [{
+            "resource": {"attributes": [_attribute("service.name", self.service_name)]},
+            "scopeSpans": [{"scope": {"name": "planshopper"}, "spans": [_otlp_span(span) for span in batch]}],
+        }]}, separators=(",", ":"))
+        try:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+            self.exported += len(batch)
+        except OSError as e:
+            self.write_errors += 1
+            logger.warning("Writing %d spans to %s failed: %s", len(batch), self.path, e)
+
+
+def _otlp_span(span: Span) -> Dict[str, Any]:
+    encoded = {
+        "traceId": f"{span.trace_id:032x}",
+        "spanId": f"{span.span_id:016x}",
+        "name": span.name,
+        "kind": span.kind,
+        "startTimeUnixNano": str(span.start_ns + _EPOCH_OFFSET_NS),
+        "endTimeUnixNano": str(span.end_ns + _EPOCH_OFFSET_NS),
+        "attributes": [_attribute(key, value) for key, value in (span.attributes or {}).items()],
+        "status": {"code": STATUS_ERROR, "message": span.error} if span.error else {"code": STATUS_OK},
+    }
+    if span.parent_id:
+        encoded["parentSpanId"] = f"{span.parent_id:016x}"
+    return encoded
+
+
+def _attribute(key: str, value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+
+class Telemetry:
+    """The process's metrics registry and tracer, plus the histograms the request path reports into."""
+
+    def __init__(self, config: Optional[TelemetryConfig] = None):
+        self.config = config or TelemetryConfig.from_env()
+        self.registry = MetricsRegistry()
+        registry = self.registry
+        self.http_duration = registry.histogram(
+            "planshopper_http_request_duration_seconds",
+            "HTTP request duration until the last body byte, by route template",
+            LATENCY_BUCKETS, ("method", "route", "status"))
+        self.span_duration = registry.histogram(
+            "planshopper_span_duration_seconds", "Duration of each traced request stage", SPAN_BUCKETS, ("span",))
+        self.ttft = registry.histogram(
+            "planshopper_chat_time_to_first_token_seconds",
+            "Time from a streamed chat request to its first answer text, by where the answer came from",
+            LATENCY_BUCKETS, ("source",))
+        self.tokens_per_second = registry.histogram(
+            "planshopper_chat_completion_tokens_per_second",
+            "Completion tokens per second of generation, as reported by Azure usage",
+            TOKENS_PER_SECOND_BUCKETS, ("mode",))
+        self.upstream_latency = registry.histogram(
+            "planshopper_upstream_latency_seconds",
+            "Azure OpenAI time to response headers per attempt",
+            LATENCY_BUCKETS, ("deployment", "outcome"))
+        self.db_pool_wait = registry.histogram(
+            "planshopper_db_pool_wait_seconds", "Time waiting for a pooled MySQL connection", POOL_WAIT_BUCKETS)
+        self.db_errors = registry.counter(
+            "planshopper_db_errors", "Database errors surfaced to clients", ("kind",))
+
+        exporter = None
+        if self.config.enabled and self.config.trace_file:
+            exporter = SpanFileExporter(self.config.trace_file, self.config.service_name,
+                                        self.config.trace_flush_seconds, self.config.trace_batch_size)
+        self.tracer = Tracer(self.span_duration, self.config.enabled, exporter, self.config.trace_sample_rate)
+
+    @property
+    def enabled(self) -> bool:
+        return self.config.enabled
+
+    def start(self) -> None:
+        if self.tracer.exporter is not None:
+            self.tracer.exporter.start()
+
+    def close(self) -> None:
+        if self.tracer.exporter is not None:
+            self.tracer.exporter.close()
+
+    def span(self, name: str, attributes: Optional[Dict[str, Any]] = None) -> Span:
+        return self.tracer.span(name, attributes)
+
+    def render(self) -> str:
+        return self.registry.render()
+
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class TelemetryMiddleware:
+    """ASGI middleware timing each HTTP request as the root span of its trace.
+
+    Requests are labelled by route template (``/api/chat``), never by raw
+    path, so the histogram's cardinality stays bounded; unmatched paths share
+    one label. A streamed response is timed until its last chunk is sent.
+    """
+
+    def __init__(self, app: Callable, telemetry: Optional["Telemetry"] = None):
+        self.app = app
+        self._telemetry = telemetry
+        self._routes: Dict[Any, str] = {}
+
+    async def __call__(self, scope: Dict[str, Any], receive: Callable, send: Callable) -> None:
+        telemetry = self._telemetry or get_telemetry()
+        if scope["type"] != "http" or not telemetry.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        traceparent = None
+        if telemetry.tracer.exporter is not None:
+            for name, value in scope.get("headers") or ():
+                if name == b"traceparent":
+                    traceparent = value.decode("latin-1")
+                    break
+        method = scope["method"]
+        span = telemetry.tracer.server_span("HTTP " + method, traceparent=traceparent)
+        status = 500
+
+        async def send_timed(message: Dict[str, Any]) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        route = "unmatched"
+        try:
+            with span:
+                try:
+                    await self.app(scope, receive, send_timed)
+                finally:
+                    route = self._route(scope)
+                    span.name = f"{method} {route}"
+                    span.set_attribute("http.method", method)
+                    span.set_attribute("http.route", route)
+                    span.set_attribute("http.status_code", status)
+                    if status >= 500:
+                        span.set_error(f"HTTP {status}")
+        finally:
+            # Observed once the span has ended, also when the app raised (counted as a 500)
+            telemetry.http_duration.observe((span.end_ns - span.start_ns) / 1e9, (method, route, str(status)))
+
+    def _route(self, scope: Dict[str, Any]) -> str:
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return "unmatched"
+        route = self._routes.get(endpoint)
+        if route is None:
+            app = scope.get("app")
+            for candidate in getattr(app, "routes", ()):
+                if getattr(candidate, "endpoint", None) is endpoint:
+                    route = candidate.path
+                    break
+            route = self._routes[endpoint] = route or "unmatched"
+        return route
+
+
+_telemetry: Optional[Telemetry] = None
+
+
+def get_telemetry() -> Telemetry:
+    global _telemetry
+    if _telemetry is None:
+        _telemetry = Telemetry()
+    return _telemetry
+
+
+def set_telemetry(telemetry: Optional[Telemetry]) -> None:
+    global _telemetry
+    _telemetry = telemetry
@@ -0,0 +1,452 @@
+import asyncio
+import email.utils
+import logging
+import os
+import random
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Deque, Dict, Iterable, List, Mapping, Optional, Tuple
+
+import httpx
+
+from planshopper_bot.services.http_client import get_http_client
+from planshopper_bot.services.telemetry import get_telemetry
+
+logger = logging.getLogger(__name__)
+
+# Throttling, timeouts and server-side failures are worth another attempt; other 4xx are not
+RETRYABLE_STATUSES = frozenset({408, 429, 500, 502, 503, 504})
+# Upstream statuses that mean "come back later" rather than "broken"
+_UNAVAILABLE_STATUSES = frozenset({429, 503})
+
+
+class UpstreamError(Exception):
+    """Azure OpenAI could not produce a response.
+
+    ``status_code`` is the status the API answers the client with and
+    ``retry_after`` how many seconds the client should wait, when known.
+    """
+
+    def __init__(self, message: str, status_code: int = 502, upstream_status: Optional[int] = None,
+                 retry_after: Optional[float] = None, retryable: bool = False):
+        super().__init__(message)
+        self.status_code = status_code
+        self.upstream_status = upstream_status
+        self.retry_after = retry_after
+        self.retryable = retryable
+
+
+class UpstreamTimeout(UpstreamError):
+    def __init__(self, message: str = "Request timed out"):
+        super().__init__(message, status_code=504, retryable=True)
+
+
+def retry_after_seconds(headers: Mapping[str, str]) -> Optional[float]:
+    """Seconds to wait from ``retry-after-ms`` (sent by Azure OpenAI) or ``Retry-After``."""
+    milliseconds = headers.get("retry-after-ms")
+    if milliseconds:
+        try:
+            return max(0.0, float(milliseconds) / 1000)
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def _parse_failover(value: str, api_keys: str) -> Tuple[Tuple[str, str, str], ...]:
+    """``deployment[@endpoint]`` entries, with API keys at the same positions (blank: the primary key)."""
+    keys = [key.strip() for key in api_keys.split(",")] if api_keys else []
+    entries = []
+    for i, entry in enumerate(part.strip() for part in value.split(",") if part.strip()):
+        deployment, _, endpoint = entry.partition("@")
+        entries.append((endpoint.strip(), deployment.strip(), keys[i] if i < len(keys) else ""))
+    return tuple(entries)
+
+
+@dataclass(frozen=True)
+class UpstreamConfig:
+    max_attempts: int = 3
+    # Decorrelated jitter between attempts on the same deployment
+    base_delay: float = 0.25
+    max_delay: float = 4.0
+    # A longer Retry-After fails over or gives up instead of waiting
+    max_retry_after: float = 10.0
+    # Send a second request once the first has taken longer than this percentile of recent ones
+    hedge: bool = False
+    hedge_percentile: float = 0.95
+    hedge_min_delay: float = 0.5
+    hedge_min_samples: int = 20
+    # Consecutive failures that open a deployment's circuit, and how long it stays open
+    breaker_failures: int = 5
+    breaker_cooldown: float = 30.0
+    # (endpoint or "" for the primary one, deployment, API key or "" for the primary one)
+    failover: Tuple[Tuple[str, str, str], ...] = ()
+
+    @classmethod
+    def from_env(cls) -> "UpstreamConfig":
+        return cls(
+            max_attempts=max(1, int(os.getenv("AZURE_RETRY_MAX_ATTEMPTS", cls.max_attempts))),
+            base_delay=float(os.getenv("AZURE_RETRY_BASE_DELAY", cls.base_delay)),
+            max_delay=float(os.getenv("AZURE_RETRY_MAX_DELAY", cls.max_delay)),
+            max_retry_after=float(os.getenv("AZURE_RETRY_MAX_RETRY_AFTER", cls.max_retry_after)),
+            hedge=os.getenv("AZURE_HEDGE", "false").lower() in ("1", "true", "yes", "on"),
+            hedge_percentile=float(os.getenv("AZURE_HEDGE_PERCENTILE", cls.hedge_percentile)),
+            hedge_min_delay=float(os.getenv("AZURE_HEDGE_MIN_DELAY", cls.hedge_min_delay)),
+            hedge_min_samples=int(os.getenv("AZURE_HEDGE_MIN_SAMPLES", cls.hedge_min_samples)),
+            breaker_failures=int(os.getenv("AZURE_BREAKER_FAILURES", cls.breaker_failures)),
+            breaker_cooldown=float(os.getenv("AZURE_BREAKER_COOLDOWN", cls.breaker_cooldown)),
+            failover=_parse_failover(os.getenv("AZURE_OPENAI_FAILOVER", ""),
+                                     os.getenv("AZURE_OPENAI_FAILOVER_API_KEYS", "")),
+        )
+
+
+@dataclass(frozen=True)
+class Deployment:
+    name: str
+    url: str
+    headers: Dict[str, str] = field(hash=False)
+
+    @classmethod
+    def azure(cls, endpoint: str, deployment: str, api_key: str, api_version: str) -> "Deployment":
+        endpoint = endpoint.rstrip("/")
+        host = endpoint.split("://", 1)[-1]
+        return cls(
+            name=f"{host}/{deployment}",
+            url=f"{endpoint}/openai/deployments/{deployment}/chat/completions?api-version={api_version}",
+            headers={"Content-Type": "application/json", "api-key": api_key},
+        )
+
+
+class CircuitBreaker:
+    """Opens after ``failure_threshold`` consecutive failures.
+
+    An open circuit rejects requests for ``cooldown`` seconds; then a single
+    probe is let through, and its outcome closes or re-opens the circuit.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, cooldown: float = 30.0, clock=time.monotonic):
+        self.failure_threshold = max(1, failure_threshold)
+        self.cooldown = cooldown
+        self._clock = clock
+        self.failures = 0
+        self.times_opened = 0
+        self._opened_at: Optional[float] = None
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return self.CLOSED
+        if self._clock() - self._opened_at < self.cooldown:
+            return self.OPEN
+        return self.HALF_OPEN
+
+    def available(self) -> bool:
+        state = self.state
+        return state == self.CLOSED or (state == self.HALF_OPEN and not self._probing)
+
+    def acquire(self) -> None:
+        if self.state == self.HALF_OPEN:
+            self._probing = True
+
+    def release(self) -> None:
+        """The request ended without an outcome (cancelled)."""
+        self._probing = False
+
+    def success(self) -> None:
+        self.failures = 0
+        self._opened_at = None
+        self._probing = False
+
+    def failure(self) -> None:
+        self._probing = False
+        self.failures += 1
+        if self._opened_at is not None or self.failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                self.times_opened += 1
+            self._opened_at = self._clock()
+
+    def retry_in(self) -> float:
+        if self._opened_at is None:
+            return 0.0
+        return max(0.0, self.cooldown - (self._clock() - self._opened_at))
+
+
+class LatencyWindow:
+    """Recent successful time-to-headers samples, in seconds."""
+
+    def __init__(self, size: int = 200):
+        self._samples: Deque[float] = deque(maxlen=size)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def add(self, seconds: float) -> None:
+        self._samples.append(seconds)
+
+    def percentile(self, fraction: float) -> Optional[float]:
+        if not self._samples:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+class _Route:
+    __slots__ = ("deployment", "breaker", "latency", "requests", "failures")
+
+    def __init__(self, deployment: Deployment, config: UpstreamConfig):
+        self.deployment = deployment
+        self.breaker = CircuitBreaker(config.breaker_failures, config.breaker_cooldown)
+        self.latency = LatencyWindow()
+        self.requests = 0
+        self.failures = 0
+
+
+class ResilientUpstream:
+    """Sends chat completion requests to Azure OpenAI with retries, hedging and failover.
+
+    Deployments are tried in configured order, skipping those whose circuit
+    is open. A retryable failure moves on to the next available deployment
+    right away; with only the failed one left it is retried after a
+    decorrelated-jitter delay, or after its Retry-After when that is longer.
+    With hedging on, a request still waiting for headers after the
+    deployment's recent p95 gets a second copy on another deployment (or the
+    same one) and the first response wins. Streams are retried and hedged
+    only until their headers arrive; a stream that fails after that is not
+    replayed.
+    """
+
+    def __init__(self, deployments: Iterable[Deployment], config: Optional[UpstreamConfig] = None,
+                 rng: Optional[random.Random] = None):
+        self.config = config or UpstreamConfig.from_env()
+        self._routes = [_Route(deployment, self.config) for deployment in deployments]
+        if not self._routes:
+            raise ValueError("At least one Azure OpenAI deployment is required")
+        self._random = rng or random.Random()
+        self.requests = 0
+        self.retries = 0
+        self.failovers = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.exhausted = 0
+
+    @property
+    def deployments(self) -> List[Deployment]:
+        return [route.deployment for route in self._routes]
+
+    async def post(self, payload: bytes) -> httpx.Response:
+        return await self._call(payload, stream=False)
+
+    @asynccontextmanager
+    async def stream(self, payload: bytes) -> AsyncIterator[httpx.Response]:
+        response = await self._call(payload, stream=True)
+        try:
+            yield response
+        finally:
+            await get_http_client().close_stream(response)
+
+    async def warm(self) -> int:
+        """Pre-open connections to every deployment's host; returns how many were opened."""
+        client = get_http_client()
+        hosts = {httpx.URL(route.deployment.url).host: route.deployment.url for route in self._routes}
+        return sum(await asyncio.gather(*(client.warm(url) for url in hosts.values())))
+
+    async def _call(self, payload: bytes, stream: bool) -> httpx.Response:
+        self.requests += 1
+        config = self.config
+        delay = config.base_delay
+        error: Optional[UpstreamError] = None
+        failed: Optional[_Route] = None
+        for attempt in range(config.max_attempts):
+            route = self._pick(failed)
+            if route is None:
+                break
+            if failed is not None:
+                self.retries += 1
+                if route is failed:
+                    retry_after = error.retry_after or 0.0
+                    if retry_after > config.max_retry_after:
+                        break
+                    delay = min(config.max_delay, self._random.uniform(config.base_delay, delay * 3))
+                    await asyncio.sleep(max(delay, retry_after))
+                else:
+                    self.failovers += 1
+            try:
+                return await self._attempt_hedged(payload, stream, route)
+            except UpstreamError as e:
+                if not e.retryable:
+                    raise
+                error, failed = e, route
+                logger.warning("Azure OpenAI attempt %d on %s failed: %s", attempt + 1, route.deployment.name, e)
+
+        self.exhausted += 1
+        if error is not None:
+            raise error
+        retry_in = min(route.breaker.retry_in() for route in self._routes)
+        raise UpstreamError("Azure OpenAI is unavailable: every deployment's circuit is open",
+                            status_code=503, retry_after=retry_in)
+
+    def _pick(self, failed: Optional[_Route]) -> Optional[_Route]:
+        """The first available deployment; after a failure, the next one after it when there is one."""
+        available = [route for route in self._routes if route.breaker.available()]
+        if not available:
+            return None
+        if failed is not None and len(available) > 1:
+            start = self._routes.index(failed) + 1
+            for route in self._routes[start:] + self._routes[:start]:
+                if route in available:
+                    return route
+        return available[0]
+
+    def _hedge_delay(self, route: _Route) -> Optional[float]:
+        if not self.config.hedge or len(route.latency) < self.config.hedge_min_samples:
+            return None
+        return max(self.config.hedge_min_delay, route.latency.percentile(self.config.hedge_percentile))
+
+    async def _attempt_hedged(self, payload: bytes, stream: bool, route: _Route) -> httpx.Response:
+        delay = self._hedge_delay(route)
+        if delay is None:
+            return await self._attempt(payload, stream, route)
+
+        primary = asyncio.ensure_future(self._attempt(payload, stream, route))
+        tasks = [primary]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if not done:
+                backup = self._pick(route) or route
+                tasks.append(asyncio.ensure_future(self._attempt(payload, stream, backup)))
+                self.hedges += 1
+            pending = set(tasks)
+            error: Optional[BaseException] = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not primary:
+                            self.hedge_wins += 1
+                        tasks.remove(task)
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            await self._discard(tasks, stream)
+
+    async def _discard(self, tasks: List["asyncio.Future[httpx.Response]"], stream: bool) -> None:
+        """Cancel the losing attempts; a stream that opened anyway gives its connection back."""
+        for task in tasks:
+            task.cancel()
+        for result in await asyncio.gather(*tasks, return_exceptions=True):
+            if stream and isinstance(result, httpx.Response):
+                await get_http_client().close_stream(result)
+
+    async def _attempt(self, payload: bytes, stream: bool, route: _Route) -> httpx.Response:
+        client = get_http_client()
+        deployment = route.deployment
+        route.breaker.acquire()
+        route.requests += 1
+        started_ns = time.perf_counter_ns()
+        try:
+            if stream:
+                response = await client.open_stream("POST", deployment.url, content=payload,
+                                                    headers=deployment.headers)
+            else:
+                response = await client.post(deployment.url, content=payload, headers=deployment.headers)
+        except asyncio.CancelledError:
+            route.breaker.release()
+            self._observe(route, started_ns, "cancelled")
+            raise
+        except httpx.TimeoutException:
+            self._failed(route)
+            self._observe(route, started_ns, "timeout")
+            raise UpstreamTimeout()
+        except httpx.TransportError as e:
+            self._failed(route)
+            self._observe(route, started_ns, "unreachable")
+            raise UpstreamError(f"Azure API unreachable: {e}", retryable=True)
+
+        elapsed = self._observe(route, started_ns, "ok" if response.status_code < 400 else "error",
+                                response.status_code)
+        if response.status_code < 400:
+            route.breaker.success()
+            route.latency.add(elapsed)
+            return response
+
+        if stream:
+            try:
+                await response.aread()
+            except httpx.HTTPError:
+                pass
+            finally:
+                await client.close_stream(response)
+        status = response.status_code
+        retryable = status in RETRYABLE_STATUSES
+        if retryable:
+            self._failed(route)
+        else:
+            # The deployment answered; the request itself was rejected
+            route.breaker.success()
+        try:
+            detail = response.text[:500]
+        except httpx.ResponseNotRead:
+            detail = ""
+        raise UpstreamError(
+            f"Azure API error: {status}" + (f" - {detail}" if detail else ""),
+            status_code=503 if status in _UNAVAILABLE_STATUSES else 504 if status in (408, 504) else 502,
+            upstream_status=status,
+            retry_after=retry_after_seconds(response.headers),
+            retryable=retryable,
+        )
+
+    def _observe(self, route: _Route, started_ns: int, outcome: str, status: Optional[int] = None) -> float:
+        """Record one attempt's time to headers; returns it in seconds."""
+        ended_ns = time.perf_counter_ns()
+        elapsed = (ended_ns - started_ns) / 1e9
+        telemetry = get_telemetry()
+        telemetry.upstream_latency.observe(elapsed, (route.deployment.name, outcome))
+        attributes = {"azure.deployment": route.deployment.name}
+        if status is not None:
+            attributes["http.status_code"] = status
+        error = None if outcome == "ok" else f"HTTP {status}" if status is not None else outcome
+        telemetry.tracer.record("azure.attempt", started_ns, ended_ns, attributes, error)
+        return elapsed
+
+    def _failed(self, route: _Route) -> None:
+        route.failures += 1
+        route.breaker.failure()
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "max_attempts": self.config.max_attempts,
+            "hedging": self.config.hedge,
+            "requests": self.requests,
+            "retries": self.retries,
+            "failovers": self.failovers,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "exhausted": self.exhausted,
+            "deployments": {
+                route.deployment.name: {
+                    "state": route.breaker.state,
+                    "requests": route.requests,
+                    "failures": route.failures,
+                    "times_opened": route.breaker.times_opened,
+                    "p95_ms": round(route.latency.percentile(0.95) * 1000, 1) if len(route.latency) else None,
+                }
+                for route in self._routes
+            },
+        }
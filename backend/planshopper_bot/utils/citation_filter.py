@@ -0,0 +1,35 @@
+import re
+
+_MARKER = re.compile(r'\[doc\d+\]')
+_PARTIAL_MARKER = re.compile(r'\[(?:d(?:o(?:c\d*)?)?)?')
+
+
+class CitationMarkerFilter:
+    """Strip ``[docN]`` citation markers from streamed text as it arrives.
+
+    A marker can be split across deltas (``"[do"`` + ``"c3] and"``), so a
+    trailing fragment that could still become a marker is held back until
+    the next delta decides it. Only the text after the last ``[`` is ever
+    re-examined.
+    """
+
+    def __init__(self):
+        self._held = ""
+
+    def feed(self, text: str) -> str:
+        if self._held:
+            text = self._held + text
+            self._held = ""
+
+        bracket = text.rfind('[')
+        if bracket >= 0 and _PARTIAL_MARKER.fullmatch(text, bracket):
+            self._held = text[bracket:]
+            text = text[:bracket]
+
+        if '[' in text:
+            text = _MARKER.sub('', text)
+        return text
+
+    def flush(self) -> str:
+        held, self._held = self._held, ""
+        return held
@@ -0,0 +1,108 @@
+import re
+from typing import Any, Dict, List, Optional
+
+_SEPARATOR_CELL = re.compile(r'^\s*:?-+:?\s*$')
+_CELL_SPLIT = re.compile(r'(?<!\\)\|')
+
+
+def _split_cells(line: str) -> List[str]:
+    line = line.strip()
+    if line.startswith('|'):
+        line = line[1:]
+    if line.endswith('|') and not line.endswith('\\|'):
+        line = line[:-1]
+    return [cell.strip().replace('\\|', '|') for cell in _CELL_SPLIT.split(line)]
+
+
+def _is_separator(cells: List[str]) -> bool:
+    return bool(cells) and all(_SEPARATOR_CELL.match(cell) for cell in cells)
+
+
+class MarkdownTableParser:
+    """Incremental GitHub-flavoured markdown table recognizer.
+
+    Text is fed in arbitrary pieces (stream deltas or a whole answer); only
+    completed lines are examined and each line is looked at once, so the
+    cost is linear in the answer length however it is chunked. A table is
+    a row line followed by a ``|---|---|`` separator line with the same
+    number of cells; it ends at the first line without a ``|``.
+
+    ``feed`` returns one event per completed body row as soon as its line
+    ends. ``close`` flushes the last partial line and returns the rows it
+    completed; the recognized tables are in ``tables``.
+    """
+
+    def __init__(self):
+        self._partial = ""
+        self._header: Optional[List[str]] = None
+        self._header_line = ""
+        self._current: Optional[Dict[str, Any]] = None
+        self._current_lines: List[str] = []
+        self.tables: List[Dict[str, Any]] = []
+        self.markdown: List[str] = []
+
+    def feed(self, text: str) -> List[Dict[str, Any]]:
+        if '\n' not in text:
+            self._partial += text
+            return []
+        lines = text.split('\n')
+        lines[0] = self._partial + lines[0]
+        self._partial = lines.pop()
+
+        events: List[Dict[str, Any]] = []
+        for line in lines:
+            event = self._line(line)
+            if event is not None:
+                events.append(event)
+        return events
+
+    def close(self) -> List[Dict[str, Any]]:
+        events: List[Dict[str, Any]] = []
+        if self._partial:
+            event = self._line(self._partial)
+            self._partial = ""
+            if event is not None:
+                events.append(event)
+        self._end_table()
+        self._header = None
+        return events
+
+    def _line(self, line: str) -> Optional[Dict[str, Any]]:
+        if '|' not in line:
+            self._end_table()
+            self._header = None
+            return None
+
+        cells = _split_cells(line)
+        if self._current is not None:
+            columns = self._current["columns"]
+            # Pad or truncate so every row lines up with the header
+            row = (cells + [""] * len(columns))[:len(columns)]
+            self._current["rows"].append(row)
+            self._current_lines.append(line)
+            return {"table_index": len(self.tables) - 1, "columns": columns, "row": row}
+
+        if self._header is not None and len(cells) == len(self._header) and _is_separator(cells):
+            self._current = {"columns": self._header, "rows": []}
+            self._current_lines = [self._header_line, line]
+            self.tables.append(self._current)
+            self._header = None
+            return None
+
+        self._header = cells
+        self._header_line = line
+        return None
+
+    def _end_table(self) -> None:
+        if self._current is not None:
+            self.markdown.append("\n".join(self._current_lines))
+            self._current = None
+            self._current_lines = []
+
+
+def parse_tables(text: str) -> MarkdownTableParser:
+    """Recognize every table in a complete answer."""
+    parser = MarkdownTableParser()
+    parser.feed(text)
+    parser.close()
+    return parser
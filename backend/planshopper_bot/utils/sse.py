@@ -0,0 +1,183 @@
+import asyncio
+import json
+import os
+import time
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from starlette.requests import Request
+
+try:
+    import orjson
+
+    def _dumps(data: Dict[str, Any]) -> bytes:
+        return orjson.dumps(data)
+except ImportError:  # pragma: no cover - orjson is optional
+    def _dumps(data: Dict[str, Any]) -> bytes:
+        return json.dumps(data, separators=(",", ":"), ensure_ascii=False).encode()
+
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "Connection": "keep-alive",
+    # Stop nginx and similar proxies from buffering the whole stream
+    "X-Accel-Buffering": "no",
+}
+
+_HEARTBEAT = b": ping\n\n"
+_END = object()
+
+
+@dataclass(frozen=True)
+class SSEConfig:
+    coalesce_seconds: float = 0.02
+    coalesce_bytes: int = 256
+    heartbeat_seconds: float = 15.0
+
+    @classmethod
+    def from_env(cls) -> "SSEConfig":
+        return cls(
+            coalesce_seconds=float(os.getenv("SSE_COALESCE_MS", cls.coalesce_seconds * 1000)) / 1000,
+            coalesce_bytes=int(os.getenv("SSE_COALESCE_BYTES", cls.coalesce_bytes)),
+            heartbeat_seconds=float(os.getenv("SSE_HEARTBEAT_SECONDS", cls.heartbeat_seconds)),
+        )
+
+
+def encode_event(data: Dict[str, Any], event_id: Optional[int] = None) -> bytes:
+    if event_id is None:
+        return b"data: " + _dumps(data) + b"\n\n"
+    return b"id: " + str(event_id).encode() + b"\ndata: " + _dumps(data) + b"\n\n"
+
+
+def parse_last_event_id(request: Request) -> int:
+    value = request.headers.get("last-event-id", "")
+    return int(value) if value.isdigit() else 0
+
+
+async def _pump(chunks: AsyncIterator[Dict[str, Any]], queue: "asyncio.Queue[Any]") -> None:
+    try:
+        async for chunk in chunks:
+            await queue.put(chunk)
+    except Exception as e:
+        await queue.put({"type": "error", "error": str(e)})
+    finally:
+        await queue.put(_END)
+
+
+async def sse_stream(
+    chunks: AsyncIterator[Dict[str, Any]],
+    request: Request,
+    config: Optional[SSEConfig] = None,
+    resume_from: int = 0,
+) -> AsyncIterator[bytes]:
+    """Encode service chunks as a text/event-stream body.
+
+    Content deltas are coalesced into one frame per ``coalesce_seconds``
+    window or ``coalesce_bytes`` of text, whichever fills first, instead of
+    one write and flush per token. A comment heartbeat is sent after
+    ``heartbeat_seconds`` of silence so idle proxies keep the stream open.
+
+    Every frame's id is the number of answer characters delivered so far,
+    so a client reconnecting with ``Last-Event-ID`` (passed as
+    ``resume_from``) skips exactly what it already has, whatever the frame
+    boundaries of the replayed stream were. Other events (citations, table
+    rows, usage) with an id at or before it are skipped as well; ``done``
+    and ``error`` always go out. That only holds when the replayed answer
+    is the same text; a stream that starts with a ``reset`` chunk is a new
+    answer, so it is sent from the beginning after a ``reset`` event with
+    id 0. When the client disconnects the upstream iterator is closed
+    straight away.
+    """
+    config = config or SSEConfig.from_env()
+    queue: "asyncio.Queue[Any]" = asyncio.Queue()
+    producer = asyncio.ensure_future(_pump(chunks, queue))
+
+    offset = 0
+    pending: List[str] = []
+    pending_bytes = 0
+    deadline: Optional[float] = None
+    saw_done = False
+
+    def flush() -> Optional[bytes]:
+        nonlocal offset, pending_bytes, deadline
+        if not pending:
+            return None
+        text = "".join(pending)
+        pending.clear()
+        pending_bytes = 0
+        deadline = None
+
+        start = offset
+        offset += len(text)
+        if offset <= resume_from:
+            return None
+        if start < resume_from:
+            text = text[resume_from - start:]
+        return encode_event({"type": "content", "content": text, "done": False}, offset)
+
+    try:
+        while True:
+            if deadline is None:
+                timeout = config.heartbeat_seconds
+            else:
+                timeout = max(0.0, deadline - time.monotonic())
+
+            try:
+                item = await asyncio.wait_for(queue.get(), timeout=timeout)
+            except asyncio.TimeoutError:
+                if pending:
+                    frame = flush()
+                    if frame:
+                        yield frame
+                else:
+                    if await request.is_disconnected():
+                        return
+                    yield _HEARTBEAT
+                continue
+
+            if item is _END:
+                break
+
+            if item.get("type") == "reset":
+                # Nothing has been counted yet: the reset is the stream's first chunk
+                resume_from = 0
+                yield encode_event(item, offset)
+                continue
+
+            if item.get("type") == "content" and not item.get("done") and item.get("content"):
+                content = item["content"]
+                pending.append(content)
+                pending_bytes += len(content.encode())
+                if deadline is None:
+                    deadline = time.monotonic() + config.coalesce_seconds
+                if pending_bytes >= config.coalesce_bytes:
+                    frame = flush()
+                    if frame:
+                        yield frame
+                continue
+
+            frame = flush()
+            if frame:
+                yield frame
+            if item.get("type") == "content" and item.get("content"):
+                # Single-shot answers (greetings, guardrails) arrive as one content chunk with done=True
+                start = offset
+                offset += len(item["content"])
+                if offset > resume_from:
+                    item = dict(item, content=item["content"][max(0, resume_from - start):])
+                    yield encode_event(item, offset)
+            elif offset > resume_from or item.get("done") or item.get("type") == "error":
+                # Citations, table rows and usage at or before the resume point were delivered already
+                yield encode_event(item, offset)
+            saw_done = saw_done or bool(item.get("done"))
+
+        frame = flush()
+        if frame:
+            yield frame
+        if not saw_done:
+            yield encode_event({"type": "done", "done": True}, offset)
+    finally:
+        # The producer is suspended inside the upstream iterator, so cancelling it
+        # raises CancelledError there and closes the upstream Azure stream; waiting
+        # for it makes sure the stream is closed before the response ends
+        producer.cancel()
+        await asyncio.wait({producer})
@@ -0,0 +1,95 @@
+import json
+import re
+from typing import List, Optional, Union
+
+
+class SSEEvent:
+    __slots__ = ("event", "data", "id")
+
+    def __init__(self, event: Optional[bytes], data: bytes, id: Optional[bytes]):
+        self.event = event
+        self.data = data
+        self.id = id
+
+    def __repr__(self) -> str:
+        return f"SSEEvent(event={self.event!r}, data={self.data!r}, id={self.id!r})"
+
+
+class SSEDecoder:
+    """Incremental server-sent-events decoder over raw byte reads.
+
+    Each read is split into lines in one pass and only the incomplete tail
+    is carried into the next read, so a frame split across many reads is
+    never rescanned. Multi-line ``data:`` fields are joined with ``\\n``
+    and ``event:``/``id:`` fields are kept, per the SSE spec. ``\\r\\n``
+    line endings are accepted.
+    """
+
+    def __init__(self):
+        self._pending = b""
+        self._data: List[bytes] = []
+        self._event: Optional[bytes] = None
+        self._id: Optional[bytes] = None
+
+    def feed(self, chunk: bytes) -> List[SSEEvent]:
+        # Only the tail after the last newline is carried over, so each byte is
+        # scanned for line breaks once however many reads a frame spans
+        last_newline = chunk.rfind(b"\n")
+        if last_newline < 0:
+            self._pending += chunk
+            return []
+        complete = self._pending + chunk[:last_newline] if self._pending else chunk[:last_newline]
+        self._pending = chunk[last_newline + 1:]
+
+        events: List[SSEEvent] = []
+        data = self._data
+        for line in complete.split(b"\n"):
+            if line.endswith(b"\r"):
+                line = line[:-1]
+            if not line:
+                if data:
+                    events.append(SSEEvent(self._event, b"\n".join(data) if len(data) > 1 else data[0], self._id))
+                    data = self._data = []
+                self._event = None
+            elif line.startswith(b"data: "):
+                data.append(line[6:])
+            else:
+                self._field(line)
+        return events
+
+    def _field(self, line: bytes) -> None:
+        if line[0] == 58:  # ':' comment / heartbeat
+            return
+        name, sep, value = line.partition(b":")
+        if sep and value[:1] == b" ":
+            value = value[1:]
+        if name == b"data":
+            self._data.append(value)
+        elif name == b"event":
+            self._event = value
+        elif name == b"id":
+            self._id = value
+
+
+# Returned by extract_delta_content when the chunk carries more than a plain text delta
+FULL_PARSE = object()
+
+# A delta whose only field is a content string: the shape of nearly every chunk in a long answer.
+# Anything else (role, context/citations, tool calls, finish chunks) falls back to json.loads.
+_PLAIN_DELTA = re.compile(rb'"delta":\s*\{\s*"content":\s*"((?:[^"\\]|\\.)*)"\s*\}')
+
+
+def extract_delta_content(data: bytes) -> Union[str, object]:
+    """Pull ``choices[0].delta.content`` out of a chat-completions chunk without building dicts.
+
+    Returns the content string when the delta is a plain text delta, or
+    ``FULL_PARSE`` when the chunk carries anything else (role, citations,
+    tool calls, finish reason only) and the caller should ``json.loads`` it.
+    """
+    match = _PLAIN_DELTA.search(data)
+    if match is None:
+        return FULL_PARSE
+    content = match.group(1)
+    if b"\\" in content:
+        return json.loads(b'"' + content + b'"')
+    return content.decode("utf-8")
@@ -0,0 +1,69 @@
+-- Structured plan data used by the chat service for exact lookups
+-- (planshopper_bot/services/plan_data.py). Lives in the same database as `people`.
+-- Names are also stored lowercased/space-collapsed (`*_key`) so lookups hit an index
+-- instead of scanning with LOWER()/LIKE.
+
+CREATE TABLE IF NOT EXISTS plans (
+    plan_id            VARCHAR(32)   NOT NULL,          -- e.g. H1234-001-0
+    plan_year          SMALLINT      NOT NULL,
+    name               VARCHAR(128)  NOT NULL,
+    name_key           VARCHAR(128)  NOT NULL,
+    carrier            VARCHAR(64)   NOT NULL,
+    plan_type          VARCHAR(16)   NOT NULL,          -- HMO, PPO, PFFS, SNP, ...
+    state              CHAR(2)       NOT NULL,
+    county             VARCHAR(64)   NOT NULL,
+    monthly_premium    DECIMAL(8,2)  NOT NULL DEFAULT 0,
+    deductible         DECIMAL(8,2)  NOT NULL DEFAULT 0,
+    drug_deductible    DECIMAL(8,2)  NOT NULL DEFAULT 0,
+    moop               DECIMAL(8,2)  NULL,              -- in-network out-of-pocket maximum
+    pcp_copay          DECIMAL(8,2)  NULL,
+    specialist_copay   DECIMAL(8,2)  NULL,
+    er_copay           DECIMAL(8,2)  NULL,
+    urgent_care_copay  DECIMAL(8,2)  NULL,
+    inpatient_copay    DECIMAL(8,2)  NULL,              -- per day
+    coinsurance        DECIMAL(5,4)  NULL,              -- member share after the deductible, 0.2000 = 20%
+    star_rating        DECIMAL(2,1)  NULL,
+    PRIMARY KEY (plan_id, plan_year, county),
+    KEY idx_plans_county_type (plan_year, county, plan_type),
+    KEY idx_plans_name (name_key)
+);
+
+CREATE TABLE IF NOT EXISTS formulary (
+    plan_id            VARCHAR(32)   NOT NULL,
+    plan_year          SMALLINT      NOT NULL,
+    drug_name          VARCHAR(128)  NOT NULL,
+    drug_key           VARCHAR(128)  NOT NULL,
+    rxcui              VARCHAR(16)   NULL,
+    tier               TINYINT       NOT NULL,
+    copay              DECIMAL(8,2)  NULL,              -- per 30-day retail fill
+    coinsurance        DECIMAL(5,4)  NULL,
+    prior_auth         BOOLEAN       NOT NULL DEFAULT FALSE,
+    step_therapy       BOOLEAN       NOT NULL DEFAULT FALSE,
+    quantity_limit     BOOLEAN       NOT NULL DEFAULT FALSE,
+    PRIMARY KEY (plan_id, plan_year, drug_key),
+    KEY idx_formulary_drug (drug_key, plan_year),
+    KEY idx_formulary_rxcui (rxcui)
+);
+
+CREATE TABLE IF NOT EXISTS providers (
+    npi                CHAR(10)      NOT NULL,
+    name               VARCHAR(128)  NOT NULL,
+    name_key           VARCHAR(128)  NOT NULL,
+    last_name_key      VARCHAR(64)   NOT NULL,
+    specialty          VARCHAR(64)   NULL,
+    city               VARCHAR(64)   NULL,
+    state              CHAR(2)       NULL,
+    county             VARCHAR(64)   NULL,
+    PRIMARY KEY (npi),
+    KEY idx_providers_name (name_key),
+    KEY idx_providers_last_name (last_name_key),
+    KEY idx_providers_county_specialty (county, specialty)
+);
+
+CREATE TABLE IF NOT EXISTS provider_networks (
+    plan_id            VARCHAR(32)   NOT NULL,
+    plan_year          SMALLINT      NOT NULL,
+    npi                CHAR(10)      NOT NULL,
+    PRIMARY KEY (plan_id, plan_year, npi),
+    KEY idx_networks_npi (npi, plan_year)
+);
@@ -0,0 +1,362 @@
+#!/usr/bin/env python3
+"""Ingest plan documents into a versioned local retrieval index.
+
+Walks the source directories for PDFs (text layer, needs ``pypdf``),
+CSV files (formularies, provider lists) and text/markdown files. Every
+document is normalized and chunked, chunks repeated across documents are
+dropped, and the result is written as a new index version under the
+output root:
+
+    <out>/versions/<version>/   index files (see planshopper_bot/services/local_index.py)
+    <out>/CURRENT               name of the live version, swapped atomically
+    <out>/cache/<sha256>.jsonl  chunks of each source document, by content hash
+    <out>/cache/embeddings-<deployment>.jsonl  vector of each live chunk, by chunk content hash
+    <out>/manifest.json         source path -> content hash of the live version
+
+Only documents whose content hash is not in the cache are parsed (in a
+process pool); everything else is reused. Likewise only chunks whose
+text has no cached vector are sent to the embeddings deployment. If
+nothing changed, no new version is written. Workers started with RAG_RETRIEVER=local and
+RAG_INDEX_PATH=<out> pick up a new CURRENT within RAG_INDEX_RELOAD_SECONDS.
+
+Metadata (county, plan_type, ...) comes from a ``<file>.meta.json``
+sidecar, from the directory layout with --path-metadata county/plan_type,
+and for CSVs from columns of the same name.
+
+    python scripts/ingest_documents.py data/plans --out /var/lib/planshopper/index
+    python scripts/ingest_documents.py data/plans --out idx --path-metadata county/plan_type --workers 8
+"""
+import argparse
+import csv
+import hashlib
+import io
+import json
+import logging
+import os
+import re
+import shutil
+import sys
+import time
+import unicodedata
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from planshopper_bot.services.local_index import (  # noqa: E402
+    CURRENT_POINTER, VERSIONS_DIR, build_index, publish_index
+)
+
+logger = logging.getLogger("ingest")
+
+SOURCE_SUFFIXES = {".pdf", ".csv", ".txt", ".md"}
+# Bump when parsing or chunking changes so cached chunks are rebuilt
+PIPELINE_VERSION = 1
+
+_HYPHEN_BREAK = re.compile(r"(\w)-\n(\w)")
+_SPACES = re.compile(r"[ \t\f\v]+")
+_BLANK_LINES = re.compile(r"\n\s*\n+")
+_SENTENCE_END = re.compile(r"(?<=[.!?;:])\s+")
+
+
+def normalize_text(text: str) -> str:
+    text = unicodedata.normalize("NFKC", text).replace("\r\n", "\n").replace("\r", "\n")
+    text = _HYPHEN_BREAK.sub(r"\1\2", text)
+    text = _SPACES.sub(" ", text)
+    return _BLANK_LINES.sub("\n\n", text).strip()
+
+
+def chunk_text(text: str, max_chars: int, overlap: int) -> List[str]:
+    """Split on paragraphs, then sentences, into chunks of about ``max_chars``.
+
+    Each chunk starts with the last ``overlap`` characters of the previous
+    one, so a fact on a boundary is still whole in one of them.
+    """
+    pieces: List[str] = []
+    for paragraph in text.split("\n\n"):
+        if len(paragraph) <= max_chars:
+            pieces.append(paragraph)
+            continue
+        for sentence in _SENTENCE_END.split(paragraph):
+            pieces.extend(sentence[i:i + max_chars] for i in range(0, len(sentence), max_chars))
+
+    chunks: List[str] = []
+    current = ""
+    for piece in pieces:
+        if current and len(current) + 1 + len(piece) > max_chars:
+            chunks.append(current)
+            tail = current[-overlap:] if overlap else ""
+            current = tail[tail.find(" ") + 1:] if " " in tail else ""
+        current = f"{current} {piece}" if current else piece
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def _read_pdf(path: Path) -> str:
+    try:
+        from pypdf import PdfReader
+    except ImportError:
+        raise RuntimeError(f"{path}: install pypdf to ingest PDF files")
+    reader = PdfReader(str(path))
+    return "\n\n".join(page.extract_text() or "" for page in reader.pages)
+
+
+def _csv_chunks(data: bytes, metadata: Dict[str, Any], metadata_fields: Sequence[str],
+                rows_per_chunk: int) -> Iterator[Dict[str, Any]]:
+    """One chunk per group of rows that share the same metadata values, each row as "column: value" pairs."""
+    reader = csv.DictReader(io.StringIO(data.decode("utf-8-sig")))
+    group: List[str] = []
+    group_metadata: Optional[Dict[str, Any]] = None
+    for row in reader:
+        row_metadata = dict(metadata)
+        for field in metadata_fields:
+            if row.get(field):
+                row_metadata[field] = row[field].strip()
+        line = "; ".join(f"{column}: {value.strip()}" for column, value in row.items() if column and value and value.strip())
+        if not line:
+            continue
+        if group and (row_metadata != group_metadata or len(group) >= rows_per_chunk):
+            yield {"content": normalize_text("\n".join(group)), "metadata": group_metadata}
+            group = []
+        group.append(line)
+        group_metadata = row_metadata
+    if group:
+        yield {"content": normalize_text("\n".join(group)), "metadata": group_metadata}
+
+
+def process_document(path: str, key: str, metadata: Dict[str, Any], options: Dict[str, Any]) -> Tuple[str, List[Dict[str, Any]]]:
+    """Parse, normalize and chunk one document. Runs in a worker process."""
+    source = Path(path)
+    data = source.read_bytes()
+    title = source.stem.replace("_", " ").replace("-", " ")
+    base = {"title": title, "filepath": path, "metadata": metadata}
+
+    if source.suffix.lower() == ".csv":
+        chunks = [
+            dict(base, **chunk)
+            for chunk in _csv_chunks(data, metadata, options["metadata_fields"], options["csv_rows_per_chunk"])
+        ]
+    else:
+        text = _read_pdf(source) if source.suffix.lower() == ".pdf" else data.decode("utf-8", errors="replace")
+        chunks = [dict(base, content=content) for content in chunk_text(normalize_text(text), options["max_chars"], options["overlap"])]
+    return key, chunks
+
+
+def file_hash(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def discover(sources: Sequence[str]) -> List[Tuple[Path, Path]]:
+    found = []
+    for source in sources:
+        root = Path(source)
+        paths = [root] if root.is_file() else sorted(p for p in root.rglob("*") if p.is_file())
+        for path in paths:
+            if path.suffix.lower() in SOURCE_SUFFIXES:
+                found.append((root if root.is_dir() else root.parent, path))
+    return found
+
+
+def document_metadata(root: Path, path: Path, path_fields: Sequence[str]) -> Dict[str, Any]:
+    metadata: Dict[str, Any] = {}
+    parts = path.relative_to(root).parts[:-1]
+    for field, value in zip(path_fields, parts):
+        metadata[field] = value
+    sidecar = path.with_name(path.name + ".meta.json")
+    if sidecar.exists():
+        metadata.update(json.loads(sidecar.read_text(encoding="utf-8")))
+    return metadata
+
+
+def load_cached(cache_dir: Path, key: str) -> Optional[List[Dict[str, Any]]]:
+    path = cache_dir / f"{key}.jsonl"
+    if not path.exists():
+        return None
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def store_cached(cache_dir: Path, key: str, chunks: List[Dict[str, Any]]) -> None:
+    tmp = cache_dir / f".{key}.{os.getpid()}"
+    with open(tmp, "w", encoding="utf-8") as f:
+        for chunk in chunks:
+            f.write(json.dumps(chunk, ensure_ascii=False) + "\n")
+    os.replace(tmp, cache_dir / f"{key}.jsonl")
+
+
+def embed_chunks(chunks: List[Dict[str, Any]], deployment: str, batch_size: int = 16) -> List[List[float]]:
+    import httpx
+
+    endpoint = os.environ["AZURE_OPENAI_ENDPOINT"]
+    url = f"{endpoint}/openai/deployments/{deployment}/embeddings?api-version=2024-10-21"
+    headers = {"api-key": os.environ["AZURE_OPENAI_API_KEY"]}
+    vectors: List[List[float]] = []
+    with httpx.Client(timeout=60.0) as client:
+        for start in range(0, len(chunks), batch_size):
+            batch = [chunk["content"] for chunk in chunks[start:start + batch_size]]
+            response = client.post(url, json={"input": batch}, headers=headers)
+            response.raise_for_status()
+            vectors.extend(item["embedding"] for item in sorted(response.json()["data"], key=lambda item: item["index"]))
+    return vectors
+
+
+def embeddings_cache_path(cache_dir: Path, deployment: str) -> Path:
+    return cache_dir / f"embeddings-{re.sub(r'[^A-Za-z0-9_.-]', '_', deployment)}.jsonl"
+
+
+def load_embeddings(path: Path) -> Dict[str, List[float]]:
+    if not path.exists():
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return {entry["hash"]: entry["vector"] for entry in map(json.loads, f)}
+
+
+def store_embeddings(path: Path, vectors: Dict[str, List[float]]) -> None:
+    tmp = path.with_name(f".{path.name}.{os.getpid()}")
+    with open(tmp, "w", encoding="utf-8") as f:
+        for digest, vector in vectors.items():
+            f.write(json.dumps({"hash": digest, "vector": vector}) + "\n")
+    os.replace(tmp, path)
+
+
+def embed_incremental(chunks: List[Dict[str, Any]], deployment: str,
+                      cache_dir: Path) -> Tuple[List[List[float]], int]:
+    """Vectors for ``chunks``, embedding only text not in the cache; returns them and how many were new.
+
+    The cache is rewritten with the vectors of these chunks only, so those of
+    edited or removed chunks do not pile up across runs.
+    """
+    path = embeddings_cache_path(cache_dir, deployment)
+    cached = load_embeddings(path)
+    hashes = [hashlib.sha256(chunk["content"].encode()).hexdigest() for chunk in chunks]
+    missing: Dict[str, Dict[str, Any]] = {}
+    for digest, chunk in zip(hashes, chunks):
+        if digest not in cached:
+            missing.setdefault(digest, chunk)
+    if missing:
+        cached.update(zip(missing, embed_chunks(list(missing.values()), deployment)))
+    live = {digest: cached[digest] for digest in hashes}
+    store_embeddings(path, live)
+    return [live[digest] for digest in hashes], len(missing)
+
+
+def prune_versions(out: Path, keep: int) -> None:
+    versions_dir = out / VERSIONS_DIR
+    current = (out / CURRENT_POINTER).read_text(encoding="utf-8").strip()
+    versions = sorted(p for p in versions_dir.iterdir() if p.is_dir() and not p.name.endswith(".tmp"))
+    # Workers may still have an older version mapped; unlinking files keeps their pages valid
+    for path in versions[:-keep] if keep else []:
+        if path.name != current:
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("sources", nargs="+", help="source files or directories")
+    parser.add_argument("--out", required=True, help="index artifact root (RAG_INDEX_PATH)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2)
+    parser.add_argument("--max-chars", type=int, default=1200)
+    parser.add_argument("--overlap", type=int, default=150)
+    parser.add_argument("--csv-rows-per-chunk", type=int, default=20)
+    parser.add_argument("--metadata-fields", default="county,plan_type")
+    parser.add_argument("--path-metadata", default="", help="metadata fields named by directory levels, e.g. county/plan_type")
+    parser.add_argument("--embedding-deployment", default=os.getenv("AZURE_OPENAI_EMBEDDING_DEPLOYMENT", ""))
+    parser.add_argument("--keep", type=int, default=3, help="index versions to keep")
+    parser.add_argument("--force", action="store_true", help="write a new version even if nothing changed")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    out = Path(args.out)
+    cache_dir = out / "cache"
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    (out / VERSIONS_DIR).mkdir(exist_ok=True)
+    metadata_fields = [f for f in args.metadata_fields.split(",") if f]
+    path_fields = [f for f in args.path_metadata.split("/") if f]
+    options = {
+        "max_chars": args.max_chars,
+        "overlap": args.overlap,
+        "csv_rows_per_chunk": args.csv_rows_per_chunk,
+        "metadata_fields": metadata_fields,
+    }
+    # Cached chunks depend on the chunking options as well as on the bytes
+    options_key = hashlib.sha256(json.dumps([PIPELINE_VERSION, options], sort_keys=True).encode()).hexdigest()[:12]
+
+    started = time.perf_counter()
+    documents = []
+    for root, path in discover(args.sources):
+        metadata = document_metadata(root, path, path_fields)
+        key = hashlib.sha256(f"{file_hash(path)}:{options_key}:{json.dumps(metadata, sort_keys=True)}".encode()).hexdigest()
+        documents.append((str(path), key, metadata))
+    if not documents:
+        logger.error("No source documents found")
+        return 1
+
+    chunks_by_key: Dict[str, List[Dict[str, Any]]] = {}
+    changed = []
+    for path, key, metadata in documents:
+        cached = load_cached(cache_dir, key)
+        if cached is None:
+            changed.append((path, key, metadata))
+        else:
+            chunks_by_key[key] = cached
+
+    if changed:
+        with ProcessPoolExecutor(max_workers=max(1, min(args.workers, len(changed)))) as pool:
+            futures = [pool.submit(process_document, path, key, metadata, options) for path, key, metadata in changed]
+            for (path, _, _), future in zip(changed, futures):
+                try:
+                    key, chunks = future.result()
+                except Exception as e:
+                    logger.error("Skipping %s: %s", path, e)
+                    continue
+                store_cached(cache_dir, key, chunks)
+                chunks_by_key[key] = chunks
+    logger.info("%d documents, %d parsed, %d reused from cache", len(documents), len(changed), len(documents) - len(changed))
+
+    manifest = {path: key for path, key, _ in documents if key in chunks_by_key}
+    version_hash = hashlib.sha256(json.dumps(sorted(manifest.items())).encode()).hexdigest()[:12]
+    current_pointer = out / CURRENT_POINTER
+    current = current_pointer.read_text(encoding="utf-8").strip() if current_pointer.exists() else ""
+    if current.endswith(version_hash) and not args.force:
+        logger.info("Index %s is up to date", current)
+        return 0
+
+    all_chunks = []
+    seen = set()
+    duplicates = 0
+    for path, key, _ in documents:
+        for chunk in chunks_by_key.get(key, ()):
+            digest = hashlib.sha256(" ".join(chunk["content"].lower().split()).encode()).digest()
+            if digest in seen:
+                duplicates += 1
+                continue
+            seen.add(digest)
+            all_chunks.append(chunk)
+
+    embeddings = None
+    if args.embedding_deployment:
+        embeddings, embedded = embed_incremental(all_chunks, args.embedding_deployment, cache_dir)
+        logger.info("%d chunks embedded, %d vectors reused from cache", embedded, len(all_chunks) - embedded)
+    version = f"{time.strftime('%Y%m%dT%H%M%SZ', time.gmtime())}-{version_hash}"
+    meta = build_index(all_chunks, str(out / VERSIONS_DIR / version), metadata_fields, embeddings, version=version)
+    with open(out / "manifest.json.tmp", "w", encoding="utf-8") as f:
+        json.dump({"version": version, "documents": manifest}, f, indent=2)
+    os.replace(out / "manifest.json.tmp", out / "manifest.json")
+    publish_index(str(out), version)
+    prune_versions(out, args.keep)
+
+    logger.info("Published %s: %d chunks (%d duplicates dropped), %d terms, %s in %.1f s",
+                version, meta["chunks"], duplicates, meta["terms"],
+                f"{meta['vector_dim']}-d vectors" if meta["vector_dim"] else "no vectors",
+                time.perf_counter() - started)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
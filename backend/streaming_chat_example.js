@@ -73,6 +73,8 @@ class StreamingChatClient {
 
 // Usage example:
 const chatClient = new StreamingChatClient();
+// One random id per conversation (page load); the server keeps history per id, so it must not be shared
+const sessionId = crypto.randomUUID();
 const messageContainer = document.getElementById('chat-messages');
 let currentMessageDiv = null;
 
@@ -100,7 +102,7 @@ function sendMessage() {
     
     chatClient.sendStreamingMessage(
         message,
-        'session-123',
+        sessionId,
         // onChunk - called for each piece of content
         (content, isDone) => {
             fullResponse += content;
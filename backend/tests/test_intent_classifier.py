@@ -0,0 +1,57 @@
+"""IntentClassifier with the shipped model: small talk, domain questions and refusals."""
+import json
+from pathlib import Path
+
+import pytest
+
+from planshopper_bot.services.intent_classifier import (
+    GREETING, IN_DOMAIN, OUT_OF_DOMAIN, THANKS, IntentClassifier
+)
+
+EVAL_SET = Path(__file__).resolve().parent.parent / "benchmarks" / "fixtures" / "intent_eval.jsonl"
+
+
+@pytest.fixture(scope="module")
+def classifier():
+    return IntentClassifier()
+
+
+@pytest.mark.parametrize("message", [
+    "what dental benefits do I get",
+    "How do I enroll?",
+    "Tell me about Humana Gold Plus",
+])
+def test_lexicon_match_is_never_refused(classifier, message):
+    result = classifier.classify(message)
+    assert result.matched
+    assert result.intent == IN_DOMAIN
+
+
+@pytest.mark.parametrize("message", ["qwertyuiop", "asdf jkl"])
+def test_unknown_words_only_are_refused(classifier, message):
+    result = classifier.classify(message)
+    assert result.intent == OUT_OF_DOMAIN
+    assert result.confidence == 1.0
+
+
+def test_off_topic_question_is_refused(classifier):
+    assert classifier.classify("what is the weather in paris").intent == OUT_OF_DOMAIN
+
+
+def test_small_talk(classifier):
+    assert classifier.classify("hi there").intent == GREETING
+    assert classifier.classify("thanks so much").intent == THANKS
+    # A greeting in front of a question does not make it small talk
+    assert classifier.classify("hi, what is my deductible?").intent == IN_DOMAIN
+
+
+def test_follow_up_is_judged_with_its_context(classifier):
+    result = classifier.classify("what about the second one?", context="compare dental plans in Cook County")
+    assert result.intent == IN_DOMAIN
+
+
+def test_eval_set_accuracy(classifier):
+    with open(EVAL_SET, encoding="utf-8") as f:
+        examples = [json.loads(line) for line in f if line.strip()]
+    correct = sum(classifier.classify(example["text"]).intent == example["label"] for example in examples)
+    assert correct / len(examples) >= 0.95
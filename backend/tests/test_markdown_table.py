@@ -0,0 +1,149 @@
+"""MarkdownTableParser on plan comparison answers, whole and streamed in arbitrary pieces."""
+import pytest
+
+from planshopper_bot.utils.markdown_table import MarkdownTableParser, parse_tables
+
+COMPARISON = (
+    "Here is how the two plans compare for 2026:\n"
+    "\n"
+    "| Plan | Monthly premium | Deductible | PCP copay |\n"
+    "|:-----|---------------:|-----------:|:---------:|\n"
+    "| Aetna Value PPO | $0 | $250 | $5 |\n"
+    "| Humana Gold Plus HMO | $29 | $0 | $0 |\n"
+    "\n"
+    "The Humana plan costs more each month but has no deductible.\n"
+)
+
+TWO_TABLES = (
+    "Premiums:\n"
+    "| Plan | Premium |\n"
+    "|---|---|\n"
+    "| Aetna Value PPO | $0 |\n"
+    "| Humana Gold Plus HMO | $29 |\n"
+    "\n"
+    "Drug coverage for Eliquis:\n"
+    "| Plan | Tier | 30-day copay |\n"
+    "| --- | --- | --- |\n"
+    "| Aetna Value PPO | 3 | $47 |\n"
+    "| Humana Gold Plus HMO | 3 | $45 |\n"
+    "\n"
+    "Both plans cover Eliquis.\n"
+)
+
+
+def stream(text, pieces):
+    """Feed ``pieces`` in order and return the parser and every row event."""
+    parser = MarkdownTableParser()
+    events = []
+    for piece in pieces:
+        events.extend(parser.feed(piece))
+    events.extend(parser.close())
+    assert "".join(pieces) == text
+    return parser, events
+
+
+def chunked(text, size):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+def test_recognizes_comparison_table():
+    parser = parse_tables(COMPARISON)
+    assert parser.tables == [{
+        "columns": ["Plan", "Monthly premium", "Deductible", "PCP copay"],
+        "rows": [["Aetna Value PPO", "$0", "$250", "$5"], ["Humana Gold Plus HMO", "$29", "$0", "$0"]],
+    }]
+    assert parser.markdown == ["\n".join(COMPARISON.splitlines()[2:6])]
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 5, 7, 16, 64])
+def test_fixed_size_chunks_match_whole_answer(size):
+    parser, events = stream(COMPARISON, chunked(COMPARISON, size))
+    assert parser.tables == parse_tables(COMPARISON).tables
+    assert [event["row"] for event in events] == parse_tables(COMPARISON).tables[0]["rows"]
+
+
+def test_every_two_piece_split_matches_whole_answer():
+    expected = parse_tables(TWO_TABLES)
+    for cut in range(len(TWO_TABLES) + 1):
+        parser, _ = stream(TWO_TABLES, [TWO_TABLES[:cut], TWO_TABLES[cut:]])
+        assert parser.tables == expected.tables, f"split at {cut}"
+        assert parser.markdown == expected.markdown, f"split at {cut}"
+
+
+def test_split_inside_separator_and_mid_cell():
+    separator = COMPARISON.index("|:-----|") + 4
+    mid_cell = COMPARISON.index("Humana Gold") + 4
+    pieces = [COMPARISON[:separator], COMPARISON[separator:mid_cell], COMPARISON[mid_cell:]]
+    assert pieces[0].endswith("|:--") and pieces[1].endswith("| Huma")
+    parser, events = stream(COMPARISON, pieces)
+    assert parser.tables == parse_tables(COMPARISON).tables
+    assert [event["row"][0] for event in events] == ["Aetna Value PPO", "Humana Gold Plus HMO"]
+
+
+def test_row_events_arrive_when_their_line_ends():
+    parser = MarkdownTableParser()
+    assert parser.feed("| Plan | Premium |\n|---|---|\n| Aetna Value PPO | $") == []
+    assert parser.feed("0 |") == []
+    assert parser.feed("\n") == [{"table_index": 0, "columns": ["Plan", "Premium"], "row": ["Aetna Value PPO", "$0"]}]
+
+
+def test_separator_with_different_cell_count_is_not_a_table():
+    text = (
+        "| Plan | Premium | Deductible |\n"
+        "|---|---|\n"
+        "| Aetna Value PPO | $0 | $250 |\n"
+    )
+    parser, events = stream(text, chunked(text, 4))
+    assert parser.tables == []
+    assert events == []
+
+
+def test_escaped_pipes_stay_inside_cells():
+    text = (
+        "| Plan | Specialist cost |\n"
+        "|---|---|\n"
+        "| Aetna Value PPO | $40 copay \\| 20% out of network |\n"
+        "| Humana Gold Plus HMO | $35 \\| referral required \\|\n"
+    )
+    parser, _ = stream(text, chunked(text, 3))
+    assert parser.tables[0]["rows"] == [
+        ["Aetna Value PPO", "$40 copay | 20% out of network"],
+        ["Humana Gold Plus HMO", "$35 | referral required |"],
+    ]
+
+
+def test_table_at_end_without_trailing_newline():
+    text = "Premiums:\n| Plan | Premium |\n|---|---|\n| Aetna Value PPO | $0 |\n| Humana Gold Plus HMO | $29 |"
+    parser = MarkdownTableParser()
+    events = parser.feed(text)
+    assert [event["row"][0] for event in events] == ["Aetna Value PPO"]
+    # The last row has no newline, so only close() completes it
+    assert [event["row"] for event in parser.close()] == [["Humana Gold Plus HMO", "$29"]]
+    assert parser.tables[0]["rows"][-1] == ["Humana Gold Plus HMO", "$29"]
+    assert parser.markdown == ["| Plan | Premium |\n|---|---|\n| Aetna Value PPO | $0 |\n| Humana Gold Plus HMO | $29 |"]
+
+
+def test_two_tables_in_one_answer():
+    parser, events = stream(TWO_TABLES, chunked(TWO_TABLES, 5))
+    assert [table["columns"] for table in parser.tables] == [["Plan", "Premium"], ["Plan", "Tier", "30-day copay"]]
+    assert parser.tables[1]["rows"] == [["Aetna Value PPO", "3", "$47"], ["Humana Gold Plus HMO", "3", "$45"]]
+    assert [event["table_index"] for event in events] == [0, 0, 1, 1]
+    assert len(parser.markdown) == 2
+
+
+def test_prose_with_pipes_is_not_a_table():
+    text = (
+        "You can pick PPO | HMO depending on whether you see specialists often.\n"
+        "Costs are shown as premium | deductible | copay in the plan summary.\n"
+        "Ask me about either plan.\n"
+    )
+    parser, events = stream(text, chunked(text, 6))
+    assert parser.tables == []
+    assert events == []
+
+
+def test_prose_with_pipe_before_a_table_does_not_become_its_header():
+    text = "Choose PPO | HMO:\n" + COMPARISON
+    parser = parse_tables(text)
+    assert len(parser.tables) == 1
+    assert parser.tables[0]["columns"][0] == "Plan"
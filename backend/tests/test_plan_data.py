@@ -0,0 +1,85 @@
+"""PlanDataStore lookups against a small hand-built snapshot."""
+import asyncio
+
+import pytest
+
+from planshopper_bot.services.plan_data import PlanDataConfig, PlanDataStore, PlanRows
+
+
+def _plan(plan_id, name, county, plan_type, premium):
+    return {
+        "plan_id": plan_id, "plan_year": 2026, "carrier": name.split()[0], "plan_type": plan_type, "name": name,
+        "state": "IL", "county": county, "monthly_premium": premium, "deductible": 0, "drug_deductible": 0,
+        "moop": 4900, "pcp_copay": 0, "specialist_copay": 40, "er_copay": 110, "urgent_care_copay": 40,
+        "inpatient_copay": 325, "coinsurance": 0.2, "star_rating": 4,
+    }
+
+
+def _rows():
+    rows = PlanRows()
+    rows.plans = [
+        _plan("H1000-001", "Aetna Value PPO", "Cook", "PPO", 0),
+        _plan("H1000-002", "Humana Gold Plus HMO", "Lake", "HMO", 29),
+        _plan("H1000-003", "Cigna Choice HMO", "Will", "HMO", 19),
+    ]
+    rows.formulary = [
+        {"plan_id": plan["plan_id"], "drug_name": "Eliquis", "tier": 3, "copay": 47, "coinsurance": None,
+         "prior_auth": False, "step_therapy": False, "quantity_limit": False}
+        for plan in rows.plans
+    ]
+    rows.providers = [
+        {"npi": "1000000001", "name": "Jane Smith, MD", "specialty": "Cardiology", "city": "Waukegan", "county": "Lake"},
+    ]
+    rows.provider_networks = [{"plan_id": "H1000-002", "npi": "1000000001"}]
+    return rows
+
+
+@pytest.fixture(scope="module")
+def store():
+    rows = _rows()
+
+    async def load():
+        return rows
+
+    store = PlanDataStore(load, PlanDataConfig(source="test"))
+    assert asyncio.run(store.refresh())
+    return store
+
+
+def _plan_ids(lookup):
+    text = "\n".join(filter(None, [lookup.answer, lookup.preamble, *lookup.facts]))
+    return {plan_id for plan_id in ("H1000-001", "H1000-002", "H1000-003") if plan_id in text}
+
+
+def test_scalar_county_filter(store):
+    lookup = store.lookup("which plans cover eliquis", {"county": "Cook"})
+    assert _plan_ids(lookup) == {"H1000-001"}
+
+
+def test_list_county_filter_matches_any_county(store):
+    lookup = store.lookup("which plans cover eliquis", {"county": ["Cook", "Lake"]})
+    assert _plan_ids(lookup) == {"H1000-001", "H1000-002"}
+    assert "Cook and Lake Counties" in "\n".join(filter(None, [lookup.answer, lookup.preamble, *lookup.facts]))
+
+
+def test_list_filters_combine(store):
+    lookup = store.lookup("which plans cover eliquis", {"county": ["Cook", "Lake", "Will"], "plan_type": ["HMO"]})
+    assert _plan_ids(lookup) == {"H1000-002", "H1000-003"}
+
+
+def test_list_county_filter_for_providers(store):
+    lookup = store.lookup("is Jane Smith in network", {"county": ["Lake", "Will"]})
+    assert lookup is not None and lookup.tool == "provider_network"
+
+
+def test_compare_in_listed_counties(store):
+    lookup = store.lookup("compare the HMO and PPO plans", {"county": ["Cook", "Lake"]})
+    assert lookup is not None and lookup.tool == "compare_costs"
+    assert _plan_ids(lookup) == {"H1000-001", "H1000-002"}
+
+
+def test_utilization_sets_the_compared_profile(store):
+    filters = {"county": ["Cook", "Lake"]}
+    usual = store.lookup("compare the HMO and PPO plans", filters)
+    heavy = store.lookup("compare the HMO and PPO plans", filters, utilization={"specialist_visits": 24})
+    assert heavy.preamble != usual.preamble
@@ -8,6 +8,8 @@ const ChatPanel = ({ isOpen, onClose }) => {
   ]);
   const [inputValue, setInputValue] = useState('');
   const [isLoading, setIsLoading] = useState(false);
+  // One random id per conversation; the server keeps history per id, so it must not be shared
+  const [sessionId] = useState(() => crypto.randomUUID());
   const messagesEndRef = useRef(null);
 
   const faqChips = [
@@ -37,7 +39,7 @@ const ChatPanel = ({ isOpen, onClose }) => {
     setMessages(prev => [...prev, assistantMessage]);
 
     try {
-      await chatApi.sendMessageStream(text.trim(), 'default-session', (chunk) => {
+      await chatApi.sendMessageStream(text.trim(), sessionId, (chunk) => {
         setMessages(prev => 
           prev.map(msg => 
             msg.id === assistantId 
@@ -1,7 +1,7 @@
 const API_BASE_URL = 'http://localhost:8000';
 
 export const chatApi = {
-  async sendMessage(message, sessionId = 'default-session') {
+  async sendMessage(message, sessionId) {
     try {
       const response = await fetch(`${API_BASE_URL}/api/chat`, {
         method: 'POST',
@@ -26,7 +26,7 @@ export const chatApi = {
     }
   },
 
-  async sendMessageStream(message, sessionId = 'default-session', onChunk) {
+  async sendMessageStream(message, sessionId, onChunk) {
     try {
       const response = await fetch(`${API_BASE_URL}/api/chat/stream`, {
         method: 'POST',
@@ -45,13 +45,16 @@ export const chatApi = {
 
       const reader = response.body.getReader();
       const decoder = new TextDecoder();
+      let buffer = '';
 
       while (true) {
         const { done, value } = await reader.read();
         if (done) break;
 
-        const chunk = decoder.decode(value);
-        const lines = chunk.split('\n');
+        // Frames can be split across reads; keep the trailing partial line for the next one
+        buffer += decoder.decode(value, { stream: true });
+        const lines = buffer.split('\n');
+        buffer = lines.pop();
 
         for (const line of lines) {
           if (line.startsWith('data: ')) {